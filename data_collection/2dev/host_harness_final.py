@@ -9,6 +9,13 @@ import os
 import csv 
 import sys
 import time
+
+# Shared featurisation (token counts, FEATURE_VERSION) lives with the orchestrators
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'networking', 'src'))
+from features import FEATURE_VERSION, count_tokens
+# Readings shared by the three harnesses
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from device_state import get_battery_state
 import random
 
 # Constants
@@ -207,7 +214,8 @@ def main():
     try:
         with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
-            writer.writerow(['cpu_load', 'ram_load', 'ram_kb', 'tokens', 'prompt_length', 'ttft_sec', 'stream_speed_tps'])
+            writer.writerow(['cpu_load', 'ram_load', 'ram_kb', 'tokens', 'prompt_length', 'ttft_sec', 'stream_speed_tps',
+                             'prompt_tokens', 'battery', 'temp_c', 'feature_version'])
         print(f"Initialized CSV file: {OUTPUT_FILE}")
     except Exception as e:
         print(f"Error creating CSV file: {e}")
@@ -253,9 +261,12 @@ def main():
                     # Collect metrics
                     print("Collecting device metrics...")
                     ram_kb = get_ram_available_kb(DEVICE_ID)
+                    battery, temp_c = get_battery_state(DEVICE_ID)
+                    prompt_tokens = count_tokens(prompt)
 
                     print(f"RAM Available: {ram_kb:,} KB")
-                    print(f"Prompt Length: {len(prompt)} chars")
+                    print(f"Battery: {battery}% at {temp_c} C")
+                    print(f"Prompt Length: {len(prompt)} chars, {prompt_tokens} tokens")
 
                     # Run SLM
                     print("Running SLM...")
@@ -264,7 +275,8 @@ def main():
                     # Log results
                     with open(OUTPUT_FILE, 'a', newline='', encoding='utf-8') as f:
                         writer = csv.writer(f)
-                        writer.writerow([n1, n2, ram_kb, toks, len(prompt), ttft, speed])
+                        writer.writerow([n1, n2, ram_kb, toks, len(prompt), ttft, speed,
+                                         prompt_tokens, battery, temp_c, FEATURE_VERSION])
                     print(f"Logged: CPU={n1}, RAM={n2}, Tokens={toks}, TTFT={ttft:.2f}, Speed={speed:.2f}")
 
             finally:
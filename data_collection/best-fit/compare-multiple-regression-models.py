@@ -2,7 +2,13 @@ from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.svm import SVR
 from sklearn.metrics import r2_score, mean_squared_error
+from sklearn.preprocessing import PolynomialFeatures
 import pandas as pd
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'networking', 'src'))
+from features import FEATURE_NAMES, FEATURE_VERSION, featurise
 
 df = pd.read_csv('ttft-final.csv')
 X = df[['cpu_load', 'ram_load', 'prompt_length']]
@@ -13,18 +19,33 @@ models = {
     'Polynomial (deg 2)': LinearRegression(),
     'Random Forest': RandomForestRegressor(n_estimators=100, random_state=42),
     'Gradient Boosting': GradientBoostingRegressor(random_state=42),
-    'SVR': SVR(kernel='rbf')
+    'SVR': SVR(kernel='rbf'),
+    f'Feature pipeline v{FEATURE_VERSION}': LinearRegression(fit_intercept=False)
 }
 
 # For polynomial
 poly = PolynomialFeatures(degree=2, include_bias=False)
 X_poly = poly.fit_transform(X)
 
+# The featuriser the online scorer uses (it carries its own bias column).
+# Inputs this CSV does not record (battery, temperature, NPU state) come out
+# constant and would only duplicate the bias, so they are left out of the fit
+X_feat = featurise(df.to_dict('records'))
+names = FEATURE_NAMES[FEATURE_VERSION]
+keep = [i for i, name in enumerate(names) if name == 'bias' or X_feat[:, i].std() > 0]
+dropped = [name for i, name in enumerate(names) if i not in keep]
+if dropped:
+    print(f"Feature pipeline v{FEATURE_VERSION}: no data in this CSV for {', '.join(dropped)}")
+X_feat = X_feat[:, keep]
+
 results = {}
 for name, model in models.items():
     if name == 'Polynomial (deg 2)':
         model.fit(X_poly, y)
         y_pred = model.predict(X_poly)
+    elif name.startswith('Feature pipeline'):
+        model.fit(X_feat, y)
+        y_pred = model.predict(X_feat)
     else:
         model.fit(X, y)
         y_pred = model.predict(X)
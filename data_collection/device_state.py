@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Device readings shared by the per-setup host harnesses (1dev, 2dev, 3dev)
+Each value is -1 when adb cannot read it; features.py treats -1 as missing.
+"""
+
+import re
+import subprocess
+
+
+def get_battery_state(device):
+    """Get (battery level %, battery temperature in C) from the Android device; -1 when unknown."""
+    try:
+        result = subprocess.run(f'adb -s {device} shell dumpsys battery',
+                                shell=True, capture_output=True, text=True, timeout=10)
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Could not read battery state: {e}")
+        return -1, -1
+    level = re.search(r'level:\s*(\d+)', result.stdout)
+    temp = re.search(r'temperature:\s*(\d+)', result.stdout)
+    # dumpsys reports temperature in tenths of a degree
+    return (int(level.group(1)) if level else -1, int(temp.group(1)) / 10.0 if temp else -1)
@@ -39,7 +39,9 @@ if [ $? -eq 0 ]; then
     echo "1. Make sure ADB is connected: adb devices"
     echo "2. Push the agent: adb push agent /data/local/tmp/"
     echo "3. Make executable: adb shell chmod +x /data/local/tmp/agent"  
-    echo "4. Run agent: adb shell '/data/local/tmp/agent A <LAPTOP_IP> 8080'"
+    echo "4. Push the batch postprocessor (needs python3 and numpy on the device; the agent falls back to ./postprocess):"
+    echo "   adb push ../src/snpe_postprocess.py /data/local/tmp/snpe-bundle/"
+    echo "5. Run agent: adb shell '/data/local/tmp/agent A <LAPTOP_IP> 8080'"
     echo ""
     echo "Replace <LAPTOP_IP> with your laptop's IP address."
     echo "Use 'A' for device A (has NPU), 'B' for device B (no NPU)"
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+
+"""
+End-to-end load generator for the hub orchestrator
+Opens many fake-device connections that register, report status and answer
+bid requests with configurable delays, injects images at a target rate and
+reports throughput, auction/end-to-end latency percentiles and the
+orchestrator's CPU and RSS. Results can be stored as a baseline and compared
+on later runs to catch regressions in networking/src/orchestrator.py.
+
+Run from networking directory:
+    python3 hubspoke/load_generator.py --spawn --devices 20 --rate 5 --duration 30 --save-baseline bench.json
+    python3 hubspoke/load_generator.py --spawn --devices 20 --rate 5 --duration 30 --baseline bench.json
+"""
+
+import argparse
+import base64
+import heapq
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from latency import LatencyHistogram
+
+# Every injected image starts with this fixed-size header so the task a device
+# receives can be matched to its injection time; 12 bytes encode to 16 base64 chars
+HEADER_FORMAT = "lg:{:09d}"
+HEADER_B64_LEN = 16
+
+
+class Scheduler:
+    """Single thread running delayed callbacks, instead of one Timer thread per bid"""
+
+    def __init__(self):
+        self.events = []
+        self.seq = 0
+        self.cond = threading.Condition()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def call_later(self, delay, fn, *args):
+        with self.cond:
+            self.seq += 1
+            heapq.heappush(self.events, (time.monotonic() + delay, self.seq, fn, args))
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.events or self.events[0][0] > time.monotonic():
+                    self.cond.wait(self.events[0][0] - time.monotonic() if self.events else None)
+                _, _, fn, args = heapq.heappop(self.events)
+            try:
+                fn(*args)
+            except OSError:
+                pass  # Connection went away mid-run; the device thread reports it
+
+
+class FakeDevice:
+    def __init__(self, bench, device_id, host, port, has_npu, capabilities):
+        self.bench = bench
+        self.device_id = device_id
+        self.has_npu = has_npu
+        self.capabilities = capabilities
+        self.cpu_load = random.uniform(0.05, 0.7)
+        self.status_seq = 0
+        self.send_lock = threading.Lock()
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send(self, msg_type, task_id="", subtask="", data=None):
+        payload = json.dumps({"type": msg_type, "agent_id": self.device_id, "task_id": task_id,
+                              "subtask": subtask, "data": data or {}}).encode()
+        with self.send_lock:
+            self.sock.sendall(payload)
+
+    def metrics(self):
+        return {"cpu_load": self.cpu_load, "battery": 80,
+                "ram": {"used_mb": 3000, "total_mb": 8000, "usage_percent": random.uniform(30, 60)}}
+
+    def register(self):
+        self.send("register", data={"deviceId": self.device_id, "hasNpu": self.has_npu,
+                                    "capabilities": self.capabilities, "metrics": self.metrics()})
+
+    def send_status(self):
+        self.status_seq += 1
+        self.send("status", data={"seq": self.status_seq, "metrics": self.metrics()})
+
+    def read_loop(self):
+        buffer = ""
+        decoder = json.JSONDecoder()
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            buffer += data.decode(errors="ignore")
+            while buffer:
+                try:
+                    msg, idx = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    break
+                buffer = buffer[idx:].lstrip()
+                self.handle(msg)
+
+    def handle(self, msg):
+        bench = self.bench
+        if msg.get("type") == "bid_request":
+            bench.count("bid_requests")
+            bench.scheduler.call_later(bench.bid_delay(), self.send, "bid", msg["task_id"], msg.get("subtask", ""),
+                                       dict(self.metrics(), has_npu=self.has_npu))
+        elif msg.get("type") == "task":
+            injected = bench.task_received(msg["data"].get("image_base64", ""))
+            bench.scheduler.call_later(bench.exec_delay(), self.finish_task, msg["task_id"], msg.get("subtask", ""), injected)
+
+    def finish_task(self, task_id, subtask, injected):
+        self.send("result", task_id, subtask, {"status": "classification_complete", "classification": "benchmark"})
+        if injected is not None:
+            self.bench.result_sent(injected)
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.scheduler = Scheduler()
+        self.lock = threading.Lock()
+        self.injected_at = {}  # {seq: monotonic time the image was sent}
+        self.counts = {"injected": 0, "tasks": 0, "results": 0, "bid_requests": 0, "unmatched": 0}
+        self.auction = LatencyHistogram()
+        self.e2e = LatencyHistogram()
+        self.last_result = None
+        filler = os.urandom(max(args.image_bytes - 12, 0))
+        self.filler_b64 = base64.b64encode(filler).decode()
+
+    def bid_delay(self):
+        return random.uniform(self.args.bid_delay_min, self.args.bid_delay_max) / 1000.0
+
+    def exec_delay(self):
+        return random.uniform(self.args.exec_delay_min, self.args.exec_delay_max) / 1000.0
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def task_received(self, image_base64):
+        """A device won an image; returns its injection time (None if it isn't ours)"""
+        try:
+            seq = int(base64.b64decode(image_base64[:HEADER_B64_LEN]).decode().split(":")[1])
+        except (ValueError, IndexError, UnicodeDecodeError):
+            self.count("unmatched")
+            return None
+        now = time.monotonic()
+        with self.lock:
+            injected = self.injected_at.get(seq)
+            self.counts["tasks"] += 1
+            if injected is not None:
+                self.auction.record(now - injected)
+        return injected
+
+    def result_sent(self, injected):
+        with self.lock:
+            self.counts["results"] += 1
+            self.last_result = time.monotonic()
+            self.e2e.record(self.last_result - injected)
+
+    def run(self):
+        args = self.args
+        devices = []
+        for i in range(args.devices):
+            device = FakeDevice(self, f"lg-{i:03d}", args.host, args.port, i < args.devices * args.npu_fraction, ["classify"])
+            device.register()
+            threading.Thread(target=device.read_loop, daemon=True).start()
+            devices.append(device)
+        # Dedicated image source; registers without capabilities so it never bids
+        source = FakeDevice(self, "lg-source", args.host, args.port, False, [])
+        source.register()
+        threading.Thread(target=source.read_loop, daemon=True).start()
+        time.sleep(args.warmup)
+
+        monitor = ProcessMonitor(args.pid) if args.pid else None
+        start = time.monotonic()
+        next_status = start
+        seq = 0
+        while True:
+            now = time.monotonic()
+            if now - start >= args.duration:
+                break
+            # Open loop: image i goes out at start + i / rate regardless of how the orchestrator keeps up
+            due = start + seq / args.rate
+            if now >= due:
+                header = base64.b64encode(HEADER_FORMAT.format(seq).encode()).decode()
+                with self.lock:
+                    self.injected_at[seq] = time.monotonic()
+                    self.counts["injected"] += 1
+                source.send("image", data={"image_base64": header + self.filler_b64})
+                seq += 1
+            if now >= next_status:
+                for device in devices:
+                    device.send_status()
+                next_status = now + args.status_interval
+            if monitor:
+                monitor.sample()
+            time.sleep(max(0.0, min(due, next_status) - time.monotonic(), 0.0005))
+        sent_phase = time.monotonic() - start
+
+        # Let in-flight auctions (bid window + execution) finish
+        time.sleep(args.drain)
+        resources = monitor.report() if monitor else {}
+        for device in devices + [source]:
+            device.sock.close()
+        return self.report(start, sent_phase, resources)
+
+    def report(self, start, sent_phase, resources):
+        with self.lock:
+            # Throughput over the span that produced results, so the drain wait doesn't dilute it
+            elapsed = (self.last_result - start) if self.last_result else 0.0
+            counts = dict(self.counts)
+            auction = self.auction.summary()
+            e2e = self.e2e.summary()
+        return {
+            "config": {k: v for k, v in vars(self.args).items() if k not in ("baseline", "save_baseline", "pid")},
+            "counts": counts,
+            "offered_rate": counts["injected"] / sent_phase if sent_phase else 0.0,
+            "throughput": counts["results"] / elapsed if elapsed else 0.0,
+            "completion_ratio": counts["results"] / counts["injected"] if counts["injected"] else 0.0,
+            "auction_latency": auction,
+            "e2e_latency": e2e,
+            "orchestrator": resources,
+        }
+
+
+class ProcessMonitor:
+    """CPU time and RSS of the orchestrator process from /proc"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.clk_tck = os.sysconf("SC_CLK_TCK")
+        self.start_wall = time.monotonic()
+        self.start_cpu = self.cpu_seconds()
+        self.peak_rss_kb = 0
+        self.last_sample = 0.0
+
+    def cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.clk_tck  # utime + stime
+
+    def rss_kb(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+        return 0
+
+    def sample(self):
+        now = time.monotonic()
+        if now - self.last_sample >= 0.5:
+            self.last_sample = now
+            self.peak_rss_kb = max(self.peak_rss_kb, self.rss_kb())
+
+    def report(self):
+        self.peak_rss_kb = max(self.peak_rss_kb, self.rss_kb())
+        wall = time.monotonic() - self.start_wall
+        cpu = self.cpu_seconds() - self.start_cpu
+        return {"cpu_seconds": cpu, "cpu_percent": 100.0 * cpu / wall if wall else 0.0, "peak_rss_mb": self.peak_rss_kb / 1024.0}
+
+
+# (metric path, higher_is_worse) checked against the baseline
+REGRESSION_CHECKS = [
+    (("throughput",), False),
+    (("completion_ratio",), False),
+    (("auction_latency", "p50"), True),
+    (("auction_latency", "p95"), True),
+    (("e2e_latency", "p95"), True),
+    (("e2e_latency", "p99"), True),
+    (("orchestrator", "cpu_percent"), True),
+    (("orchestrator", "peak_rss_mb"), True),
+]
+
+
+def compare(result, baseline, tolerance):
+    """List of regression messages; empty when every metric is within tolerance of the baseline"""
+    regressions = []
+    for path, higher_is_worse in REGRESSION_CHECKS:
+        current, reference = result, baseline
+        for key in path:
+            current = current.get(key, {}) if isinstance(current, dict) else None
+            reference = reference.get(key, {}) if isinstance(reference, dict) else None
+        if not isinstance(current, (int, float)) or not isinstance(reference, (int, float)) or reference == 0:
+            continue
+        change = (current - reference) / abs(reference)
+        worse = change > tolerance if higher_is_worse else change < -tolerance
+        name = ".".join(path)
+        print(f"  {name:<28} {reference:>12.4f} -> {current:>12.4f} ({change*100:+6.1f}%){'  ✗ REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(f"{name} {change*100:+.1f}%")
+    return regressions
+
+
+def print_report(result):
+    counts = result["counts"]
+    print(f"\n{'='*80}")
+    print("📈 LOAD TEST RESULTS")
+    print(f"{'='*80}")
+    print(f"Injected: {counts['injected']}  tasks delivered: {counts['tasks']}  results: {counts['results']}  "
+          f"(completion {result['completion_ratio']*100:.1f}%)")
+    print(f"Offered rate: {result['offered_rate']:.2f} img/s  throughput: {result['throughput']:.2f} results/s")
+    for name in ("auction_latency", "e2e_latency"):
+        s = result[name]
+        print(f"{name:<16} p50 {s['p50']*1000:8.1f} ms  p95 {s['p95']*1000:8.1f} ms  p99 {s['p99']*1000:8.1f} ms  max {s['max']*1000:8.1f} ms")
+    if result["orchestrator"]:
+        o = result["orchestrator"]
+        print(f"Orchestrator CPU: {o['cpu_seconds']:.2f}s ({o['cpu_percent']:.1f}%)  peak RSS: {o['peak_rss_mb']:.1f} MB")
+
+
+def spawn_orchestrator(args):
+    """Start networking/src/orchestrator.py on args.port in a scratch directory"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'orchestrator.py')
+    workdir = tempfile.mkdtemp(prefix="loadgen_")
+    proc = subprocess.Popen([sys.executable, script, "--port", str(args.port), "--bid-window", str(args.bid_window),
+                             "--metrics-port", "0"], cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((args.host, args.port), timeout=0.5).close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("orchestrator did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the hub orchestrator with fake devices")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--spawn", action="store_true", help="Start a local orchestrator for the run")
+    parser.add_argument("--pid", type=int, help="Orchestrator PID to measure CPU/RSS (set automatically with --spawn)")
+    parser.add_argument("--bid-window", type=float, default=0.5, help="Bid window for a spawned orchestrator")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--npu-fraction", type=float, default=0.3)
+    parser.add_argument("--rate", type=float, default=2.0, help="Images injected per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of injection")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--drain", type=float, default=3.0, help="Seconds to wait for in-flight tasks")
+    parser.add_argument("--image-bytes", type=int, default=100000)
+    parser.add_argument("--bid-delay-min", type=float, default=5.0, help="ms")
+    parser.add_argument("--bid-delay-max", type=float, default=50.0, help="ms")
+    parser.add_argument("--exec-delay-min", type=float, default=50.0, help="ms")
+    parser.add_argument("--exec-delay-max", type=float, default=200.0, help="ms")
+    parser.add_argument("--status-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", help="Write the result JSON here")
+    parser.add_argument("--baseline", help="Compare against a stored result; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change before a regression")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    proc = None
+    if args.spawn:
+        proc = spawn_orchestrator(args)
+        args.pid = proc.pid
+    try:
+        result = LoadGenerator(args).run()
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=5)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparing against {args.baseline} (tolerance {args.tolerance*100:.0f}%)")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"✗ {len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+        print("✓ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,15 @@
 
 """
 Simple orchestrator runner for Checkpoint 2
-Run from networking directory: python3 run_orchestrator.py
+Run from networking directory: python3 hubspoke/run_orchestrator.py
 """
 
 import sys
 import os
+import time
 
-# Add src directory to Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+# Add networking/src to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
 
 from orchestrator import Orchestrator
 
@@ -26,7 +27,6 @@ def main():
         
         # Keep running
         while True:
-            import time
             time.sleep(1)
             
     except KeyboardInterrupt:
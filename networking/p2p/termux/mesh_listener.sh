@@ -153,6 +153,35 @@ get_has_npu() {
     fi
 }
 
+# Control characters JSON needs as \u00XX (all but \t \n \r, which get short escapes)
+JSON_CTRL=$(printf '\001\002\003\004\005\006\007\010\013\014\016\017\020\021\022\023\024\025\026\027\030\031\032\033\034\035\036\037')
+CR=$(printf '\r')
+NL='
+'
+
+# Escape a string for a JSON string value; a stray \r or control character
+# would otherwise make the whole chunk unparseable on the hub
+json_escape() {
+    local s="$1" i=0 c
+    s="${s//\\/\\\\}"
+    s="${s//\"/\\\"}"
+    s="${s//$NL/\\n}"
+    s="${s//	/\\t}"
+    s="${s//$CR/\\r}"
+    case "$s" in
+        *[$JSON_CTRL]*)
+            while [ $i -lt ${#JSON_CTRL} ]; do
+                c="${JSON_CTRL:$i:1}"
+                case "$s" in
+                    *"$c"*) s="${s//$c/\\u00$(printf '%02x' "'$c")}" ;;
+                esac
+                i=$((i + 1))
+            done
+            ;;
+    esac
+    printf '%s' "$s"
+}
+
 # Message handlers
 handle_text_message() {
     local from_device="$1"
@@ -221,10 +250,19 @@ handle_task() {
         local prompt_file="$OUTPUT_DIR/prompt_${task_id}.txt"
         echo "$prompt" > "$prompt_file"
         
-        # Run SLM
+        # Run SLM, forwarding each line of output as a RESULT_CHUNK while it is generated;
+        # the orchestrator shows them in seq order and the RESULT below still ends the task
         local output_file="$OUTPUT_DIR/output_${task_id}.txt"
-        "$SLM_SCRIPT" "$prompt_file" > "$output_file" 2>&1
-        local exit_code=$?
+        { "$SLM_SCRIPT" "$prompt_file" 2>&1; echo $? > "$output_file.rc"; } | tee "$output_file" | {
+            seq=0
+            while IFS= read -r line; do
+                seq=$((seq + 1))
+                send_to_peer_by_id "$from_device" \
+                    "RESULT_CHUNK|$DEVICE_ID|{\"task_id\": \"$task_id\", \"seq\": $seq, \"text\": \"$(json_escape "$line")\"}" > /dev/null
+            done
+        }
+        local exit_code=$(cat "$output_file.rc" 2>/dev/null || echo 1)
+        rm -f "$output_file.rc"
         
         # Read result
         local result=$(cat "$output_file" 2>/dev/null || echo "Error: No output")
@@ -259,6 +297,14 @@ handle_result() {
     echo "$payload" > "$MESH_DIR/result_${task_id}.json"
 }
 
+handle_result_chunk() {
+    local payload="$1"
+    
+    # One JSON line per chunk, appended as they arrive; P2POrchestrator.wait_for_result follows the file
+    local task_id=$(echo "$payload" | grep -o '"task_id"[[:space:]]*:[[:space:]]*"[^"]*"' | cut -d'"' -f4)
+    printf '%s\n' "$payload" >> "$MESH_DIR/stream_${task_id}.jsonl"
+}
+
 handle_slm_prompt() {
     local from_device="$1"
     local prompt="$2"
@@ -402,6 +448,9 @@ handle_message() {
         RESULT)
             handle_result "$from_device" "$payload"
             ;;
+        RESULT_CHUNK)
+            handle_result_chunk "$payload"
+            ;;
         SLM_PROMPT)
             handle_slm_prompt "$from_device" "$payload"
             ;;
@@ -3,6 +3,9 @@
 #include <iostream>
 #include <unistd.h>
 #include <arpa/inet.h>
+#include <netinet/in.h>
+#include <netinet/tcp.h>
+#include <sys/socket.h>
 #include <android/log.h>
 #include <fstream>
 #include <numeric>
@@ -12,14 +15,26 @@
 #include <sys/statvfs.h>
 #include <dirent.h>
 #include <sys/stat.h>
+#include <cmath>
 
 #define LOG_TAG "DeviceClient"
 #define LOGI(...) __android_log_print(ANDROID_LOG_INFO, LOG_TAG, __VA_ARGS__)
 #define LOGE(...) __android_log_print(ANDROID_LOG_ERROR, LOG_TAG, __VA_ARGS__)
 
+// Delta status stream: report every STATUS_INTERVAL_MS, but only send fields that
+// moved past their threshold; a full keyframe goes out every KEYFRAME_INTERVAL ticks
+// (heartbeats included, so a quiet device still resyncs every ~30s)
+#define STATUS_INTERVAL_MS 1000
+#define KEYFRAME_INTERVAL 30
+
+// TCP keepalive, so a hub that vanished is noticed in ~25s instead of hours
+#define KEEPALIVE_IDLE_S 10
+#define KEEPALIVE_INTERVAL_S 5
+#define KEEPALIVE_COUNT 3
+
 // Constructor implementation
 DeviceClient::DeviceClient(const std::string& ip, int port, const std::string& id)
-    : orchestrator_ip(ip), port(port), agent_id(id), has_npu(true), sock(-1) {
+    : orchestrator_ip(ip), port(port), home_ip(ip), home_port(port), agent_id(id), has_npu(true), sock(-1) {
     // Only initialize members here. Do not connect or start threads in constructor.
 }
 // Destructor implementation
@@ -44,13 +59,20 @@ bool DeviceClient::connect() {
         inet_pton(AF_INET, orchestrator_ip.c_str(), &addr.sin_addr);
         if (::connect(sock, (sockaddr*)&addr, sizeof(addr)) == 0) {
             LOGI("Connected to orchestrator");
+            int on = 1, idle = KEEPALIVE_IDLE_S, interval = KEEPALIVE_INTERVAL_S, count = KEEPALIVE_COUNT;
+            setsockopt(sock, SOL_SOCKET, SO_KEEPALIVE, &on, sizeof(on));
+            setsockopt(sock, IPPROTO_TCP, TCP_KEEPIDLE, &idle, sizeof(idle));
+            setsockopt(sock, IPPROTO_TCP, TCP_KEEPINTVL, &interval, sizeof(interval));
+            setsockopt(sock, IPPROTO_TCP, TCP_KEEPCNT, &count, sizeof(count));
             // Send registration with comprehensive metrics
-            json metrics = {
-                {"battery", get_battery_level()},
-                {"cpu_load", get_cpu_load()},
-                {"ram", get_ram_usage()},
-                {"storage", get_storage_info()}
-            };
+            json metrics = collect_metrics();
+            {
+                std::lock_guard<std::mutex> lock(status_mutex);
+                last_sent_metrics = metrics;
+                status_seq = 0;
+                ticks_since_keyframe = 0;
+                keyframe_requested = false;
+            }
             json capabilities = {
                 {"deviceId", agent_id},
                 {"hasNpu", has_npu},
@@ -58,8 +80,12 @@ bool DeviceClient::connect() {
                 {"metrics", metrics}
             };
             send_message(Message{"register", agent_id, "", "", capabilities});
-            std::thread([this] { send_status(); }).detach();
-            std::thread([this] { listen(); }).detach();
+            // listen() reconnects through here (after a drop or a redirect) and keeps reading the new socket
+            if (!threads_started) {
+                threads_started = true;
+                std::thread([this] { status_loop(); }).detach();
+                std::thread([this] { listen(); }).detach();
+            }
             return true;
         } else {
             close(sock);
@@ -98,7 +124,13 @@ void DeviceClient::listen() {
         if (len <= 0) {
             LOGE("Connection lost, reconnecting...");
             close(sock);
-            if (!connect()) break;
+            if (!connect()) {
+                if (orchestrator_ip == home_ip && port == home_port) break;
+                // The shard we were redirected to is gone; the one we started with knows the new owner
+                orchestrator_ip = home_ip;
+                port = home_port;
+                if (!connect()) break;
+            }
             continue;
         }
         buffer[len] = '\0';
@@ -175,20 +207,89 @@ void DeviceClient::listen() {
 void DeviceClient::send_message(const Message& msg) {
     json j = {{"type", msg.type}, {"agent_id", msg.agent_id}, {"task_id", msg.task_id}, {"subtask", msg.subtask}, {"data", msg.data}};
     std::string data = j.dump();
+    std::lock_guard<std::mutex> lock(send_mutex);
     send(sock, data.c_str(), data.size(), 0);
 }
 
+json DeviceClient::collect_metrics() {
+    return json{
+        {"battery", get_battery_level()},
+        {"cpu_load", get_cpu_load()},
+        {"ram", get_ram_usage()},
+        {"storage", get_storage_info()}
+    };
+}
+
+// Send a single status report right away (used after finishing a task)
 void DeviceClient::send_status() {
+    send_status_update(true);
+}
+
+void DeviceClient::status_loop() {
     while (true) {
-        json metrics = {
-            {"battery", get_battery_level()},
-            {"cpu_load", get_cpu_load()},
-            {"ram", get_ram_usage()},
-            {"storage", get_storage_info()}
-        };
-        send_message(Message{"status", agent_id, "", "", {{"metrics", metrics}}});
-        std::this_thread::sleep_for(std::chrono::seconds(30));
+        std::this_thread::sleep_for(std::chrono::milliseconds(STATUS_INTERVAL_MS));
+        send_status_update(false);
+    }
+}
+
+void DeviceClient::send_status_update(bool force_keyframe) {
+    json metrics = collect_metrics();
+    std::lock_guard<std::mutex> lock(status_mutex);
+
+    bool keyframe = force_keyframe || keyframe_requested ||
+                    ++ticks_since_keyframe >= KEYFRAME_INTERVAL;
+    if (keyframe) {
+        status_seq++;
+        ticks_since_keyframe = 0;
+        last_sent_metrics = metrics;
+        keyframe_requested = false;
+        send_message(Message{"status", agent_id, "", "", {{"seq", status_seq}, {"metrics", metrics}}});
+        return;
+    }
+
+    json delta = diff_metrics(last_sent_metrics, metrics);
+    if (delta.empty()) {
+        // Nothing moved past its threshold; a heartbeat keeps the hub's failure detector fed
+        send_message(Message{"heartbeat", agent_id, "", "", {{"seq", status_seq}}});
+        return;
+    }
+
+    status_seq++;
+    last_sent_metrics.merge_patch(delta);
+    send_message(Message{"status_delta", agent_id, "", "", {{"seq", status_seq}, {"delta", delta}}});
+}
+
+// Return the fields of cur that differ from prev by more than their threshold.
+// Nested objects (ram, storage) are diffed field by field.
+json DeviceClient::diff_metrics(const json& prev, const json& cur) {
+    static const json thresholds = {
+        {"cpu_load", 0.05},
+        {"battery", 1},
+        {"usage_percent", 1.0},
+        {"used_mb", 64},
+        {"available_mb", 64},
+        {"free_gb", 0.1},
+        {"used_gb", 0.1}
+    };
+
+    json delta = json::object();
+    for (auto it = cur.begin(); it != cur.end(); ++it) {
+        const std::string& key = it.key();
+        if (!prev.contains(key)) {
+            delta[key] = it.value();
+        } else if (it->is_object()) {
+            json nested = diff_metrics(prev[key], it.value());
+            if (!nested.empty()) delta[key] = nested;
+        } else if (it->is_number() && prev[key].is_number()) {
+            double threshold = thresholds.value(key, 0.0);
+            if (std::fabs(it->get<double>() - prev[key].get<double>()) > threshold) {
+                delta[key] = it.value();
+            }
+        } else if (prev[key] != it.value()) {
+            delta[key] = it.value();
+        }
     }
+    return delta;
 }
 
 float DeviceClient::get_cpu_load() {
@@ -284,6 +385,20 @@ void DeviceClient::handle_message(const Message& msg) {
         handle_bid_request(msg);
     } else if (msg.type == "task") {
         handle_task(msg);
+    } else if (msg.type == "status_request") {
+        // Orchestrator lost track of our deltas; resync with a keyframe
+        std::lock_guard<std::mutex> lock(status_mutex);
+        keyframe_requested = true;
+    } else if (msg.type == "redirect") {
+        // Another orchestrator shard owns this device; closing the socket makes listen() reconnect there
+        std::string host = msg.data.value("host", "");
+        int new_port = msg.data.value("port", 0);
+        if (!host.empty() && new_port > 0) {
+            LOGI("Redirected to shard %s at %s:%d", msg.data.value("shard", "").c_str(), host.c_str(), new_port);
+            orchestrator_ip = host;
+            port = new_port;
+            shutdown(sock, SHUT_RDWR);
+        }
     }
 }
 
@@ -297,18 +412,55 @@ void DeviceClient::handle_bid_request(const Message& msg) {
         {"ram", get_ram_usage()},
         {"storage", get_storage_info()},
         {"has_npu", has_npu},
+        {"backend", "cpu"},  // snpe-net-run is started without --use_dsp, so inference runs on the CPU runtime
         {"timestamp", std::chrono::duration_cast<std::chrono::seconds>(
             std::chrono::system_clock::now().time_since_epoch()).count()}
     };
+    {
+        // The hub scores this against the decode + exec time we report with the result;
+        // until the first task there is nothing to predict from
+        std::lock_guard<std::mutex> lock(service_mutex);
+        if (service_count > 0) {
+            bid_data["predicted_latency"] = service_mean;
+            bid_data["uncertainty"] = std::sqrt(service_var);
+        }
+    }
     
     send_message(Message{"bid", agent_id, msg.task_id, msg.subtask, bid_data});
     LOGI("Sent bid for task %s with CPU load %.2f", msg.task_id.c_str(), get_cpu_load());
 }
 
+void DeviceClient::record_service_time(const json& timing) {
+    double seconds = 0.0;
+    for (const char* key : {"decode_ms", "exec_ms"}) {
+        if (timing.contains(key) && timing[key].is_number()) {
+            seconds += timing[key].get<double>() / 1000.0;
+        }
+    }
+    std::lock_guard<std::mutex> lock(service_mutex);
+    if (service_count++ == 0) {
+        service_mean = seconds;
+        service_var = 0.0;
+        return;
+    }
+    const double alpha = 0.2;  // Weight of the newest task; about the last ten tasks count
+    double diff = seconds - service_mean;
+    service_mean += alpha * diff;
+    service_var = (1.0 - alpha) * (service_var + alpha * diff * diff);
+}
+
 void DeviceClient::handle_task(const Message& msg) {
     LOGI("Received task %s, subtask: %s", msg.task_id.c_str(), msg.subtask.c_str());
     
-    if (msg.subtask == "classify" && msg.data.contains("image_base64")) {
+    if (msg.subtask == "story_chunk") {
+        handle_story_chunk(msg);
+    } else if (msg.subtask == "generate_story") {
+        handle_story_generation_task(msg);
+    } else if (msg.subtask == "classify_batch" && msg.data.contains("items")) {
+        handle_batch_classification_task(msg);
+    } else if (msg.subtask == "classify" && msg.data.contains("tensor_base64")) {
+        handle_tensor_classification_task(msg);
+    } else if (msg.subtask == "classify" && msg.data.contains("image_base64")) {
         handle_image_classification_task(msg);
     } else {
         // Placeholder for other tasks
@@ -320,6 +472,10 @@ void DeviceClient::handle_task(const Message& msg) {
 
 void DeviceClient::handle_image_classification_task(const Message& msg) {
     try {
+        // Stage durations are reported back with the result; the orchestrator
+        // subtracts them from its round trip to get transfer time
+        auto decode_start = std::chrono::steady_clock::now();
+
         // Extract image data
         std::string image_base64 = msg.data["image_base64"];
         
@@ -357,8 +513,15 @@ void DeviceClient::handle_image_classification_task(const Message& msg) {
             // Mark image model as busy
             // ...existing code...
             
+            auto exec_start = std::chrono::steady_clock::now();
+            double decode_ms = std::chrono::duration<double, std::milli>(exec_start - decode_start).count();
+
             // Run Inception-V3 classification
             std::string classification_result = run_inception_v3(output_path);
+            double exec_ms = std::chrono::duration<double, std::milli>(
+                std::chrono::steady_clock::now() - exec_start).count();
+            json timing = {{"decode_ms", decode_ms}, {"exec_ms", exec_ms}};
+            record_service_time(timing);
             
             // Mark image model as free again
             // ...existing code...
@@ -369,12 +532,13 @@ void DeviceClient::handle_image_classification_task(const Message& msg) {
                     {"status", "classification_complete"},
                     {"output_path", output_path},
                     {"image_size", decoded_image.length()},
-                    {"classification", classification_result}
+                    {"classification", classification_result},
+                    {"timing", timing}
                 };
                 send_message(Message{"result", agent_id, msg.task_id, msg.subtask, result});
                 LOGI("Classification completed: %s", classification_result.c_str());
             } else {
-                json result = {{"status", "error"}, {"message", "Classification failed"}};
+                json result = {{"status", "error"}, {"message", "Classification failed"}, {"timing", timing}};
                 send_message(Message{"result", agent_id, msg.task_id, msg.subtask, result});
             }
         } else {
@@ -416,6 +580,299 @@ void DeviceClient::handle_image_classification_task(const Message& msg) {
     }
 }
 
+void DeviceClient::handle_tensor_classification_task(const Message& msg) {
+    // The orchestrator already decoded, cropped and resized the image
+    // (image_pipeline.py); only the SNPE input file is left to write
+    try {
+        auto decode_start = std::chrono::steady_clock::now();
+
+        std::string snpe_bundle_dir = "/data/local/tmp/snpe-bundle";
+        std::string raw_filename = "tensor_" + std::to_string(
+            std::chrono::system_clock::to_time_t(std::chrono::system_clock::now())) + ".raw";
+        system(("mkdir -p " + snpe_bundle_dir + "/cropped").c_str());
+        std::string error;
+        size_t tensor_size = write_tensor_raw(msg.data, snpe_bundle_dir + "/cropped/" + raw_filename, error);
+        std::ofstream list_file(snpe_bundle_dir + "/target_raw_list.txt", std::ios::trunc);
+        if (!error.empty() || !list_file.is_open()) {
+            LOGE("Tensor for task %s not written: %s", msg.task_id.c_str(), error.c_str());
+            json result = {{"status", "error"}, {"message", error.empty() ? "Failed to open file for writing" : error}};
+            send_message(Message{"result", agent_id, msg.task_id, msg.subtask, result});
+            send_status();
+            return;
+        }
+        list_file << "cropped/" << raw_filename << "\n";
+        list_file.close();
+
+        auto exec_start = std::chrono::steady_clock::now();
+        double decode_ms = std::chrono::duration<double, std::milli>(exec_start - decode_start).count();
+
+        // Steps 3 and 4 of run_inception_v3; there is no image to move or preprocess
+        std::string classification_result;
+        if (run_snpe_inference()) {
+            classification_result = get_classification_result();
+        } else {
+            LOGE("SNPE inference failed");
+        }
+        double exec_ms = std::chrono::duration<double, std::milli>(
+            std::chrono::steady_clock::now() - exec_start).count();
+        json timing = {{"decode_ms", decode_ms}, {"exec_ms", exec_ms}};
+        record_service_time(timing);
+
+        if (!classification_result.empty()) {
+            json result = {
+                {"status", "classification_complete"},
+                {"output_path", snpe_bundle_dir + "/cropped/" + raw_filename},
+                {"image_size", tensor_size},
+                {"classification", classification_result},
+                {"timing", timing}
+            };
+            send_message(Message{"result", agent_id, msg.task_id, msg.subtask, result});
+            LOGI("Classification completed: %s", classification_result.c_str());
+        } else {
+            json result = {{"status", "error"}, {"message", "Classification failed"}, {"timing", timing}};
+            send_message(Message{"result", agent_id, msg.task_id, msg.subtask, result});
+        }
+
+        send_status();
+
+    } catch (const std::exception& e) {
+        LOGE("Error handling tensor classification task: %s", e.what());
+        json result = {{"status", "error"}, {"message", e.what()}};
+        send_message(Message{"result", agent_id, msg.task_id, msg.subtask, result});
+    }
+}
+
+size_t DeviceClient::write_tensor_raw(const json& data, const std::string& raw_path, std::string& error) {
+    // Returns the size of the tensor as sent; error is set when nothing usable was written
+    std::string dtype = data.value("tensor_dtype", "float32");
+    size_t elements = 1;
+    for (const auto& dim : data["tensor_shape"]) {
+        elements *= dim.get<size_t>();
+    }
+    std::string tensor = decode_base64(data["tensor_base64"].get<std::string>());
+    size_t element_size = dtype == "uint8" ? 1 : sizeof(float);
+    if ((dtype != "uint8" && dtype != "float32") || tensor.size() != elements * element_size) {
+        error = "Bad tensor: " + dtype + ", " + std::to_string(tensor.size()) + " bytes for " + std::to_string(elements) + " elements";
+        return tensor.size();
+    }
+
+    // uint8 tensors are the resized BGR pixels; normalise like preprocess.cpp
+    std::vector<float> normalised;
+    const char* raw = tensor.data();
+    size_t raw_size = tensor.size();
+    if (dtype == "uint8") {
+        normalised.resize(elements);
+        const unsigned char* pixels = reinterpret_cast<const unsigned char*>(tensor.data());
+        for (size_t i = 0; i < elements; ++i) {
+            normalised[i] = (pixels[i] - 128.0f) / 128.0f;
+        }
+        raw = reinterpret_cast<const char*>(normalised.data());
+        raw_size = elements * sizeof(float);
+    }
+
+    std::ofstream raw_file(raw_path, std::ios::binary);
+    if (!raw_file.is_open()) {
+        error = "Failed to open " + raw_path + " for writing";
+        return tensor.size();
+    }
+    raw_file.write(raw, raw_size);
+    LOGI("Wrote %s tensor (%zu bytes) to %s", dtype.c_str(), raw_size, raw_path.c_str());
+    return tensor.size();
+}
+
+void DeviceClient::handle_batch_classification_task(const Message& msg) {
+    // One snpe-net-run for every image in the batch: the DLC is loaded and the
+    // DSP initialised once, and Result_N holds the output of input list line N.
+    // Each task still gets its own result message, under its own task_id.
+    std::string snpe_bundle_dir = "/data/local/tmp/snpe-bundle";
+    std::vector<std::string> task_ids;
+    std::vector<std::string> raw_files;
+
+    auto send_error = [&](const std::string& task_id, const std::string& message) {
+        json result = {{"status", "error"}, {"message", message}};
+        send_message(Message{"result", agent_id, task_id, "classify", result});
+    };
+
+    try {
+        auto decode_start = std::chrono::steady_clock::now();
+        const json& items = msg.data["items"];
+        LOGI("Received batch %s with %zu images", msg.task_id.c_str(), items.size());
+
+        // Leftovers would be preprocessed again and shift the Result_N numbering,
+        // and an old batch_*.raw could stand in for an image that failed to decode
+        system(("mkdir -p " + snpe_bundle_dir + "/images " + snpe_bundle_dir + "/cropped && "
+                "rm -rf " + snpe_bundle_dir + "/images/* " + snpe_bundle_dir + "/output/Result_* " +
+                snpe_bundle_dir + "/cropped/batch_*").c_str());
+
+        std::string stamp = std::to_string(std::chrono::system_clock::to_time_t(std::chrono::system_clock::now()));
+        bool needs_preprocess = false;
+        for (size_t i = 0; i < items.size(); ++i) {
+            const json& item = items[i];
+            std::string task_id = item.value("task_id", msg.task_id + "-" + std::to_string(i));
+            std::string name = "batch_" + stamp + "_" + std::to_string(i);
+            std::string error;
+            if (item.contains("tensor_base64")) {
+                write_tensor_raw(item, snpe_bundle_dir + "/cropped/" + name + ".raw", error);
+            } else {
+                std::string image = decode_base64(item.value("image_base64", ""));
+                std::ofstream file(snpe_bundle_dir + "/images/" + name + ".jpg", std::ios::binary);
+                if (file.is_open() && !image.empty()) {
+                    file.write(image.c_str(), image.length());
+                    needs_preprocess = true;
+                } else {
+                    error = "Failed to save image";
+                }
+            }
+            if (error.empty()) {
+                task_ids.push_back(task_id);
+                raw_files.push_back("cropped/" + name + ".raw");
+            } else {
+                LOGE("Dropping %s from batch %s: %s", task_id.c_str(), msg.task_id.c_str(), error.c_str());
+                send_error(task_id, error);
+            }
+        }
+
+        if (!task_ids.empty()) {
+            std::string preprocess_cmd = "cd " + snpe_bundle_dir + " && "
+                                         "export LD_LIBRARY_PATH=$PWD && "
+                                         "./preprocess_android ./images ./cropped 299 bilinear";
+            if (needs_preprocess && system(preprocess_cmd.c_str()) != 0) {
+                LOGE("Preprocessing reported an error for batch %s", msg.task_id.c_str());
+            }
+            // preprocess_android skips an image it cannot decode and still exits 0, and
+            // one missing or short .raw fails the whole snpe-net-run: keep only items
+            // with a complete 299x299x3 float input
+            const off_t raw_bytes = 299 * 299 * 3 * sizeof(float);
+            std::vector<std::string> ready_ids, ready_files;
+            for (size_t i = 0; i < task_ids.size(); ++i) {
+                struct stat raw_stat;
+                if (stat((snpe_bundle_dir + "/" + raw_files[i]).c_str(), &raw_stat) == 0 && raw_stat.st_size == raw_bytes) {
+                    ready_ids.push_back(task_ids[i]);
+                    ready_files.push_back(raw_files[i]);
+                } else {
+                    LOGE("Dropping %s from batch %s: no preprocessed input", task_ids[i].c_str(), msg.task_id.c_str());
+                    send_error(task_ids[i], "Preprocessing failed: image could not be decoded");
+                }
+            }
+            task_ids.swap(ready_ids);
+            raw_files.swap(ready_files);
+            std::ofstream list_file(snpe_bundle_dir + "/target_raw_list.txt", std::ios::trunc);
+            for (const auto& raw_file : raw_files) {
+                list_file << raw_file << "\n";
+            }
+        }
+
+        if (!task_ids.empty()) {
+            auto exec_start = std::chrono::steady_clock::now();
+            double decode_ms = std::chrono::duration<double, std::milli>(exec_start - decode_start).count();
+            bool inference_ok = run_snpe_inference();
+            std::vector<std::string> classifications = inference_ok ? run_postprocess_batch(task_ids.size())
+                                                                    : std::vector<std::string>(task_ids.size());
+            // Every task waited for the whole batch, so each reports the batch's durations
+            double exec_ms = std::chrono::duration<double, std::milli>(
+                std::chrono::steady_clock::now() - exec_start).count();
+            json timing = {{"decode_ms", decode_ms}, {"exec_ms", exec_ms}};
+            record_service_time(timing);  // Once: every task of the batch reports these same durations
+
+            for (size_t i = 0; i < task_ids.size(); ++i) {
+                json result;
+                if (!classifications[i].empty()) {
+                    result = {
+                        {"status", "classification_complete"},
+                        {"output_path", snpe_bundle_dir + "/" + raw_files[i]},
+                        {"classification", classifications[i]},
+                        {"batch_id", msg.task_id},
+                        {"batch_size", task_ids.size()},
+                        {"timing", timing}
+                    };
+                } else {
+                    result = {{"status", "error"}, {"message", "Classification failed"},
+                              {"batch_id", msg.task_id}, {"timing", timing}};
+                }
+                send_message(Message{"result", agent_id, task_ids[i], "classify", result});
+            }
+            LOGI("Batch %s: %zu images classified in %.0f ms", msg.task_id.c_str(), task_ids.size(), exec_ms);
+        }
+
+        send_status();
+
+    } catch (const std::exception& e) {
+        LOGE("Error handling batch classification task: %s", e.what());
+        for (const auto& task_id : task_ids) {
+            send_error(task_id, e.what());
+        }
+        if (task_ids.empty()) {
+            send_error(msg.task_id, e.what());
+        }
+    }
+}
+
+void DeviceClient::handle_story_chunk(const Message& msg) {
+    // Labels arrive while other devices are still classifying. genie-t2t-run
+    // takes its prompt at launch and generate_story carries the whole prompt,
+    // so the labels themselves are not kept: the useful head start is the model
+    // load, and the first chunk of a story pulls the Genie weights into the page cache.
+    // No result is sent; the hub sends chunks fire-and-forget.
+    std::string story_id = msg.data.value("story_id", "");
+    if (story_id != warmed_story) {
+        warmed_story = story_id;
+        LOGI("Story %s: first label, warming Genie weights", story_id.c_str());
+        system("cat /data/local/tmp/genie-bundle/*.bin > /dev/null 2>&1 &");
+    }
+    LOGI("Story %s: label %d: %s", story_id.c_str(), msg.data.value("seq", -1),
+         msg.data.value("label", "").c_str());
+}
+
+void DeviceClient::handle_story_generation_task(const Message& msg) {
+    std::string story_id = msg.data.value("story_id", msg.task_id);
+    std::string prompt = msg.data.value("prompt", "");
+
+    try {
+        // Same invocation as primitive_agent.sh run_genie; the prompt is single-quoted for the shell
+        std::string quoted;
+        for (char c : "<|begin_of_text|><|start_header_id|>user<|end_header_id|>\\n\\n" + prompt +
+                      "<|eot_id|><|start_header_id|>assistant<|end_header_id|>") {
+            quoted += c == '\'' ? std::string("'\\''") : std::string(1, c);
+        }
+        std::string genie_dir = "/data/local/tmp/genie-bundle";
+        std::string genie_cmd = "cd " + genie_dir + " && "
+                                "export LD_LIBRARY_PATH=$PWD && "
+                                "export ADSP_LIBRARY_PATH=$PWD/hexagon-v75/unsigned && "
+                                "./genie-t2t-run -c genie_config.json -p '" + quoted + "' 2>/dev/null";
+        LOGI("Story %s: generating (%zu prompt chars)", story_id.c_str(), prompt.size());
+
+        auto exec_start = std::chrono::steady_clock::now();
+        std::string story;
+        FILE* fp = popen(genie_cmd.c_str(), "r");
+        if (fp != nullptr) {
+            char line[512];
+            while (fgets(line, sizeof(line), fp) != nullptr) {
+                story += line;
+            }
+            pclose(fp);
+        }
+        double exec_ms = std::chrono::duration<double, std::milli>(
+            std::chrono::steady_clock::now() - exec_start).count();
+        json timing = {{"exec_ms", exec_ms}};
+
+        json result;
+        if (!story.empty()) {
+            result = {{"status", "story_complete"}, {"story_id", story_id}, {"story", story}, {"timing", timing}};
+            LOGI("Story %s generated in %.0f ms", story_id.c_str(), exec_ms);
+        } else {
+            result = {{"status", "error"}, {"message", "Story generation failed"}, {"timing", timing}};
+            LOGE("Story %s: genie-t2t-run produced no output", story_id.c_str());
+        }
+        send_message(Message{"result", agent_id, msg.task_id, msg.subtask, result});
+        send_status();
+
+    } catch (const std::exception& e) {
+        LOGE("Error handling story task: %s", e.what());
+        json result = {{"status", "error"}, {"message", e.what()}};
+        send_message(Message{"result", agent_id, msg.task_id, msg.subtask, result});
+    }
+}
+
 std::string DeviceClient::run_inception_v3(const std::string& image_path) {
     LOGI("Running Inception-V3 on image: %s", image_path.c_str());
     
@@ -578,13 +1035,19 @@ std::string DeviceClient::get_classification_result() {
     
     LOGI("Found result file: %s", result_file_path);
     
+    return run_postprocess(result_file_path);
+}
+
+std::string DeviceClient::run_postprocess(const std::string& result_file_path) {
+    std::string snpe_bundle_dir = "/data/local/tmp/snpe-bundle";
+
     // Run postprocessing to get human-readable classification
     std::string postprocess_cmd = "cd " + snpe_bundle_dir + " && "
-                                 "./postprocess " + std::string(result_file_path) + " imagenet_slim_labels.txt";
+                                 "./postprocess " + result_file_path + " imagenet_slim_labels.txt";
     
     LOGI("Running postprocess command: %s", postprocess_cmd.c_str());
     
-    fp = popen(postprocess_cmd.c_str(), "r");
+    FILE* fp = popen(postprocess_cmd.c_str(), "r");
     if (fp == nullptr) {
         LOGE("Failed to run postprocessing");
         return "";
@@ -610,6 +1073,45 @@ std::string DeviceClient::get_classification_result() {
     return result;
 }
 
+std::vector<std::string> DeviceClient::run_postprocess_batch(size_t count) {
+    std::string snpe_bundle_dir = "/data/local/tmp/snpe-bundle";
+    std::vector<std::string> results;
+
+    // One snpe_postprocess.py pass labels every Result_N in order, instead of one
+    // ./postprocess fork per image; a Result_N without output prints "... missing_file"
+    std::string postprocess_cmd = "cd " + snpe_bundle_dir + " && "
+                                 "python3 snpe_postprocess.py output --labels imagenet_slim_labels.txt --format postprocess"
+                                 " 2>/dev/null";
+    LOGI("Running postprocess command: %s", postprocess_cmd.c_str());
+    FILE* fp = popen(postprocess_cmd.c_str(), "r");
+    if (fp != nullptr) {
+        char line[512];
+        while (results.size() < count && fgets(line, sizeof(line), fp) != nullptr) {
+            std::string result(line);
+            while (!result.empty() && (result.back() == '\n' || result.back() == '\r')) {
+                result.pop_back();
+            }
+            if (result.find(" -1 missing_file") != std::string::npos) {
+                result.clear();  // Reported as "Classification failed"
+            }
+            results.push_back(result);
+        }
+        pclose(fp);
+    }
+    if (results.size() == count) {
+        return results;
+    }
+
+    // No python3 or script on this device: the postprocess binary, one result at a time
+    LOGI("snpe_postprocess.py gave %zu of %zu results, falling back to ./postprocess", results.size(), count);
+    results.assign(count, "");
+    for (size_t i = 0; i < count; ++i) {
+        results[i] = run_postprocess(snpe_bundle_dir + "/output/Result_" + std::to_string(i) +
+                                     "/InceptionV3/Predictions/Reshape_1:0.raw");
+    }
+    return results;
+}
+
 std::string DeviceClient::decode_base64(const std::string& encoded) {
     // Simple base64 decoder implementation
     const std::string chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
@@ -7,6 +7,7 @@
 #include <sys/socket.h>
 #include <netinet/in.h>
 #include <thread>
+#include <mutex>
 
 using json = nlohmann::json;
 
@@ -26,14 +27,33 @@ public:
     void listen();
     void send_message(const Message& msg);
     void send_status();
+    void status_loop();
 
 private:
     std::string orchestrator_ip;
     int port;
+    std::string home_ip;  // Orchestrator from the command line; the fallback after a redirect target goes away
+    int home_port;
     std::string agent_id;
     bool has_npu;
     int sock = -1;
     std::string current_image_filename;
+    std::string warmed_story;  // Story whose first chunk already warmed the Genie weights
+    std::mutex send_mutex;
+    std::mutex status_mutex;
+    json last_sent_metrics;     // Metrics as last reported, the baseline for deltas
+    long long status_seq = 0;   // Sequence number of the last status/status_delta sent
+    int ticks_since_keyframe = 0;  // Status ticks (deltas and heartbeats) since the last keyframe
+    bool keyframe_requested = true;
+    bool threads_started = false;  // status_loop/listen run once, across reconnects
+    std::mutex service_mutex;
+    double service_mean = 0.0;     // EWMA of on-device seconds per classify task (decode + exec); what bids predict
+    double service_var = 0.0;      // EWMA variance of the same; its square root is the bid's uncertainty
+    long long service_count = 0;
+    void record_service_time(const json& timing);
+    json collect_metrics();
+    void send_status_update(bool force_keyframe);
+    json diff_metrics(const json& prev, const json& cur);
     float get_cpu_load();
     int get_battery_level();
     json get_ram_usage();
@@ -42,6 +62,11 @@ private:
     void handle_bid_request(const Message& msg);
     void handle_task(const Message& msg);
     void handle_image_classification_task(const Message& msg);
+    void handle_tensor_classification_task(const Message& msg);
+    void handle_batch_classification_task(const Message& msg);
+    void handle_story_chunk(const Message& msg);
+    void handle_story_generation_task(const Message& msg);
+    size_t write_tensor_raw(const json& data, const std::string& raw_path, std::string& error);
     std::string decode_base64(const std::string& encoded);
     std::string run_inception_v3(const std::string& image_path);
     bool move_image_to_snpe_bundle(const std::string& image_path);
@@ -49,6 +74,8 @@ private:
     bool preprocess_image(const std::string& image_name);
     bool run_snpe_inference();
     std::string get_classification_result();
+    std::string run_postprocess(const std::string& result_file_path);
+    std::vector<std::string> run_postprocess_batch(size_t count);
 };
 
 #endif
\ No newline at end of file
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Latency-model accuracy tracking
+Joins each winning bid's prediction (TTFT, speed, latency and the uncertainty
+behind its confidence bound) with what actually happened, and keeps per
+device/backend rolling error, bias and calibration. A Page-Hinkley test on the
+relative latency residual raises a drift alarm when a device's predictions go
+consistently wrong in one direction, which a rolling MAE only shows late.
+
+The device scripts append one row per feedback to residuals.csv (see
+RESIDUAL_FIELDS); run this file on those to get the same report:
+
+    python3 accuracy.py /sdcard/mesh_network/residuals.csv
+"""
+
+import argparse
+import csv
+import sys
+import threading
+import time
+from collections import deque
+
+RESIDUAL_FIELDS = ["ts", "device", "bid_id", "backend", "pred_ttft", "pred_speed", "pred_tokens", "pred_latency",
+                   "uncertainty", "score", "actual_ttft", "actual_speed", "actual_latency"]
+
+ALPHA = 0.5            # Exploration weight of the solver: score = latency - ALPHA * uncertainty
+DRIFT_DELTA = 0.05     # Page-Hinkley: relative error tolerated before it counts as drift
+DRIFT_THRESHOLD = 1.0  # Page-Hinkley: cumulative excess relative error that raises an alarm
+
+
+class DeviceAccuracy:
+    def __init__(self, window):
+        self.err_ttft = deque(maxlen=window)
+        self.err_speed = deque(maxlen=window)
+        self.residuals = deque(maxlen=window)  # actual - predicted latency (s)
+        self.lcb_hits = deque(maxlen=window)   # actual >= score, i.e. the lower bound held
+        self.band_hits = deque(maxlen=window)  # |actual - predicted| <= ALPHA * uncertainty
+        self.count = 0
+        self.alarms = 0
+        self.ph_up = self.ph_down = 0.0  # Page-Hinkley cumulative sums
+
+    def page_hinkley(self, r):
+        """Two-sided Page-Hinkley on the relative residual r; returns "slower", "faster" or None"""
+        # Measured against zero rather than the running mean: a model that is
+        # consistently off by 40% is exactly what should alarm
+        self.ph_up = max(0.0, self.ph_up + r - DRIFT_DELTA)
+        self.ph_down = max(0.0, self.ph_down - r - DRIFT_DELTA)
+        if self.ph_up > DRIFT_THRESHOLD:
+            direction = "slower"
+        elif self.ph_down > DRIFT_THRESHOLD:
+            direction = "faster"
+        else:
+            return None
+        self.ph_up = self.ph_down = 0.0
+        self.alarms += 1
+        return direction
+
+    def summary(self):
+        def mean(values):
+            return sum(values) / len(values) if values else None
+        return {
+            "count": self.count,
+            "mae_latency": mean([abs(r) for r in self.residuals]),
+            "bias_latency": mean(self.residuals),
+            "mae_ttft": mean(self.err_ttft),
+            "mae_speed": mean(self.err_speed),
+            "lcb_coverage": mean(self.lcb_hits),
+            "band_coverage": mean(self.band_hits),
+            "alarms": self.alarms,
+        }
+
+
+class AccuracyTracker:
+    def __init__(self, window=50, alpha=ALPHA, log=None):
+        """
+        Args:
+            window: Number of recent outcomes the rolling statistics cover
+            alpha: Exploration weight used to build the bid's confidence bound
+            log: Optional EventLogger; drift alarms are logged as prediction_drift
+        """
+        self.window = window
+        self.alpha = alpha
+        self.log = log
+        self.devices = {}  # {(device, backend): DeviceAccuracy}
+        self.lock = threading.Lock()
+
+    def record(self, device, backend, pred_latency, actual_latency, uncertainty=0.0,
+               pred_ttft=None, actual_ttft=None, pred_speed=None, actual_speed=None):
+        """Add one prediction/outcome pair; returns a drift alarm dict or None"""
+        with self.lock:
+            stats = self.devices.get((device, backend))
+            if stats is None:
+                stats = self.devices[(device, backend)] = DeviceAccuracy(self.window)
+            stats.count += 1
+            if pred_ttft is not None and actual_ttft is not None:
+                stats.err_ttft.append(abs(pred_ttft - actual_ttft))
+            if pred_speed is not None and actual_speed is not None:
+                stats.err_speed.append(abs(pred_speed - actual_speed))
+            if pred_latency is None or actual_latency is None:
+                return None
+            residual = actual_latency - pred_latency
+            stats.residuals.append(residual)
+            stats.lcb_hits.append(1.0 if actual_latency >= pred_latency - self.alpha * uncertainty else 0.0)
+            stats.band_hits.append(1.0 if abs(residual) <= self.alpha * uncertainty else 0.0)
+            direction = stats.page_hinkley(residual / max(pred_latency, 1e-3))
+            mae = sum(abs(r) for r in stats.residuals) / len(stats.residuals)
+        if direction is None:
+            return None
+        alarm = {"device": device, "backend": backend, "direction": direction,
+                 "residual": round(residual, 3), "mae": round(mae, 3)}
+        if self.log:
+            self.log.warn("prediction_drift", f"⚠️  Predictions for {device}/{backend} drifting: device runs "
+                          f"{direction} than predicted (MAE {mae:.2f}s)", **alarm)
+        return alarm
+
+    def snapshot(self):
+        """{(device, backend): DeviceAccuracy.summary()}"""
+        with self.lock:
+            return {key: stats.summary() for key, stats in self.devices.items()}
+
+    def format_table(self, snapshot=None):
+        snapshot = self.snapshot() if snapshot is None else snapshot
+
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else "-"
+        lines = [f"{'device':<16} {'backend':<8} {'n':>5} {'MAE s':>7} {'bias s':>7} {'MAE ttft':>9} "
+                 f"{'MAE tps':>8} {'LCB ok':>7} {'band ok':>8} {'alarms':>7}"]
+        for (device, backend), s in sorted(snapshot.items()):
+            lines.append(f"{device:<16} {backend:<8} {s['count']:>5} {fmt(s['mae_latency'], '7.2f'):>7} "
+                         f"{fmt(s['bias_latency'], '+7.2f'):>7} {fmt(s['mae_ttft'], '9.2f'):>9} "
+                         f"{fmt(s['mae_speed'], '8.2f'):>8} {fmt(s['lcb_coverage'], '7.0%'):>7} "
+                         f"{fmt(s['band_coverage'], '8.0%'):>8} {s['alarms']:>7}")
+        return "\n".join(lines)
+
+
+def parse_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise prediction accuracy from device residual logs")
+    parser.add_argument("files", nargs="+", help="residuals.csv files written by feedback_listener/orchestrator")
+    parser.add_argument("--window", type=int, default=50)
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    args = parser.parse_args()
+
+    tracker = AccuracyTracker(args.window, args.alpha)
+    rows = []
+    for path in args.files:
+        with open(path, newline="", encoding="utf-8", errors="ignore") as f:
+            rows += [row for row in csv.DictReader(f)]
+    rows.sort(key=lambda row: parse_float(row.get("ts")) or 0.0)
+
+    for row in rows:
+        values = {key: parse_float(row.get(key)) for key in RESIDUAL_FIELDS[4:]}
+        alarm = tracker.record(row.get("device", "?"), row.get("backend") or "cpu", values["pred_latency"],
+                               values["actual_latency"], values["uncertainty"] or 0.0,
+                               values["pred_ttft"], values["actual_ttft"], values["pred_speed"], values["actual_speed"])
+        if alarm:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(parse_float(row.get("ts")) or 0))
+            print(f"⚠️  {when} drift on {alarm['device']}/{alarm['backend']}: runs {alarm['direction']} "
+                  f"than predicted (residual {alarm['residual']:+.2f}s, MAE {alarm['mae']:.2f}s)")
+    print(tracker.format_table())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
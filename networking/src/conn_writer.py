@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Per-connection outbound queue for the hub's device sockets
+Every device connection gets one ConnWriter. send()/sendall() only append the
+message to the connection's queue and return; a writer thread drains it with
+non-blocking sends, waiting in select() while the socket buffer is full. A
+phone that reads slowly therefore only delays its own messages, never the
+thread that is running a bid round, and messages from different threads can
+no longer interleave on the wire.
+
+The queue is bounded in bytes. A message always goes in when the queue is
+empty, however large (a batch of float32 tensors is several MB), so the
+bound only limits the backlog. When a message does not fit behind it:
+    drop        the message is refused with QueueFull; the connection stays up
+    disconnect  the connection is shut down, as for a device that left
+A connection that makes no progress for stall_timeout seconds is shut down
+too: the device is half dead, and its reader thread then unregisters it.
+"""
+
+import select
+import socket
+import threading
+import time
+from collections import deque
+
+OVERFLOW_POLICIES = ("drop", "disconnect")
+CHUNK = 64 * 1024  # Bytes handed to one send()
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+class QueueFull(ConnectionError):
+    """The message would push a non-empty queue over max_bytes"""
+
+
+class ConnWriter:
+    def __init__(self, conn, name="", max_bytes=4 * 1024 * 1024, overflow="drop", stall_timeout=15.0,
+                 log=None, on_drop=None):
+        """
+        Args:
+            conn: Connected socket; the caller keeps reading from it
+            name: Peer name for log events (the device ID once it registers)
+            max_bytes: Bytes that may be queued behind the message being written
+            overflow: What a full queue does, "drop" or "disconnect"
+            stall_timeout: Seconds without any bytes written before the connection is given up
+            log: Optional EventLogger
+            on_drop: Optional fn(reason) called for every message that is not delivered
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.conn = conn
+        self.name = name
+        self.max_bytes = max_bytes
+        self.overflow = overflow
+        self.stall_timeout = stall_timeout
+        self.log = log
+        self.on_drop = on_drop
+        self.queue = deque()  # Encoded messages, oldest first
+        self.queued_bytes = 0
+        self.sent_bytes = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name=f"writer-{name}", daemon=True)
+        self.thread.start()
+
+    def send(self, data):
+        """Queue data for the peer; raises QueueFull or ConnectionError instead of blocking"""
+        with self.cond:
+            if self.closed:
+                raise ConnectionError("connection closed")
+            # max_bytes bounds the backlog, not the message: an empty queue takes anything
+            if self.queue and self.queued_bytes + len(data) > self.max_bytes:
+                queued = self.queued_bytes
+                full = True
+            else:
+                self.queue.append(data)
+                self.queued_bytes += len(data)
+                self.cond.notify_all()  # The writer, or flush() waiters; both recheck the queue
+                full = False
+        if not full:
+            return len(data)
+        self._dropped("queue_full")
+        message = f"write queue full ({queued} bytes queued, {len(data)} more)"
+        if self.overflow == "disconnect":
+            self.close(message)
+            raise ConnectionError(message)
+        raise QueueFull(message)
+
+    sendall = send  # Nothing is ever half sent from the caller's point of view
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been written; False if it has not been by timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.queue and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            return not self.queue
+
+    def close(self, reason=None):
+        """Stop writing and shut the socket down; the reader sees EOF and cleans up the device"""
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            dropped = len(self.queue)
+            self.queue.clear()
+            self.queued_bytes = 0
+            self.cond.notify_all()
+        for _ in range(dropped):
+            self._dropped("closed")
+        if reason and self.log is not None:
+            self.log.warn("connection_dropped", f"Dropping connection to {self.name or 'device'}: {reason}",
+                          device=self.name, reason=reason, unsent=dropped)
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _dropped(self, reason):
+        if self.on_drop is not None:
+            self.on_drop(reason)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                data = self.queue[0]
+            try:
+                self._write(memoryview(data))
+            except OSError as e:
+                self.close(str(e))
+                return
+            with self.cond:
+                if self.closed:
+                    return
+                self.queue.popleft()
+                self.queued_bytes -= len(data)
+                self.sent_bytes += len(data)
+                self.cond.notify_all()
+
+    def _write(self, view):
+        """Write all of view, like sendall, but give up after stall_timeout without progress"""
+        last_progress = time.monotonic()
+        while view:
+            try:
+                sent = self.conn.send(view[:CHUNK], MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            if sent:
+                view = view[sent:]
+                last_progress = time.monotonic()
+                continue
+            remaining = self.stall_timeout - (time.monotonic() - last_progress)
+            if remaining <= 0:
+                raise TimeoutError(f"no progress for {self.stall_timeout:.0f}s")
+            select.select([], [self.conn], [], min(remaining, 1.0))
+            if self.closed:
+                raise ConnectionError("connection closed")
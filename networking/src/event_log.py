@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Structured event logger for the orchestrators
+Events are queued on the request path and written by a background thread as
+JSON lines, so callers never block on stdout or disk. Run this file directly
+to filter a log:
+
+    python3 event_log.py orchestrator_events.jsonl --level WARN --event auction_winner
+"""
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40}
+
+
+class EventLogger:
+    def __init__(self, path=None, level="DEBUG", console_level="INFO", max_queue=10000, stream=None):
+        """
+        Args:
+            path: JSON-lines file to append events to (None disables the file sink)
+            level: Minimum level queued at all
+            console_level: Minimum level echoed to the console (None disables it)
+            max_queue: Bound on queued events; when full, new events are dropped and counted
+            stream: Console stream, defaults to stdout
+        """
+        self.path = path
+        self.min_level = LEVELS[level]
+        self.console_level = LEVELS[console_level] if console_level else None
+        self.stream = stream or sys.stdout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.writer = threading.Thread(target=self._write_loop, name="event-log-writer", daemon=True)
+        self.writer.start()
+
+    def set_console_level(self, console_level):
+        self.console_level = LEVELS[console_level] if console_level else None
+
+    def enabled(self, level):
+        """Check a level before building expensive event fields"""
+        return LEVELS[level] >= self.min_level
+
+    def log(self, level, event, msg="", **fields):
+        """Queue an event without blocking; drops it if the writer has fallen behind"""
+        if LEVELS[level] < self.min_level:
+            return
+        record = {"ts": time.time(), "level": level, "event": event}
+        if msg:
+            record["msg"] = msg
+        record.update(fields)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def debug(self, event, msg="", **fields):
+        self.log("DEBUG", event, msg, **fields)
+
+    def info(self, event, msg="", **fields):
+        self.log("INFO", event, msg, **fields)
+
+    def warn(self, event, msg="", **fields):
+        self.log("WARN", event, msg, **fields)
+
+    def error(self, event, msg="", **fields):
+        self.log("ERROR", event, msg, **fields)
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        self.queue.join()
+
+    def _write_loop(self):
+        sink = None
+        if self.path:
+            try:
+                sink = open(self.path, "a", encoding="utf-8")
+            except OSError as e:
+                sys.stderr.write(f"event log: cannot open {self.path} ({e}), console only\n")
+        while True:
+            batch = [self.queue.get()]
+            # Drain whatever else is waiting so one flush covers the whole burst
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for record in batch:
+                    if sink:
+                        sink.write(json.dumps(record, default=str) + "\n")
+                    if self.console_level is not None and LEVELS[record["level"]] >= self.console_level:
+                        self.stream.write(format_event(record) + "\n")
+                if sink:
+                    sink.flush()
+                self.stream.flush()
+            except Exception as e:
+                sys.stderr.write(f"event log write failed: {e}\n")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+
+def format_event(record):
+    """Render an event as a single console line"""
+    text = record.get("msg")
+    if not text:
+        extras = " ".join(f"{k}={v}" for k, v in record.items() if k not in ("ts", "level", "event"))
+        text = f"{record.get('event', '')} {extras}".strip()
+    elif "src" in record:
+        # Device shell scripts log {src, device, msg} instead of an event name
+        text = f"[{record.get('device', '')}/{record['src']}] {text}"
+    if record["level"] in ("WARN", "ERROR"):
+        return f"[{record['level']}] {text}"
+    return text
+
+
+def filter_events(lines, level=None, event=None, device=None, task_id=None, contains=None):
+    """Yield parsed events from JSON lines that match every given filter"""
+    min_level = LEVELS[level] if level else None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if min_level is not None and LEVELS.get(record.get("level"), 0) < min_level:
+            continue
+        if event and record.get("event") != event:
+            continue
+        if device and device not in (record.get("device"), record.get("device_id")):
+            continue
+        if task_id and record.get("task_id") != task_id:
+            continue
+        if contains and contains not in line:
+            continue
+        yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter structured orchestrator/device logs")
+    parser.add_argument("files", nargs="*", help="JSON-lines logs (stdin if omitted)")
+    parser.add_argument("--level", choices=list(LEVELS), help="Minimum level")
+    parser.add_argument("--event", help="Exact event name")
+    parser.add_argument("--device", help="Device ID")
+    parser.add_argument("--task", dest="task_id", help="Task ID")
+    parser.add_argument("--grep", dest="contains", help="Substring anywhere in the record")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON instead of formatted lines")
+    args = parser.parse_args()
+
+    sources = [open(f, encoding="utf-8", errors="ignore") for f in args.files] or [sys.stdin]
+    for source in sources:
+        for record in filter_events(source, args.level, args.event, args.device, args.task_id, args.contains):
+            if args.json:
+                print(json.dumps(record))
+            else:
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(float(record.get("ts", 0))))
+                print(f"{stamp} {format_event(record)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Phi-accrual failure detection for device connections
+Every message from a device counts as a heartbeat. The detector keeps the
+recent inter-arrival times per device and turns the current silence into
+phi = -log10(P(a heartbeat this late | the device is alive)), like Akka and
+Cassandra. A phone that sends status every second is suspected (phi >= 8)
+a few seconds after it falls off Wi-Fi. One whose link was always jittery
+gets proportionally more slack. A short pause (GC, a busy SNPE run) is
+absorbed by acceptable_pause.
+
+TCP keepalive on the same sockets is the backstop for peers that never send
+heartbeats: the kernel gives up on them in keepalive_idle + interval * count
+seconds instead of the default two hours.
+
+    python3 failure_detector.py --interval 1 --jitter 0.2   # phi against seconds of silence
+"""
+
+import argparse
+import math
+import random
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+PHI_THRESHOLD = 8.0  # Suspect a device at this phi (~1e-8 chance that it is alive but late)
+
+KEEPALIVE_IDLE = 10      # Seconds of silence before the first TCP keepalive probe
+KEEPALIVE_INTERVAL = 5   # Seconds between unanswered probes
+KEEPALIVE_COUNT = 3      # Unanswered probes before the kernel resets the connection
+
+
+def enable_keepalive(sock, idle=KEEPALIVE_IDLE, interval=KEEPALIVE_INTERVAL, count=KEEPALIVE_COUNT):
+    """Turn on TCP keepalive with short timers, where the platform lets us tune them"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+class HeartbeatHistory:
+    def __init__(self, window, first_interval, now):
+        self.intervals = deque(maxlen=window)
+        self.total = 0.0
+        self.squares = 0.0
+        self.last = now
+        self.add(first_interval)  # Until real intervals arrive, assume the expected rate
+
+    def add(self, interval):
+        if len(self.intervals) == self.intervals.maxlen:
+            old = self.intervals[0]
+            self.total -= old
+            self.squares -= old * old
+        self.intervals.append(interval)
+        self.total += interval
+        self.squares += interval * interval
+
+    def mean_std(self):
+        n = len(self.intervals)
+        mean = self.total / n
+        return mean, math.sqrt(max(self.squares / n - mean * mean, 0.0))
+
+
+class PhiAccrualDetector:
+    def __init__(self, threshold=PHI_THRESHOLD, window=100, min_std=0.2, acceptable_pause=2.0,
+                 first_interval=1.0, clock=time.monotonic):
+        """
+        Args:
+            threshold: phi at which a device counts as suspected
+            window: Inter-arrival times kept per device
+            min_std: Floor on the standard deviation, so a perfectly regular device is not suspected at once
+            acceptable_pause: Seconds of extra silence tolerated on top of the mean interval
+            first_interval: Interval assumed for a device before its second heartbeat
+            clock: Time source in seconds
+        """
+        self.threshold = threshold
+        self.window = window
+        self.min_std = min_std
+        self.acceptable_pause = acceptable_pause
+        self.first_interval = first_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.history = {}  # {key: HeartbeatHistory}
+
+    def heartbeat(self, key):
+        now = self.clock()
+        with self.lock:
+            history = self.history.get(key)
+            if history is None:
+                self.history[key] = HeartbeatHistory(self.window, self.first_interval, now)
+                return
+            history.add(now - history.last)
+            history.last = now
+
+    def silence(self, key):
+        """Seconds since key's last heartbeat, or None if it never sent one"""
+        with self.lock:
+            history = self.history.get(key)
+            return self.clock() - history.last if history else None
+
+    def phi(self, key):
+        """Suspicion level of key right now; 0.0 for keys without heartbeats"""
+        now = self.clock()
+        with self.lock:
+            history = self.history.get(key)
+            if history is None:
+                return 0.0
+            mean, std = history.mean_std()
+            elapsed = now - history.last
+        return phi(elapsed, mean + self.acceptable_pause, max(std, self.min_std))
+
+    def is_available(self, key):
+        return self.phi(key) < self.threshold
+
+    def remove(self, key):
+        with self.lock:
+            self.history.pop(key, None)
+
+    def keys(self):
+        with self.lock:
+            return list(self.history)
+
+
+def phi(elapsed, mean, std):
+    """-log10 of the normal tail beyond elapsed, via the logistic approximation of its CDF"""
+    y = (elapsed - mean) / std
+    a = y * (1.5976 + 0.070566 * y * y)  # The tail is 1 / (1 + e^a); both branches avoid overflow
+    if a >= 0:
+        return (a + math.log1p(math.exp(-a))) / math.log(10)
+    return math.log1p(math.exp(a)) / math.log(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show phi against silence for a device with the given heartbeat rate")
+    parser.add_argument("--interval", type=float, default=1.0, help="Mean seconds between heartbeats")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Standard deviation of the interval")
+    parser.add_argument("--pause", type=float, default=2.0, help="acceptable_pause of the detector")
+    parser.add_argument("--threshold", type=float, default=PHI_THRESHOLD)
+    args = parser.parse_args()
+
+    now = [0.0]
+    detector = PhiAccrualDetector(threshold=args.threshold, acceptable_pause=args.pause,
+                                  first_interval=args.interval, clock=lambda: now[0])
+    rng = random.Random(0)
+    for _ in range(detector.window):
+        detector.heartbeat("device")
+        now[0] += max(rng.gauss(args.interval, args.jitter), 0.0)
+    last = now[0] - detector.silence("device")
+
+    print(f"{'silence s':>10} {'phi':>8}")
+    suspected_at = None
+    for tenths in range(0, 301, 5):
+        now[0] = last + tenths / 10.0
+        value = detector.phi("device")
+        if suspected_at is None and value >= args.threshold:
+            suspected_at = tenths / 10.0
+        print(f"{tenths / 10.0:>10.1f} {value:>8.2f}")
+        if value > 3 * args.threshold:
+            break
+    print(f"Suspected after {suspected_at:.1f}s of silence" if suspected_at is not None else "Never suspected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Shared featurisation for latency prediction
+One place that turns device state and a prompt into model inputs, used by the
+data-collection harnesses, the offline trainers and the online scorers so they
+cannot drift apart. FEATURE_VERSION is written next to every dataset row and
+model; bump it whenever FEATURE_NAMES or a scaling changes.
+
+Version 1 is the original [1, cpu/100, ram/100, prompt_chars/1000] vector that
+multi_linucb_solver.c and linucb.py still use. Version 2 counts the prompt in
+tokens and adds predicted output tokens, battery, thermal and NPU state and
+the degree-2 terms that won in compare-multiple-regression-models.py.
+
+    python3 features.py dataset.csv    # featurise a harness CSV, print a summary
+"""
+
+import argparse
+import csv
+import os
+import re
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+FEATURE_VERSION = 2
+SOLVER_FEATURE_VERSION = 1  # Layout multi_linucb_solver.c is built for; linucb.py mirrors it
+
+FEATURE_NAMES = {
+    1: ["bias", "cpu", "ram", "prompt_chars"],
+    2: ["bias", "cpu", "ram", "prompt_tokens", "pred_tokens", "battery", "thermal", "npu_busy",
+        "cpu_x_ram", "cpu_x_prompt", "ram_x_prompt", "cpu_sq", "prompt_sq", "thermal_x_cpu"],
+}
+
+CHARS_PER_TOKEN = 4.0      # Used when a row only has prompt_length (older datasets)
+DEFAULT_PRED_TOKENS = 75   # Same fallback as the token predictor in the C solver
+TOKENIZER_PATH = os.environ.get("LLAMA_TOKENIZER", "")  # tokenizer.json of the deployed model
+
+_tokenizer = None
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _load_tokenizer():
+    """HuggingFace tokenizer for the deployed model if available, else False"""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = False
+        if TOKENIZER_PATH and os.path.exists(TOKENIZER_PATH):
+            try:
+                from tokenizers import Tokenizer
+                _tokenizer = Tokenizer.from_file(TOKENIZER_PATH)
+            except Exception as e:
+                print(f"⚠️  Could not load tokenizer {TOKENIZER_PATH} ({e}); using the word estimate")
+    return _tokenizer
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    """Prompt length in model tokens; cached since the same prompts recur across runs and bids"""
+    tokenizer = _load_tokenizer()
+    if tokenizer:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    # BPE keeps common words whole and splits long ones; one token per ~6 letters
+    return sum(1 + (len(word) - 1) // 6 for word in _WORD_RE.findall(text))
+
+
+def _value(row, keys, default):
+    """Float from the first of keys the row has a value for, else default.
+
+    Every feature input is non-negative, so a negative value is the harnesses'
+    "could not read it" sentinel (-1) and counts as missing too.
+    """
+    for key in keys:
+        try:
+            value = float(row.get(key))
+        except (TypeError, ValueError):
+            continue
+        if value >= 0:
+            return value
+    return float(default)
+
+
+def _column(rows, keys, default):
+    """_value of every row as an array"""
+    keys = (keys,) if isinstance(keys, str) else keys
+    return np.array([_value(row, keys, default) for row in rows], dtype=float).reshape(len(rows))
+
+
+def _solver_features(row):
+    """Version 1 vector as a list, without numpy, since the bandit scorers call it per bid"""
+    return [1.0, _value(row, ("cpu_load",), 0.0) / 100.0, _value(row, ("ram_load",), 0.0) / 100.0,
+            _value(row, ("prompt_length",), 0.0) / 1000.0]
+
+
+def prompt_tokens(rows):
+    """Token counts from "prompt_tokens", else the "prompt" text, else prompt_length / CHARS_PER_TOKEN"""
+    tokens = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        if row.get("prompt_tokens") not in (None, ""):
+            tokens[i] = float(row["prompt_tokens"])
+        elif row.get("prompt"):
+            tokens[i] = count_tokens(row["prompt"])
+        else:
+            tokens[i] = float(row.get("prompt_length") or 0) / CHARS_PER_TOKEN
+    return tokens
+
+
+def featurise(rows, version=FEATURE_VERSION):
+    """
+    Feature matrix (len(rows), len(FEATURE_NAMES[version])) for a batch of rows
+
+    Args:
+        rows: Dicts with cpu_load and ram_load (0-100), prompt / prompt_tokens /
+              prompt_length, and optionally pred_tokens (or the harness's measured
+              tokens), battery (0-100), temp_c and npu_busy; missing or -1
+              values fall back to neutral defaults
+        version: FEATURE_VERSION to compute
+    """
+    if version == 1:
+        return np.array([_solver_features(row) for row in rows], dtype=float).reshape(len(rows), 4)
+    if version != 2:
+        raise ValueError(f"Unknown feature version {version}")
+
+    cpu = _column(rows, "cpu_load", 0.0) / 100.0
+    ram = _column(rows, "ram_load", 0.0) / 100.0
+    bias = np.ones(len(rows))
+
+    prompt = prompt_tokens(rows) / 100.0
+    # Training rows carry the tokens actually generated where a live request has the prediction
+    pred = _column(rows, ("pred_tokens", "tokens"), DEFAULT_PRED_TOKENS) / 1000.0
+    battery = _column(rows, "battery", 100.0) / 100.0
+    # 0 at or below 25 C, 1 at 50 C where most phones start throttling
+    thermal = np.clip((_column(rows, "temp_c", 25.0) - 25.0) / 25.0, 0.0, 2.0)
+    npu_busy = np.array([1.0 if str(row.get("npu_busy", "")).lower() in ("1", "true") else 0.0 for row in rows])
+    return np.column_stack([bias, cpu, ram, prompt, pred, battery, thermal, npu_busy,
+                            cpu * ram, cpu * prompt, ram * prompt, cpu * cpu, prompt * prompt, thermal * cpu])
+
+
+def featurise_one(version=FEATURE_VERSION, **row):
+    """Feature vector for a single request (the online scorer's path); a plain list for version 1"""
+    if version == 1:
+        return _solver_features(row)
+    return featurise([row], version)[0]
+
+
+def check_version(model_version, version=FEATURE_VERSION):
+    """Raise if a model was trained on a different feature layout than it is about to be fed"""
+    if model_version != version:
+        raise ValueError(f"Model expects feature version {model_version}, pipeline produces {version}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Featurise a harness CSV and summarise the columns")
+    parser.add_argument("csv", help="CSV with cpu_load, ram_load and prompt_length/prompt_tokens columns")
+    parser.add_argument("--version", type=int, default=FEATURE_VERSION)
+    args = parser.parse_args()
+
+    with open(args.csv, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        print("No rows")
+        return 1
+    X = featurise(rows, args.version)
+    print(f"{len(rows)} rows, feature version {args.version}")
+    print(f"{'feature':<15} {'mean':>9} {'std':>9} {'min':>9} {'max':>9}")
+    for name, col in zip(FEATURE_NAMES[args.version], X.T):
+        print(f"{name:<15} {col.mean():>9.3f} {col.std():>9.3f} {col.min():>9.3f} {col.max():>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
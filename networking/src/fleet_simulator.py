@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+Discrete-event fleet simulator
+Models N virtual devices whose TTFT and stream speed are sampled from the
+measured runs in dataset.csv (= ttft-final.csv), conditioned on cpu_load,
+ram_load and prompt_length. The real Orchestrator (hub) or P2POrchestrator
+scoring runs unchanged: devices are stand-in connections that answer
+bid_request/task messages on a virtual clock, so thousands of tasks simulate
+in a second of wall time. Mode "bandit" instead scores bids with a policy from
+policies.py and reports its regret against the best device for each task.
+
+    python3 fleet_simulator.py --devices 16 --tasks 5000 --load 0.5 --mode hub
+    python3 fleet_simulator.py --rate 0.1    # A fixed arrival rate instead of a share of capacity
+    python3 fleet_simulator.py --mode bandit --policy thompson --heterogeneity 0.4
+"""
+
+import argparse
+import contextlib
+import csv
+import heapq
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+from event_log import EventLogger
+from latency import LatencyHistogram, LatencyTracker
+
+# v5p/dataset.csv is the same 2913 runs as data_collection/{best-fit,2dev}/ttft-final.csv;
+# listing those too would only count every run twice. Add other runs with --dataset.
+DEFAULT_DATASETS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "v5p", "dataset.csv"),
+]
+
+
+class TraceSampler:
+    def __init__(self, paths=None, cpu_step=10, ram_step=10, prompt_step=50, seed=None):
+        """
+        Args:
+            paths: Measurement CSVs (cpu_load,ram_load,ram_kb,tokens,prompt_length,ttft_sec,stream_speed_tps)
+            cpu_step, ram_step: Bucket width in percent for cpu_load / ram_load
+            prompt_step: Bucket width in characters for prompt_length
+        """
+        self.steps = (cpu_step, ram_step, prompt_step)
+        self.rng = random.Random(seed)
+        self.buckets = {}  # {(cpu_bucket, ram_bucket, prompt_bucket): [(ttft, tps, tokens)]}
+        self.prompt_lengths = []
+        for path in paths or DEFAULT_DATASETS:
+            with open(path, newline="") as f:
+                for row in csv.DictReader(f):
+                    try:
+                        key = self.key(float(row["cpu_load"]), float(row["ram_load"]), float(row["prompt_length"]))
+                        sample = (float(row["ttft_sec"]), float(row["stream_speed_tps"]), int(float(row["tokens"])))
+                    except (KeyError, ValueError):
+                        continue
+                    self.buckets.setdefault(key, []).append(sample)
+                    self.prompt_lengths.append(int(float(row["prompt_length"])))
+        if not self.buckets:
+            raise ValueError("no usable rows in the measurement datasets")
+        self.nearest = {}  # Memoised fallback for empty buckets
+        self.means = {}    # {bucket: mean ttft + tokens / tps}
+        samples = [sample for rows in self.buckets.values() for sample in rows]
+        self.mean_tokens = sum(tokens for _, _, tokens in samples) / len(samples)
+        self.mean_service = sum(ttft + tokens / tps for ttft, tps, tokens in samples) / len(samples)
+
+    def key(self, cpu_pct, ram_pct, prompt_length):
+        return (int(cpu_pct // self.steps[0]), int(ram_pct // self.steps[1]), int(prompt_length // self.steps[2]))
+
+    def bucket(self, cpu_pct, ram_pct, prompt_length):
+        """Populated bucket for these conditions, falling back to the closest one"""
+        key = self.key(cpu_pct, ram_pct, prompt_length)
+        if key in self.buckets:
+            return key
+        # Closest populated bucket; prompt distance counts double since it drives TTFT most
+        if key not in self.nearest:
+            self.nearest[key] = min(self.buckets, key=lambda k: abs(k[0] - key[0]) + abs(k[1] - key[1]) + 2 * abs(k[2] - key[2]))
+        return self.nearest[key]
+
+    def sample(self, cpu_pct, ram_pct, prompt_length):
+        """(ttft_sec, stream_speed_tps, tokens) from a run measured under similar conditions"""
+        return self.rng.choice(self.buckets[self.bucket(cpu_pct, ram_pct, prompt_length)])
+
+    def expected(self, cpu_pct, ram_pct, prompt_length):
+        """Mean service time (ttft + tokens / tps) of the runs sample() draws from"""
+        key = self.bucket(cpu_pct, ram_pct, prompt_length)
+        if key not in self.means:
+            rows = self.buckets[key]
+            self.means[key] = sum(ttft + tokens / tps for ttft, tps, tokens in rows) / len(rows)
+        return self.means[key]
+
+    def prompt_length(self):
+        return self.rng.choice(self.prompt_lengths)
+
+
+class SimConnection:
+    """Stand-in for a device socket: the orchestrator's send() lands in the device's handler"""
+
+    def __init__(self, device):
+        self.device = device
+
+    def send(self, payload):
+        self.device.receive(json.loads(payload))
+        return len(payload)
+
+    sendall = send
+
+
+class VirtualDevice:
+    def __init__(self, sim, device_id, has_npu, base_cpu, base_ram, battery, slowdown=1.0):
+        self.sim = sim
+        self.device_id = device_id
+        self.has_npu = has_npu
+        self.base_cpu = base_cpu  # Background load in [0, 1]
+        self.base_ram = base_ram  # Background RAM usage percent
+        self.battery = battery
+        # Service-time multiplier the bids do not reveal (SoC, thermals); NPU devices run faster
+        self.factor = slowdown / (sim.npu_speedup if has_npu else 1.0)
+        self.queue = []           # Tasks waiting behind the one running
+        self.running = None
+        self.busy_time = 0.0
+        self.completed = 0
+        self.status_seq = 0
+        self.service = None       # (EWMA mean, EWMA variance) of its own service times, bid like DeviceClient does
+        self.conn = SimConnection(self)
+
+    def load(self):
+        """Current (cpu_load in [0,1], ram usage percent); each queued task adds contention"""
+        depth = len(self.queue) + (1 if self.running else 0)
+        return min(1.0, self.base_cpu + 0.3 * depth), min(97.0, self.base_ram + 5.0 * depth)
+
+    def metrics(self):
+        cpu, ram = self.load()
+        return {"cpu_load": cpu, "battery": self.battery, "ram": {"usage_percent": ram}}
+
+    def bid(self):
+        bid = dict(self.metrics(), has_npu=self.has_npu, backend="npu" if self.has_npu else "cpu")
+        if self.service is not None:
+            bid.update(predicted_latency=self.service[0], uncertainty=math.sqrt(self.service[1]))
+        return bid
+
+    def receive(self, msg):
+        """Handle a message the orchestrator sent to this device"""
+        if msg["type"] == "bid_request":
+            reply = {"type": "bid", "agent_id": self.device_id, "task_id": msg["task_id"],
+                     "subtask": msg["subtask"], "data": self.bid()}
+            self.sim.schedule(self.sim.network_delay(), self.sim.deliver, reply, self.conn)
+        elif msg["type"] == "task":
+            self.sim.schedule(self.sim.network_delay(self.sim.payload_bytes), self.enqueue, msg["task_id"])
+
+    def enqueue(self, task_id):
+        self.queue.append(task_id)
+        if self.running is None:
+            self.start_next()
+
+    def start_next(self):
+        task_id = self.queue.pop(0)
+        self.running = task_id
+        cpu, ram = self.load()
+        ttft, tps, tokens = self.sim.sampler.sample(cpu * 100, ram, self.sim.prompt_lengths.get(task_id, 100))
+        service = (ttft + tokens / tps) * self.factor
+        self.sim.outcomes[task_id] = (ttft * self.factor, tps / self.factor)
+        self.busy_time += service
+        self.sim.report_status(self)
+        self.sim.schedule(service, self.finish, task_id, service)
+
+    def finish(self, task_id, service):
+        self.running = None
+        self.completed += 1
+        if self.service is None:
+            self.service = (service, 0.0)
+        else:
+            mean, var = self.service
+            diff = service - mean
+            self.service = (mean + 0.2 * diff, 0.8 * (var + 0.2 * diff * diff))
+        self.sim.task_done(self, task_id, service)
+        if self.queue:
+            self.start_next()
+        else:
+            self.sim.report_status(self)
+
+
+class BanditAuctioneer:
+    SLOW_PICK = 1.1  # A pick counts as slow when its expected service is 10% over the best bid's
+
+    def __init__(self, sim, policy):
+        """Orchestrator for mode "bandit": the lowest policy score wins and every outcome trains the policy"""
+        self.sim = sim
+        self.policy = policy
+        self.pending_bids = {}  # {task_id: {"bids": {device_id: bid}, ...}}, filled like P2POrchestrator's
+        self.decided = {}       # {task_id: (device_id, cpu %, ram %, prompt_length)} until the outcome is in
+        self.decision_time = LatencyHistogram()
+        self.regret = 0.0
+        self.slow_picks = 0
+        self.decisions = 0
+
+    def evaluate_bids(self, task_id):
+        bids = self.pending_bids.get(task_id, {}).get("bids")
+        if not bids:
+            return None
+        prompt_length = self.sim.prompt_lengths.get(task_id, 100)
+        tokens = self.sim.sampler.mean_tokens
+        start = time.perf_counter()
+        scores = {device_id: self.policy.score(device_id, bid["cpu_load"] * 100, bid["ram"]["usage_percent"],
+                                               prompt_length, tokens)
+                  for device_id, bid in bids.items()}
+        winner = min(scores, key=scores.get)
+        self.decision_time.record(time.perf_counter() - start)
+
+        # Regret against the device that would have been fastest on average under the same conditions
+        expected = {device_id: self.sim.sampler.expected(bid["cpu_load"] * 100, bid["ram"]["usage_percent"], prompt_length)
+                    * self.sim.devices[device_id].factor for device_id, bid in bids.items()}
+        best = min(expected.values())
+        self.regret += expected[winner] - best
+        self.slow_picks += expected[winner] > best * self.SLOW_PICK
+        self.decisions += 1
+        bid = bids[winner]
+        self.decided[task_id] = (winner, bid["cpu_load"] * 100, bid["ram"]["usage_percent"], prompt_length)
+        return (winner,)
+
+    def record_outcome(self, task_id, ttft, tps):
+        decision = self.decided.pop(task_id, None)
+        if decision:
+            self.policy.update(*decision, ttft, tps)
+
+    def summary(self):
+        return {
+            "policy": self.policy.name,
+            "decisions": self.decisions,
+            "total_regret": self.regret,
+            "mean_regret": self.regret / self.decisions if self.decisions else 0.0,
+            "slow_picks": self.slow_picks / self.decisions if self.decisions else 0.0,
+            "decision_p50": self.decision_time.percentile(50),
+            "decision_p95": self.decision_time.percentile(95),
+        }
+
+
+class FleetSimulator:
+    def __init__(self, num_devices=8, npu_fraction=0.25, mode="hub", rate=None, load=0.5, bid_window=0.5,
+                 sampler=None, payload_bytes=150000, bandwidth=2.5e6, npu_speedup=1.0, seed=0, trace_path=None,
+                 policy="linucb", heterogeneity=0.0):
+        """
+        Args:
+            num_devices: Virtual devices in the fleet
+            npu_fraction: Share of devices that report an NPU
+            mode: "hub" drives Orchestrator, "p2p" drives P2POrchestrator.evaluate_bids,
+                  "bandit" scores bids with a policies.py policy
+            rate: Task arrivals per simulated second (Poisson); None derives it from load
+            load: Target fleet utilisation; arrivals come at load times the fleet's nominal
+                  capacity (sum over devices of 1 / mean service time). Queued tasks add CPU
+                  contention and slow service down, so queues already grow well below 1.
+            bid_window: Simulated seconds the orchestrator waits for bids
+            payload_bytes: Size of the task message (image) sent to the winner
+            bandwidth: Link speed in bytes/second for payload transfers
+            npu_speedup: Service-time divisor for NPU devices (the datasets are CPU runs)
+            trace_path: Also write the hub's INFO events here, for replay.py
+            policy: policies.py policy name (or instance) for mode "bandit"
+            heterogeneity: Spread of hidden per-device slowdowns, exp(uniform(-h, h)); 0 makes devices identical
+        """
+        self.rng = random.Random(seed)
+        self.sampler = sampler or TraceSampler(seed=seed)
+        self.mode = mode
+        self.bid_window = bid_window
+        self.payload_bytes = payload_bytes
+        self.bandwidth = bandwidth
+        self.npu_speedup = npu_speedup
+        self.now = 0.0
+        self.events = []  # heap of (time, seq, fn, args)
+        self.seq = 0
+        self.prompt_lengths = {}  # {task_id: prompt_length}
+        self.arrivals = {}        # {task_id: arrival time}
+        self.outcomes = {}        # {task_id: (ttft, tps)} as measured on the device that ran it
+        self.e2e = LatencyHistogram()
+        self.submitted = 0
+        self.completed = 0
+
+        self.devices = {}
+        for i in range(num_devices):
+            device_id = f"sim-{i:03d}"
+            self.devices[device_id] = VirtualDevice(self, device_id, self.rng.random() < npu_fraction,
+                                                    base_cpu=self.rng.uniform(0.05, 0.6),
+                                                    base_ram=self.rng.uniform(20, 70),
+                                                    battery=self.rng.randint(15, 100),
+                                                    slowdown=math.exp(self.rng.uniform(-heterogeneity, heterogeneity))
+                                                    if heterogeneity else 1.0)
+        capacity = sum(1.0 / (self.sampler.mean_service * device.factor) for device in self.devices.values())
+        self.rate = rate if rate is not None else load * capacity
+        self.load = self.rate / capacity
+
+        # Only warnings and errors from the orchestrator (the full trace if asked), and nothing on the console
+        quiet_log = EventLogger(path=trace_path, level="INFO" if trace_path else "WARN", console_level=None)
+        if mode == "hub":
+            from orchestrator import Orchestrator
+            self.orchestrator = Orchestrator(bind=False, log_path=None)
+            self.orchestrator.log = self.orchestrator.accuracy.log = quiet_log
+            self.orchestrator.latency = LatencyTracker(clock=self.clock)
+            self.orchestrator.schedule = self.schedule
+            self.orchestrator.bid_window = bid_window
+            with contextlib.redirect_stdout(io.StringIO()):  # Registration prints a table per device
+                for device in self.devices.values():
+                    self.orchestrator.process_message({
+                        "type": "register", "agent_id": device.device_id,
+                        "data": {"hasNpu": device.has_npu, "capabilities": ["classify"], "metrics": device.metrics()},
+                    }, device.conn)
+        elif mode == "p2p":
+            from orchestrator_p2p import P2POrchestrator
+            self.mesh_dir = tempfile.TemporaryDirectory(prefix="fleet_sim_")
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.orchestrator = P2POrchestrator(mesh_dir=self.mesh_dir.name)
+            self.orchestrator.log = quiet_log
+        elif mode == "bandit":
+            from policies import make_policy
+            self.orchestrator = BanditAuctioneer(self, make_policy(policy, seed=seed) if isinstance(policy, str) else policy)
+        else:
+            raise ValueError(f"unknown mode {mode}")
+
+    def clock(self):
+        return self.now
+
+    def schedule(self, delay, fn, *args):
+        self.seq += 1
+        heapq.heappush(self.events, (self.now + delay, self.seq, fn, args))
+
+    def network_delay(self, payload=0):
+        """One-way delay: base Wi-Fi latency plus transfer time for the payload"""
+        return self.rng.uniform(0.003, 0.02) + payload / self.bandwidth
+
+    def deliver(self, msg, conn):
+        self.orchestrator.process_message(msg, conn)
+
+    def report_status(self, device):
+        """Status keyframe to the hub orchestrator whenever a device's queue changes"""
+        if self.mode != "hub":
+            return
+        device.status_seq += 1
+        self.orchestrator.process_message({"type": "status", "agent_id": device.device_id,
+                                           "data": {"seq": device.status_seq, "metrics": device.metrics()}}, device.conn)
+
+    def submit(self):
+        """One task arrival, then schedule the next"""
+        self.submitted += 1
+        prompt_length = self.sampler.prompt_length()
+        if self.mode == "hub":
+            # The orchestrator mints the task_id; catch it on the first bid_request it sends
+            before = set(self.orchestrator.pending_bids)
+            self.orchestrator.handle_image_received("sim-client", {"image_base64": ""})
+            for task_id in set(self.orchestrator.pending_bids) - before:
+                self.prompt_lengths[task_id] = prompt_length
+                self.arrivals[task_id] = self.now
+        else:
+            task_id = f"task_{self.submitted}"
+            self.prompt_lengths[task_id] = prompt_length
+            self.arrivals[task_id] = self.now
+            self.orchestrator.pending_bids[task_id] = {"bids": {}, "start_time": self.now, "prompt": ""}
+            for device in self.devices.values():
+                self.schedule(self.network_delay(), self.p2p_bid, task_id, device)
+            self.schedule(self.bid_window, self.p2p_evaluate, task_id)
+        if self.submitted < self.target:
+            self.schedule(self.rng.expovariate(self.rate), self.submit)
+
+    def p2p_bid(self, task_id, device):
+        if task_id in self.orchestrator.pending_bids:
+            self.orchestrator.pending_bids[task_id]["bids"][device.device_id] = device.bid()
+
+    def p2p_evaluate(self, task_id):
+        result = self.orchestrator.evaluate_bids(task_id)
+        self.orchestrator.pending_bids.pop(task_id, None)
+        if result:
+            device = self.devices[result[0]]
+            self.schedule(self.network_delay(self.payload_bytes), device.enqueue, task_id)
+
+    def task_done(self, device, task_id, service):
+        """Device finished a task; the result travels back before it counts"""
+        self.schedule(self.network_delay(), self.record_completion, device, task_id, service)
+
+    def record_completion(self, device, task_id, service):
+        outcome = self.outcomes.pop(task_id, None)
+        if self.mode == "hub":
+            self.deliver({"type": "result", "agent_id": device.device_id, "task_id": task_id, "subtask": "classify",
+                          "data": {"status": "classification_complete", "classification": "sim",
+                                   "timing": {"exec_ms": service * 1000.0}}}, device.conn)
+        elif self.mode == "bandit" and outcome:
+            self.orchestrator.record_outcome(task_id, *outcome)
+        self.completed += 1
+        self.prompt_lengths.pop(task_id, None)
+        arrival = self.arrivals.pop(task_id, None)
+        if arrival is not None:
+            self.e2e.record(self.now - arrival)
+
+    def run(self, num_tasks=1000, max_time=None):
+        """Simulate num_tasks arrivals until every event drains; returns a summary dict"""
+        self.target = num_tasks
+        self.schedule(0.0, self.submit)
+        wall_start = time.perf_counter()
+        while self.events:
+            when, _, fn, args = heapq.heappop(self.events)
+            if max_time is not None and when > max_time:
+                break
+            self.now = when
+            fn(*args)
+        wall = time.perf_counter() - wall_start
+        return self.summary(wall)
+
+    def summary(self, wall):
+        stats = {
+            "mode": self.mode,
+            "rate": self.rate,
+            "load": self.load,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "sim_seconds": self.now,
+            "wall_seconds": wall,
+            "tasks_per_wall_second": self.submitted / wall if wall else 0.0,
+            "throughput_per_sim_second": self.completed / self.now if self.now else 0.0,
+            "e2e": self.e2e.summary(),
+            "devices": {},
+        }
+        for device_id, device in self.devices.items():
+            stats["devices"][device_id] = {
+                "has_npu": device.has_npu,
+                "completed": device.completed,
+                "utilisation": device.busy_time / self.now if self.now else 0.0,
+            }
+        if self.mode == "hub":
+            stats["stages"] = self.orchestrator.latency.snapshot()
+        elif self.mode == "bandit":
+            stats["bandit"] = self.orchestrator.summary()
+        return stats
+
+
+def print_summary(stats):
+    e2e = stats["e2e"]
+    print(f"Mode: {stats['mode']}  tasks: {stats['completed']}/{stats['submitted']} completed  "
+          f"arrivals: {stats['rate']:.3f}/s (load {stats['load']:.2f} of fleet capacity)")
+    print(f"Simulated {stats['sim_seconds']:.1f}s in {stats['wall_seconds']:.2f}s wall "
+          f"({stats['tasks_per_wall_second']:.0f} tasks/s wall, {stats['throughput_per_sim_second']:.3f} tasks/s simulated)")
+    print(f"End-to-end: p50 {e2e['p50']:.2f}s  p95 {e2e['p95']:.2f}s  p99 {e2e['p99']:.2f}s  max {e2e['max']:.2f}s")
+    print(f"\n{'device':<10} {'npu':>4} {'tasks':>7} {'util':>6}")
+    for device_id, d in stats["devices"].items():
+        print(f"{device_id:<10} {'yes' if d['has_npu'] else 'no':>4} {d['completed']:>7} {d['utilisation']*100:>5.1f}%")
+    if "bandit" in stats:
+        b = stats["bandit"]
+        print(f"\nPolicy {b['policy']}: regret {b['mean_regret']:.3f}s/task ({b['total_regret']:.0f}s total), "
+              f"{b['slow_picks']:.1%} slow picks, decision p50 {b['decision_p50'] * 1e6:.0f}us "
+              f"p95 {b['decision_p95'] * 1e6:.0f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the orchestrator against a virtual device fleet")
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--load", type=float, default=0.5, help="Target utilisation; sets the arrival rate from fleet capacity")
+    parser.add_argument("--rate", type=float, help="Task arrivals per simulated second (overrides --load)")
+    parser.add_argument("--mode", choices=["hub", "p2p", "bandit"], default="hub")
+    parser.add_argument("--policy", default="linucb", help="policies.py policy for --mode bandit")
+    parser.add_argument("--heterogeneity", type=float, default=0.0, help="Hidden per-device slowdown spread (log scale)")
+    parser.add_argument("--npu-fraction", type=float, default=0.25)
+    parser.add_argument("--npu-speedup", type=float, default=1.0)
+    parser.add_argument("--bid-window", type=float, default=0.5, help="Simulated seconds to collect bids")
+    parser.add_argument("--dataset", action="append", help="Measurement CSV (repeatable); defaults to v5p/dataset.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    parser.add_argument("--trace", help="Write the hub's auction trace (JSON lines) here for replay.py")
+    args = parser.parse_args()
+
+    sim = FleetSimulator(num_devices=args.devices, npu_fraction=args.npu_fraction, mode=args.mode, rate=args.rate, load=args.load,
+                         bid_window=args.bid_window, npu_speedup=args.npu_speedup,
+                         sampler=TraceSampler(args.dataset, seed=args.seed), seed=args.seed, trace_path=args.trace,
+                         policy=args.policy, heterogeneity=args.heterogeneity)
+    stats = sim.run(args.tasks)
+    if args.mode != "bandit":
+        sim.orchestrator.log.flush()
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print_summary(stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Orchestrator-side image preprocessing for InceptionV3
+Decodes, center-crops, resizes and normalises task images once on the hub,
+in a worker pool, exactly like agent-orchestrator-v1/preprocess.cpp does on
+every phone (BGR, 299x299 bilinear, (pixel - 128) / 128). The winner then gets
+a ready tensor and goes straight to snpe-net-run.
+
+Two wire formats:
+    float32  the .raw tensor snpe-net-run reads, 299*299*3*4 bytes
+    uint8    the resized pixels, 4x smaller; the device normalises them
+
+Preprocessing starts when the auction does, so it overlaps the bid window.
+
+    python3 image_pipeline.py test.jpg --dtype uint8    # time one image, write test.raw
+"""
+
+import argparse
+import base64
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+INPUT_SIZE = 299
+MEAN = 128.0
+DIVISOR = 128.0
+DTYPES = ("float32", "uint8")
+
+
+def center_crop_square(img):
+    height, width = img.shape[:2]
+    side = min(width, height)
+    x, y = (width - side) // 2, (height - side) // 2
+    return img[y:y + side, x:x + side]
+
+
+def preprocess(image_bytes, size=INPUT_SIZE, dtype="float32", resize="bilinear"):
+    """HxWx3 BGR tensor for InceptionV3 from encoded image bytes; raises ValueError if undecodable"""
+    img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("could not decode image")
+    interpolation = cv2.INTER_LINEAR if resize == "bilinear" else cv2.INTER_AREA
+    resized = cv2.resize(center_crop_square(img), (size, size), interpolation=interpolation)
+    if dtype == "uint8":
+        return np.ascontiguousarray(resized)
+    return (resized.astype(np.float32) - MEAN) / DIVISOR
+
+
+def encode_tensor(tensor):
+    """Task message fields carrying a preprocessed tensor"""
+    return {
+        "tensor_base64": base64.b64encode(tensor.tobytes()).decode("ascii"),
+        "tensor_dtype": str(tensor.dtype),
+        "tensor_shape": list(tensor.shape),
+    }
+
+
+class ImagePipeline:
+    def __init__(self, workers=2, dtype="uint8", size=INPUT_SIZE, latency=None):
+        """
+        Args:
+            workers: Preprocessing threads (OpenCV releases the GIL while it works)
+            dtype: Wire format, "float32" or "uint8"
+            size: Square input size of the model
+            latency: Optional LatencyTracker; time per image is recorded as "preprocess"
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {', '.join(DTYPES)}")
+        self.dtype = dtype
+        self.size = size
+        self.latency = latency
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preprocess")
+
+    def submit(self, image_base64):
+        """Future resolving to the tensor fields for a task message (see encode_tensor)"""
+        return self.pool.submit(self._run, image_base64)
+
+    def _run(self, image_base64):
+        start = time.perf_counter()
+        fields = encode_tensor(preprocess(base64.b64decode(image_base64), self.size, self.dtype))
+        if self.latency is not None:
+            self.latency.record("preprocess", time.perf_counter() - start)
+        return fields
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess an image the way the hub ships it to devices")
+    parser.add_argument("image")
+    parser.add_argument("--dtype", choices=DTYPES, default="float32")
+    parser.add_argument("--output", help="Where to write the tensor (default: image name with .raw)")
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    start = time.perf_counter()
+    tensor = preprocess(image_bytes, dtype=args.dtype)
+    elapsed = time.perf_counter() - start
+    output = args.output or args.image.rsplit(".", 1)[0] + ".raw"
+    tensor.tofile(output)
+    print(f"{args.image}: {len(image_bytes)} bytes -> {tensor.shape} {tensor.dtype} "
+          f"({tensor.nbytes} bytes) in {elapsed * 1000:.1f} ms, written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency tracking for the orchestrators
+Each task is timed with time.monotonic() from the moment it enters the
+orchestrator; every call to mark() closes the current stage and records its
+duration in that stage's histogram. Devices report their own durations
+(execution, decode) in the result message, since monotonic clocks are not
+comparable across devices.
+
+The shell mesh scripts append "task,stage,ms" lines instead; run this file on
+those to get the same table:
+
+    python3 latency.py /sdcard/mesh_network/stage_latency.csv
+"""
+
+import argparse
+import math
+import sys
+import threading
+import time
+
+# Histogram values are stored in microseconds, keeping SIGNIFICANT_BITS of
+# precision per power of two (~6% worst-case relative error), like HdrHistogram
+SIGNIFICANT_BITS = 5
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = {}  # {bucket lower bound in us: count}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def bucket(us):
+        """Lower bound of the log-linear bucket holding a value in microseconds"""
+        v = max(int(us), 0)
+        shift = max(v.bit_length() - SIGNIFICANT_BITS, 0)
+        return (v >> shift) << shift
+
+    @staticmethod
+    def bucket_top(lower):
+        """Highest value that falls in the bucket starting at lower"""
+        shift = max(lower.bit_length() - SIGNIFICANT_BITS, 0)
+        return lower + (1 << shift) - 1
+
+    def record(self, seconds):
+        us = seconds * 1e6
+        key = self.bucket(us)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Value in seconds at or below which p percent of samples fall"""
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(p / 100.0 * self.count))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= target:
+                return min(self.bucket_top(key) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class LatencyTracker:
+    def __init__(self, max_tasks=10000, clock=time.monotonic):
+        """
+        Args:
+            max_tasks: Bound on in-flight tasks; the oldest is forgotten when exceeded
+            clock: Time source in seconds (the fleet simulator passes its virtual clock)
+        """
+        self.histograms = {}  # {stage: LatencyHistogram}
+        self.tasks = {}       # {task_id: {"start": t0, "last": t}} (dicts keep insertion order)
+        self.max_tasks = max_tasks
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    def start(self, task_id):
+        """Begin timing a task"""
+        now = self.clock()
+        with self.lock:
+            if len(self.tasks) >= self.max_tasks:
+                self.tasks.pop(next(iter(self.tasks)))
+            self.tasks[task_id] = {"start": now, "last": now}
+
+    def mark(self, task_id, stage):
+        """Close the current stage of a task and record how long it took"""
+        now = self.clock()
+        with self.lock:
+            timing = self.tasks.get(task_id)
+            if timing is None:
+                return None
+            elapsed = now - timing["last"]
+            timing["last"] = now
+            self._record(stage, elapsed)
+        return elapsed
+
+    def elapsed(self, task_id):
+        """Seconds since the task started, or None if it is not being tracked"""
+        with self.lock:
+            timing = self.tasks.get(task_id)
+            return self.clock() - timing["start"] if timing else None
+
+    def record(self, stage, seconds):
+        """Record a duration measured elsewhere (e.g. reported by a device)"""
+        with self.lock:
+            self._record(stage, seconds)
+
+    def finish(self, task_id, stage="end_to_end"):
+        """Record the task's total time and stop tracking it"""
+        now = self.clock()
+        with self.lock:
+            timing = self.tasks.pop(task_id, None)
+            if timing is None:
+                return None
+            total = now - timing["start"]
+            self._record(stage, total)
+        return total
+
+    def discard(self, task_id):
+        """Stop tracking a task that will never finish (no bids, send failure)"""
+        with self.lock:
+            self.tasks.pop(task_id, None)
+
+    def _record(self, stage, seconds):
+        hist = self.histograms.get(stage)
+        if hist is None:
+            hist = self.histograms[stage] = LatencyHistogram()
+        hist.record(seconds)
+
+    def snapshot(self):
+        """{stage: {count, mean, p50, p95, p99, max}} in seconds"""
+        with self.lock:
+            return {stage: hist.summary() for stage, hist in self.histograms.items()}
+
+    def format_table(self, snapshot=None):
+        """Render a snapshot as a fixed-width table in milliseconds"""
+        snapshot = self.snapshot() if snapshot is None else snapshot
+        lines = [f"{'stage':<18} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for stage, s in snapshot.items():
+            lines.append(f"{stage:<18} {s['count']:>7} {s['p50']*1000:>9.1f} {s['p95']*1000:>9.1f} "
+                         f"{s['p99']*1000:>9.1f} {s['max']*1000:>9.1f}")
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise per-stage latencies recorded by the device scripts")
+    parser.add_argument("files", nargs="*", help="CSV files of task,stage,ms (stdin if omitted)")
+    args = parser.parse_args()
+
+    tracker = LatencyTracker()
+    sources = [open(f, encoding="utf-8", errors="ignore") for f in args.files] or [sys.stdin]
+    for source in sources:
+        for line in source:
+            parts = line.strip().split(",")
+            if len(parts) != 3:
+                continue
+            try:
+                tracker.record(parts[1], float(parts[2]) / 1000.0)
+            except ValueError:
+                continue
+    print(tracker.format_table())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Discounted Multi-LinUCB, mirroring v5p/device_scripts/multi_linucb_solver.c
+Predicts TTFT and stream speed from [1, cpu/100, ram/100, prompt_len/1000] and
+scores Latency = TTFT + tokens / speed - alpha * uncertainty (lower is better).
+Each update discounts A and b by gamma so old observations fade, and A_inv is
+kept current with Sherman-Morrison. Used by the simulator and offline tools so
+they score exactly like the devices.
+"""
+
+import math
+
+from features import SOLVER_FEATURE_VERSION as FEATURE_VERSION, featurise_one
+
+DIM = 4
+ALPHA = 0.5
+GAMMA = 0.995
+LAMBDA_FLOOR = 1.0
+REFRESH_EVERY = 256
+ERR_WEIGHT = 0.2
+SLOWDOWN_MIN = 0.5
+SLOWDOWN_MAX = 4.0
+
+# Lab warm start, identical to A_init / b_*_init in the C solver
+A_INIT = [
+    [2913.000000, 1424.420000, 1426.100000, 553.260000],
+    [1424.420000, 948.489600, 696.370400, 273.258900],
+    [1426.100000, 696.370400, 952.864800, 270.945720],
+    [553.260000, 273.258900, 270.945720, 141.763110],
+]
+B_TTFT_INIT = [50352.775448, 29158.869048, 24677.918716, 11773.252430]
+B_SPEED_INIT = [18712.935297, 7022.409791, 9165.157313, 3868.617305]
+
+
+def features(cpu, ram, prompt_len):
+    """Feature vector from RAW values (cpu/ram 0-100, prompt length in characters), built by features.py"""
+    return featurise_one(FEATURE_VERSION, cpu_load=cpu, ram_load=ram, prompt_length=prompt_len)
+
+
+def invert(A):
+    """Gauss-Jordan inverse of a small square matrix; None if singular"""
+    n = len(A)
+    m = [list(row) + [1.0 if i == j else 0.0 for j in range(n)] for i, row in enumerate(A)]
+    for i in range(n):
+        pivot = m[i][i]
+        if abs(pivot) < 1e-9:
+            return None
+        m[i] = [v / pivot for v in m[i]]
+        for k in range(n):
+            if k != i:
+                factor = m[k][i]
+                if factor:
+                    m[k] = [a - factor * b for a, b in zip(m[k], m[i])]
+    return [row[n:] for row in m]
+
+
+class DiscountedLinUCB:
+    def __init__(self, alpha=ALPHA, gamma=GAMMA, A=None, b_ttft=None, b_speed=None):
+        """
+        Args:
+            alpha: Exploration weight on the uncertainty term
+            gamma: Forgetting factor per update (1.0 = never forget)
+            A, b_ttft, b_speed: Prior; defaults to the lab warm start scaled to one window
+        """
+        self.alpha = alpha
+        self.gamma = gamma
+        if A is None:
+            scale = 1.0
+            if gamma < 1.0 and A_INIT[0][0] > 1.0 / (1.0 - gamma):
+                scale = (1.0 / (1.0 - gamma)) / A_INIT[0][0]
+            A = [[v * scale for v in row] for row in A_INIT]
+            b_ttft = [v * scale for v in B_TTFT_INIT]
+            b_speed = [v * scale for v in B_SPEED_INIT]
+        self.A = [list(row) for row in A]
+        self.A_inv = invert(self.A)
+        self.b_ttft = list(b_ttft)
+        self.b_speed = list(b_speed)
+        self.updates = 0
+        self.err_ttft = 0.0
+        self.err_speed = 0.0
+        self.slowdown = 1.0
+
+    def predict(self, x):
+        """(ttft, speed, uncertainty) from the model alone, without slowdown correction"""
+        A_inv_x = [sum(self.A_inv[i][j] * x[j] for j in range(DIM)) for i in range(DIM)]
+        ttft = sum(a * b for a, b in zip(A_inv_x, self.b_ttft))
+        speed = sum(a * b for a, b in zip(A_inv_x, self.b_speed))
+        uncertainty = math.sqrt(abs(sum(a * b for a, b in zip(x, A_inv_x))))
+        return ttft, speed, uncertainty
+
+    def predict_latency(self, cpu, ram, prompt_len, tokens):
+        """(expected latency in seconds, uncertainty)"""
+        ttft, speed, uncertainty = self.predict(features(cpu, ram, prompt_len))
+        return ttft * self.slowdown + tokens / max(speed, 0.1), uncertainty
+
+    def score(self, cpu, ram, prompt_len, tokens):
+        """Lower confidence bound on latency; the lowest bid wins"""
+        latency, uncertainty = self.predict_latency(cpu, ram, prompt_len, tokens)
+        return latency - self.alpha * uncertainty
+
+    def update(self, cpu, ram, prompt_len, actual_ttft, actual_speed):
+        """Discounted rank-one update; returns the (ttft, speed) error of the pre-update prediction"""
+        x = features(cpu, ram, prompt_len)
+        pred_ttft, pred_speed, _ = self.predict(x)
+        err_ttft = abs(pred_ttft * self.slowdown - actual_ttft)
+        err_speed = abs(pred_speed - actual_speed)
+        if self.updates == 0:
+            self.err_ttft, self.err_speed = err_ttft, err_speed
+        else:
+            self.err_ttft += ERR_WEIGHT * (err_ttft - self.err_ttft)
+            self.err_speed += ERR_WEIGHT * (err_speed - self.err_speed)
+        if pred_ttft > 0.1:
+            self.slowdown += ERR_WEIGHT * (actual_ttft / pred_ttft - self.slowdown)
+            self.slowdown = min(max(self.slowdown, SLOWDOWN_MIN), SLOWDOWN_MAX)
+
+        g = self.gamma
+        for i in range(DIM):
+            for j in range(DIM):
+                self.A[i][j] = g * self.A[i][j] + x[i] * x[j]
+                self.A_inv[i][j] /= g
+            self.b_ttft[i] = g * self.b_ttft[i] + x[i] * actual_ttft
+            self.b_speed[i] = g * self.b_speed[i] + x[i] * actual_speed
+
+        Mx = [sum(self.A_inv[i][j] * x[j] for j in range(DIM)) for i in range(DIM)]
+        denom = 1.0 + sum(a * b for a, b in zip(x, Mx))
+        for i in range(DIM):
+            for j in range(DIM):
+                self.A_inv[i][j] -= Mx[i] * Mx[j] / denom
+
+        self.updates += 1
+        refresh = self.updates % REFRESH_EVERY == 0
+        for i in range(DIM):
+            if self.A[i][i] < LAMBDA_FLOOR:
+                self.A[i][i] = LAMBDA_FLOOR
+                refresh = True
+        if refresh:
+            self.A_inv = invert(self.A)
+        return err_ttft, err_speed
+
+    def to_dict(self):
+        return {"feature_version": FEATURE_VERSION, "alpha": self.alpha, "gamma": self.gamma, "A": self.A, "b_ttft": self.b_ttft, "b_speed": self.b_speed,
+                "updates": self.updates, "err_ttft": self.err_ttft, "err_speed": self.err_speed, "slowdown": self.slowdown}
+
+    @classmethod
+    def from_dict(cls, state):
+        if state.get("feature_version", 1) != FEATURE_VERSION:
+            raise ValueError(f"Model state uses feature version {state['feature_version']}, expected {FEATURE_VERSION}")
+        model = cls(state["alpha"], state["gamma"], state["A"], state["b_ttft"], state["b_speed"])
+        model.updates = state.get("updates", 0)
+        model.err_ttft = state.get("err_ttft", 0.0)
+        model.err_speed = state.get("err_speed", 0.0)
+        model.slowdown = state.get("slowdown", 1.0)
+        return model
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Prometheus-style /metrics endpoint for the hub orchestrator
+Exports per-device gauges from the latest status, auction/bid counters and the
+per-stage latency summaries. Scrapes copy the registry under the orchestrator
+lock and render outside it; the rendered page is cached for cache_seconds so a
+burst of scrapers costs one render.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# (name, help) for each counter family kept in orchestrator.counters
+COUNTERS = [
+    ("orchestrator_bid_requests_sent_total", "Bid requests sent, per device"),
+    ("orchestrator_bids_received_total", "Bids received, per device"),
+    ("orchestrator_auctions_total", "Auctions finished, by outcome"),
+    ("orchestrator_auction_wins_total", "Auctions won, per device"),
+    ("orchestrator_results_total", "Task results received, per device and status"),
+    ("orchestrator_sends_dropped_total", "Outbound messages not delivered, per device and reason"),
+    ("orchestrator_devices_suspected_total", "Times the failure detector suspected a device"),
+    ("orchestrator_devices_evicted_total", "Devices removed by the failure detector"),
+    ("orchestrator_device_redirects_total", "Devices sent to the shard that owns them"),
+    ("orchestrator_shard_offloads_total", "Tasks handed to a peer shard with free devices"),
+]
+
+
+def label_str(labels):
+    """Render [(key, value)] as {key="value",...}, escaped per the exposition format"""
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def collect(orchestrator):
+    """Copy everything the page needs; the registry lock is held only for the device copy"""
+    devices = []
+    with orchestrator.lock:
+        for device_id, info in orchestrator.devices.items():
+            metrics = info.get("metrics", {})
+            devices.append((device_id, info.get("has_npu", False), metrics.get("cpu_load"), metrics.get("battery"),
+                            metrics.get("ram", {}).get("usage_percent"), metrics.get("storage", {}).get("free_gb"),
+                            getattr(info.get("conn"), "queued_bytes", None),
+                            orchestrator.failure_detector.phi(device_id) if info.get("heartbeats") else None))
+        pending = len(orchestrator.pending_bids)
+    return {
+        "devices": devices,
+        "pending_auctions": pending,
+        "in_flight": len(orchestrator.latency.tasks),
+        "counters": orchestrator.counter_snapshot(),
+        "latency": orchestrator.latency.snapshot(),
+        "prediction_error": orchestrator.prediction_error.snapshot(),
+        "accuracy": orchestrator.accuracy.snapshot(),
+    }
+
+
+def summary_lines(name, help_text, label, summaries):
+    """Render {label_value: LatencyHistogram.summary()} as one Prometheus summary family"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+    for key, s in summaries.items():
+        for q, quantile in (("p50", "0.5"), ("p95", "0.95"), ("p99", "0.99")):
+            lines.append(f"{name}{label_str([(label, key), ('quantile', quantile)])} {s[q]:.6f}")
+        lines.append(f"{name}_sum{label_str([(label, key)])} {s['mean'] * s['count']:.6f}")
+        lines.append(f"{name}_count{label_str([(label, key)])} {s['count']}")
+    return lines
+
+
+def render(snapshot):
+    """Render a collect() snapshot in the Prometheus text exposition format"""
+    lines = []
+
+    gauges = [
+        ("device_cpu_load", "CPU load reported by the device (0-1)", 2),
+        ("device_battery_percent", "Battery level reported by the device", 3),
+        ("device_ram_usage_percent", "RAM usage reported by the device", 4),
+        ("device_storage_free_gb", "Free storage reported by the device", 5),
+        ("device_send_queue_bytes", "Bytes queued for the device but not yet written", 6),
+        ("device_failure_phi", "Failure detector suspicion level (heartbeating devices only)", 7),
+    ]
+    lines += ["# HELP device_has_npu Whether the device registered an NPU", "# TYPE device_has_npu gauge"]
+    for dev in snapshot["devices"]:
+        lines.append(f"device_has_npu{label_str([('device', dev[0])])} {1 if dev[1] else 0}")
+    for name, help_text, col in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for dev in snapshot["devices"]:
+            if isinstance(dev[col], (int, float)):
+                lines.append(f"{name}{label_str([('device', dev[0])])} {dev[col]}")
+
+    lines += ["# HELP orchestrator_devices Registered devices", "# TYPE orchestrator_devices gauge",
+              f"orchestrator_devices {len(snapshot['devices'])}",
+              "# HELP orchestrator_pending_auctions Auctions waiting for their bid window to close",
+              "# TYPE orchestrator_pending_auctions gauge",
+              f"orchestrator_pending_auctions {snapshot['pending_auctions']}",
+              "# HELP orchestrator_tasks_in_flight Tasks started but not yet finished",
+              "# TYPE orchestrator_tasks_in_flight gauge",
+              f"orchestrator_tasks_in_flight {snapshot['in_flight']}"]
+
+    counters = snapshot["counters"]
+    for name, help_text in COUNTERS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"{name}{label_str(labels)} {value}")
+
+    lines += summary_lines("orchestrator_stage_seconds", "Per-stage task latency", "stage", snapshot["latency"])
+    lines += summary_lines("orchestrator_prediction_error_seconds", "Absolute error of the winning bid's predicted latency",
+                           "device", snapshot["prediction_error"])
+
+    accuracy = [
+        ("orchestrator_prediction_mae_seconds", "gauge", "Rolling mean absolute latency residual", "mae_latency"),
+        ("orchestrator_prediction_bias_seconds", "gauge", "Rolling mean of actual minus predicted latency", "bias_latency"),
+        ("orchestrator_prediction_lcb_coverage", "gauge", "Share of recent outcomes at or above the bid's lower bound", "lcb_coverage"),
+        ("orchestrator_prediction_band_coverage", "gauge", "Share of recent outcomes within the bid's uncertainty band", "band_coverage"),
+        ("orchestrator_prediction_drift_alarms_total", "counter", "Drift alarms raised", "alarms"),
+    ]
+    for name, kind, help_text, key in accuracy:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for (device, backend), s in sorted(snapshot["accuracy"].items()):
+            if s[key] is not None:
+                lines.append(f"{name}{label_str([('device', device), ('backend', backend)])} {s[key]:.6g}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, orchestrator, host='0.0.0.0', port=9100, cache_seconds=1.0):
+        self.orchestrator = orchestrator
+        self.cache_seconds = cache_seconds
+        self.cached = (float("-inf"), b"")
+        self.render_lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = server.page()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would drown the console
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    def page(self):
+        """Rendered metrics, re-rendered at most once per cache_seconds"""
+        with self.render_lock:
+            rendered_at, body = self.cached
+            if time.monotonic() - rendered_at >= self.cache_seconds:
+                body = render(collect(self.orchestrator)).encode()
+                self.cached = (time.monotonic(), body)
+            return body
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Metrics on http://{self.httpd.server_address[0]}:{self.httpd.server_address[1]}/metrics")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Latency model registry keyed by (device, backend)
+Devices push their Multi-LinUCB state as one compact line (multilin export);
+the registry keeps the latest state per device and backend and answers with
+the fleet prior for that backend: the average of every device's discounted
+statistics, scaled down to prior_weight observations. Devices install it with
+"multilin prior" and start from it on first run or reset, so a new phone bids
+from the fleet's experience instead of the lab phone's, and keeps learning its
+own curve from there.
+
+    python3 model_registry.py serve --port 5005
+    python3 model_registry.py show
+"""
+
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+from linucb import DIM, DiscountedLinUCB
+
+SYNC_TAG = "ML1"
+REGISTRY_PORT = 5005
+PRIOR_WEIGHT = 20.0  # A fleet prior counts as this many observations
+
+
+def encode_state(model, backend):
+    """Compact line matching multi_linucb_solver.c's export format"""
+    fields = [SYNC_TAG, backend, f"{model.gamma:.6g}", str(model.updates), f"{model.err_ttft:.6g}",
+              f"{model.err_speed:.6g}", f"{model.slowdown:.6g}"]
+    fields += [f"{model.A[i][j]:.9g}" for i in range(DIM) for j in range(i, DIM)]
+    fields += [f"{v:.9g}" for v in model.b_ttft + model.b_speed]
+    return ",".join(fields)
+
+
+def decode_state(line):
+    """(backend, DiscountedLinUCB) from a compact line; raises ValueError if malformed"""
+    fields = line.strip().split(",")
+    if len(fields) != 7 + DIM * (DIM + 1) // 2 + 2 * DIM or fields[0] != SYNC_TAG:
+        raise ValueError(f"not a {SYNC_TAG} state line")
+    backend = fields[1]
+    gamma, updates, err_ttft, err_speed, slowdown = (float(fields[2]), int(fields[3]), float(fields[4]),
+                                                     float(fields[5]), float(fields[6]))
+    values = [float(v) for v in fields[7:]]
+    A = [[0.0] * DIM for _ in range(DIM)]
+    for i in range(DIM):
+        for j in range(i, DIM):
+            A[i][j] = A[j][i] = values.pop(0)
+    b_ttft, b_speed = values[:DIM], values[DIM:]
+    model = DiscountedLinUCB(gamma=gamma, A=A, b_ttft=b_ttft, b_speed=b_speed)
+    if model.A_inv is None:
+        raise ValueError("singular A")
+    model.updates, model.err_ttft, model.err_speed, model.slowdown = updates, err_ttft, err_speed, slowdown
+    return backend, model
+
+
+class ModelRegistry:
+    def __init__(self, path="model_registry.json", prior_weight=PRIOR_WEIGHT):
+        """
+        Args:
+            path: JSON file the registry is persisted to (None keeps it in memory)
+            prior_weight: How many observations the fleet prior is worth
+        """
+        self.path = path
+        self.prior_weight = prior_weight
+        self.models = {}  # {(device, backend): {"model": DiscountedLinUCB, "seen": unix time}}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def update(self, device, line):
+        """Store a device's exported state; returns its backend"""
+        backend, model = decode_state(line)
+        with self.lock:
+            self.models[(device, backend)] = {"model": model, "seen": time.time()}
+        return backend
+
+    def fleet_prior(self, backend, exclude=None):
+        """Average statistics of every device on this backend, scaled to prior_weight; None if none yet"""
+        with self.lock:
+            # A model with no updates is only the prior it started from (devices push at
+            # startup); counting it would pull the fleet back toward the lab warm start
+            models = [entry["model"] for (device, b), entry in self.models.items()
+                      if b == backend and device != exclude and entry["model"].updates > 0]
+        if not models:
+            return None
+        A = [[0.0] * DIM for _ in range(DIM)]
+        b_ttft = [0.0] * DIM
+        b_speed = [0.0] * DIM
+        for model in models:
+            # Normalise each device to unit weight so a busy device does not dominate
+            weight = 1.0 / (len(models) * max(model.A[0][0], 1e-9))
+            for i in range(DIM):
+                for j in range(DIM):
+                    A[i][j] += model.A[i][j] * weight
+                b_ttft[i] += model.b_ttft[i] * weight
+                b_speed[i] += model.b_speed[i] * weight
+        scale = self.prior_weight
+        prior = DiscountedLinUCB(gamma=models[0].gamma, A=[[v * scale for v in row] for row in A],
+                                 b_ttft=[v * scale for v in b_ttft], b_speed=[v * scale for v in b_speed])
+        return prior if prior.A_inv is not None else None
+
+    def model(self, device, backend):
+        """The device's own model, or a fresh one from the fleet prior (lab warm start if no fleet yet)"""
+        with self.lock:
+            entry = self.models.get((device, backend))
+        if entry:
+            return entry["model"]
+        return self.fleet_prior(backend) or DiscountedLinUCB()
+
+    def handle(self, message):
+        """MODEL_STATE|device:X|state:<line> -> MODEL_PRIOR|backend:B|state:<line or none>"""
+        fields = dict(part.split(":", 1) for part in message.strip().split("|")[1:] if ":" in part)
+        if not message.startswith("MODEL_STATE") or "device" not in fields or "state" not in fields:
+            return "MODEL_ERROR|reason:expected MODEL_STATE|device:...|state:..."
+        try:
+            backend = self.update(fields["device"], fields["state"])
+        except ValueError as e:
+            return f"MODEL_ERROR|reason:{e}"
+        prior = self.fleet_prior(backend, exclude=fields["device"])
+        self.save()
+        return f"MODEL_PRIOR|backend:{backend}|state:{encode_state(prior, backend) if prior else 'none'}"
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = [{"device": device, "backend": backend, "seen": entry["seen"], "model": entry["model"].to_dict()}
+                    for (device, backend), entry in self.models.items()]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        with self.lock:
+            for item in data:
+                self.models[(item["device"], item["backend"])] = {
+                    "model": DiscountedLinUCB.from_dict(item["model"]), "seen": item["seen"]}
+
+    def format_table(self):
+        lines = [f"{'device':<16} {'backend':<8} {'updates':>8} {'eff_n':>7} {'err_ttft':>9} {'slowdown':>9} {'age s':>7}"]
+        now = time.time()
+        with self.lock:
+            items = sorted(self.models.items())
+        for (device, backend), entry in items:
+            m = entry["model"]
+            lines.append(f"{device:<16} {backend:<8} {m.updates:>8} {m.A[0][0]:>7.1f} {m.err_ttft:>9.3f} "
+                         f"{m.slowdown:>9.2f} {now - entry['seen']:>7.0f}")
+        return "\n".join(lines)
+
+
+def serve(registry, host, port):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline(8192).decode(errors="ignore")
+            if not line.strip():
+                return
+            reply = registry.handle(line)
+            self.wfile.write((reply + "\n").encode())
+            print(f"🧠 {line.split('|')[1] if '|' in line else '?'} -> {reply[:60]}")
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((host, port), Handler) as server:
+        print(f"Model registry listening on {host}:{port} ({len(registry.models)} models loaded)")
+        server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-device, per-backend Multi-LinUCB model registry")
+    parser.add_argument("command", choices=["serve", "show"])
+    parser.add_argument("--path", default="model_registry.json")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=REGISTRY_PORT)
+    parser.add_argument("--prior-weight", type=float, default=PRIOR_WEIGHT)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.path, args.prior_weight)
+    if args.command == "show":
+        print(registry.format_table())
+        return 0
+    try:
+        serve(registry, args.host, args.port)
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,27 +2,99 @@ import socket
 import threading
 import json
 import base64
-import cv2
-import numpy as np
 import uuid
 import time
 import random
+from collections import Counter
+
+from accuracy import AccuracyTracker
+from conn_writer import ConnWriter
+from event_log import EventLogger
+from failure_detector import PhiAccrualDetector, enable_keepalive
+from latency import LatencyTracker
+from metrics_server import MetricsServer
+from snpe_postprocess import parse_postprocess_line
 
 class Orchestrator:
-    def __init__(self, host='0.0.0.0', port=8080):
+    def __init__(self, host='0.0.0.0', port=8080, log_path="orchestrator_events.jsonl", bind=True):
         self.devices = {}  # {deviceId: {"has_npu", "capabilities", "metrics", "conn"}}
         self.scores = {}   # For EdgeMLBalancer integration
         self.logs = []     # Historical metrics
-        self.task_map = {"classify": ["A", "B"], "segment": ["A"]}
+        self.capability_index = {}  # {subtask: set(deviceId)} - devices able to bid on each subtask
+        self.lock = threading.RLock()  # Guards devices and capability_index across client threads
         self.pending_bids = {}  # {task_id: {"image_data": base64, "bids": {device_id: bid_data}}}
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server.bind((host, port))
-        self.server.listen(5)
-        print(f"Listening on {host}:{port}")
+        self.log = EventLogger(path=log_path)  # Request-path logging; never blocks on stdout/disk
+        self.latency = LatencyTracker()  # Per-stage histograms, keyed through each task_id
+        self.prediction_error = LatencyTracker()  # Per-device |predicted - actual| latency of winning bids
+        self.task_predictions = {}  # {task_id: (winner, predicted_latency, uncertainty, backend)} until the result arrives
+        self.result_callbacks = {}  # {task_id: fn(result data)}, called once when the task's result (or failure) is in
+        self.assignments = {}  # {task_id: device_id} from the moment a device is given a task until complete_task
+        self.accuracy = AccuracyTracker(log=self.log)  # Rolling error, calibration and drift alarms per device
+        self.counters = Counter()  # {(name, ((label, value), ...)): count}, exported on /metrics
+        self.counters_lock = threading.Lock()
+        self.bid_window = 5.0  # Seconds to collect bids before evaluating
+        self.preprocessor = None  # Optional image_pipeline.ImagePipeline; winners then get a ready tensor
+        self.batch_window = 0.0  # Seconds to hold classify tasks per device and send them as one batch (0 disables)
+        self.batch_max = 16      # A device's batch goes out as soon as it holds this many tasks
+        self.batches = {}        # {device_id: {"id": batch_id, "items": [(task_id, task_data)]}} waiting to be sent
+        self.send_queue_bytes = 4 * 1024 * 1024  # Per-connection outbound queue limit (see conn_writer)
+        self.send_overflow = "drop"              # "drop" refuses messages to a full queue, "disconnect" drops the device
+        self.send_stall_timeout = 15.0           # Seconds a device may accept no bytes at all before it is dropped
+        self.failure_detector = PhiAccrualDetector()  # Fed by every message; judges devices that send heartbeats
+        self.suspected = set()       # Devices past the phi threshold; left out of auctions until they are heard from
+        self.evict_after = 15.0      # Seconds of silence before a heartbeating device is dropped from the registry
+        self.failure_check_interval = 0.5
+        self.shards = None  # Optional sharding.ShardCoordinator when several orchestrators split the fleet
+        self.server = None
+        if bind:  # The fleet simulator drives process_message directly without a socket
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # A hub restarted after a crash rebinds at once instead of waiting out TIME_WAIT
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server.bind((host, port))
+            self.server.listen(5)
+            print(f"Listening on {host}:{port}")
+
+    def schedule(self, delay, fn, *args):
+        """Run fn(*args) after delay seconds (replaced by the simulator's virtual clock)"""
+        threading.Timer(delay, fn, args=args).start()
 
     def is_overloaded(self, device):
         metrics = self.devices.get(device, {}).get("metrics", {})
         return metrics.get("cpu_load", 0) > 0.8 or metrics.get("battery", 100) < 20
+
+    def index_device(self, device_id, capabilities):
+        """Add a device to the capability index under each subtask it supports"""
+        with self.lock:
+            self.unindex_device(device_id)
+            for subtask in capabilities:
+                self.capability_index.setdefault(subtask, set()).add(device_id)
+
+    def unindex_device(self, device_id):
+        """Remove a device from every subtask in the capability index"""
+        with self.lock:
+            for subtask in list(self.capability_index):
+                eligible = self.capability_index[subtask]
+                eligible.discard(device_id)
+                if not eligible:
+                    del self.capability_index[subtask]
+
+    def busy_devices(self):
+        """Devices with a task whose result is not in yet, or with a batch still waiting to be sent"""
+        with self.lock:
+            return set(self.assignments.values()) | set(self.batches)
+
+    def eligible_devices(self, subtask, skip_overloaded=True):
+        """Return the device IDs that can bid on a subtask.
+
+        Suspected devices are always left out. With skip_overloaded, devices
+        whose latest metrics mark them as overloaded are left out too, so the
+        bid round only contacts viable devices.
+        """
+        with self.lock:
+            candidates = [d for d in self.capability_index.get(subtask, ()) if d not in self.suspected]
+            if skip_overloaded:
+                candidates = [d for d in candidates if not self.is_overloaded(d)]
+            return candidates
     
     def print_device_metrics(self, device_id):
         """Print device metrics in a formatted way"""
@@ -75,9 +147,75 @@ class Orchestrator:
             storage_bar = self.get_progress_bar(storage_percent, 30)
             print(f"│ Storage:         {storage_bar} {storage_free:5.1f}/{storage_total:5.1f} GB free{' '*7}│")
         
-    print(f"└{'─'*78}┘")
-    print()
+        print(f"└{'─'*78}┘")
+        print()
     
+    def apply_metrics_delta(self, metrics, delta):
+        """Merge a status delta into a metrics dict in place (nested dicts are merged key by key)"""
+        for key, value in delta.items():
+            if isinstance(value, dict) and isinstance(metrics.get(key), dict):
+                self.apply_metrics_delta(metrics[key], value)
+            else:
+                metrics[key] = value
+
+    def request_keyframe(self, device_id):
+        """Ask a device for a full status snapshot after a gap in its delta stream"""
+        request = {"type": "status_request", "agent_id": "orchestrator", "task_id": "", "subtask": "", "data": {}}
+        try:
+            self.devices[device_id]["conn"].send(json.dumps(request).encode())
+        except Exception as e:
+            self.log.warn("keyframe_request_failed", f"Failed to request status keyframe from {device_id}: {e}", device=device_id)
+
+    def note_alive(self, device_id):
+        """Any message from a device is a heartbeat; a suspected device that speaks is back in the auctions"""
+        self.failure_detector.heartbeat(device_id)
+        if device_id in self.suspected:
+            self.suspected.discard(device_id)
+            self.log.info("device_recovered", f"{device_id} is responding again", device=device_id)
+
+    def watch_devices(self):
+        """Suspect heartbeating devices whose phi crosses the threshold and evict those silent for evict_after"""
+        while True:
+            time.sleep(self.failure_check_interval)
+            with self.lock:
+                watched = [d for d, info in self.devices.items() if info.get("heartbeats")]
+            for device_id in watched:
+                silence = self.failure_detector.silence(device_id)
+                if silence is None:
+                    continue
+                if silence >= self.evict_after:
+                    self.evict_device(device_id, f"no heartbeat for {silence:.1f}s")
+                elif device_id not in self.suspected and not self.failure_detector.is_available(device_id):
+                    self.suspected.add(device_id)
+                    self.count("orchestrator_devices_suspected_total", device=device_id)
+                    self.log.warn("device_suspected", f"{device_id} silent for {silence:.1f}s, leaving it out of auctions",
+                                  device=device_id, silence=round(silence, 2),
+                                  phi=round(self.failure_detector.phi(device_id), 2))
+
+    def evict_device(self, device_id, reason):
+        """Drop a dead device from the registry and close its connection"""
+        with self.lock:
+            device_info = self.devices.pop(device_id, None)
+            self.unindex_device(device_id)
+        self.suspected.discard(device_id)
+        self.failure_detector.remove(device_id)
+        if device_info is None:
+            return
+        self.count("orchestrator_devices_evicted_total", device=device_id)
+        self.log.warn("device_evicted", f"Evicted {device_id}: {reason}", device=device_id, reason=reason)
+        if isinstance(device_info["conn"], ConnWriter):
+            device_info["conn"].close()  # Already logged; the reader thread sees EOF and exits
+
+    def count(self, name, **labels):
+        """Increment a metrics counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.counters_lock:
+            self.counters[key] += 1
+
+    def counter_snapshot(self):
+        with self.counters_lock:
+            return dict(self.counters)
+
     def get_progress_bar(self, value, width=30):
         """Generate a progress bar string"""
         filled = int(value * width)
@@ -88,18 +226,24 @@ class Orchestrator:
     def accept_connections(self):
         while True:
             conn, addr = self.server.accept()
-            print(f"New connection from {addr}")
+            self.log.info("connection_opened", f"New connection from {addr}", addr=str(addr))
             threading.Thread(target=self.handle_client, args=(conn,)).start()
 
     import random
     def handle_client(self, conn):
         buffer = ""
+        enable_keepalive(conn)  # Catches peers that vanish without ever sending heartbeats
+        # Everything sent to this device goes through its own queue and writer thread
+        writer = ConnWriter(conn, max_bytes=self.send_queue_bytes, overflow=self.send_overflow,
+                            stall_timeout=self.send_stall_timeout, log=self.log,
+                            on_drop=lambda reason: self.count("orchestrator_sends_dropped_total",
+                                                              device=writer.name, reason=reason))
         random_battery = random.randint(10, 100)  # Generate once per connection
         while True:
             try:
                 data = conn.recv(4096).decode()
                 if not data:
-                    print("Connection closed")
+                    self.log.info("connection_closed", "Connection closed")
                     break
                 buffer += data
                 # Try to parse complete JSON messages
@@ -111,57 +255,108 @@ class Orchestrator:
                         # Inject random battery into registration/status metrics
                         if msg.get("type") in ("register", "status") and "metrics" in msg.get("data", {}):
                             msg["data"]["metrics"]["battery"] = random_battery
-                        self.process_message(msg, conn)
+                        elif msg.get("type") == "status_delta" and "battery" in msg.get("data", {}).get("delta", {}):
+                            msg["data"]["delta"]["battery"] = random_battery
+                        self.process_message(msg, writer)
                     except json.JSONDecodeError:
                         break
             except Exception as e:
-                print(f"Error in handle_client: {e}")
+                self.log.error("client_error", f"Error in handle_client: {e}")
                 break
+        writer.close()
         conn.close()
-        for dev_id in list(self.devices.keys()):
-            if self.devices[dev_id]["conn"] == conn:
-                del self.devices[dev_id]
-                print(f"Removed {dev_id} from registry")
+        with self.lock:
+            for dev_id in list(self.devices.keys()):
+                if self.devices[dev_id]["conn"] == writer:
+                    del self.devices[dev_id]
+                    self.unindex_device(dev_id)
+                    self.suspected.discard(dev_id)
+                    self.failure_detector.remove(dev_id)
+                    self.log.info("device_removed", f"Removed {dev_id} from registry", device=dev_id)
     
     def process_message(self, msg, conn):
         """Process a complete JSON message"""
+        if msg["type"].startswith("shard_"):
+            if self.shards is not None:
+                self.shards.handle_message(msg, conn)
+            return
         device_id = msg.get("agent_id") or msg["data"].get("deviceId")
+        if device_id in self.devices:
+            self.note_alive(device_id)
         
         if msg["type"] == "register":
-            self.devices[device_id] = {
-                "has_npu": msg["data"]["hasNpu"],
-                "capabilities": msg["data"]["capabilities"],
-                "metrics": msg["data"]["metrics"],
-                "conn": conn
-            }
+            if self.shards is not None and self.shards.redirect_if_foreign(device_id, conn):
+                return
+            if isinstance(conn, ConnWriter):
+                conn.name = device_id
+            with self.lock:
+                self.devices[device_id] = {
+                    "has_npu": msg["data"]["hasNpu"],
+                    "capabilities": msg["data"]["capabilities"],
+                    "metrics": msg["data"]["metrics"],
+                    "status_seq": 0,
+                    "conn": conn
+                }
+                self.index_device(device_id, msg["data"]["capabilities"])
+            self.note_alive(device_id)
             print(f"\n{'='*80}")
             print(f"✅ NEW DEVICE REGISTERED: {device_id}")
             print(f"{'='*80}")
             self.print_device_metrics(device_id)
             
         elif msg["type"] == "status":
+            # Full keyframe; the table is rendered by the periodic summary, not here
+            if device_id in self.devices:
+                with self.lock:
+                    self.devices[device_id]["metrics"] = msg["data"]["metrics"]
+                    self.devices[device_id]["status_seq"] = msg["data"].get("seq", 0)
+                    self.devices[device_id]["keyframe_pending"] = False
+                    if "capabilities" in msg["data"]:
+                        self.devices[device_id]["capabilities"] = msg["data"]["capabilities"]
+                        self.index_device(device_id, msg["data"]["capabilities"])
+        elif msg["type"] == "status_delta":
+            # Only the fields that moved past the device's threshold; apply in place
             if device_id in self.devices:
-                self.devices[device_id]["metrics"] = msg["data"]["metrics"]
-                print(f"\n📊 STATUS UPDATE: {device_id}")
-                self.print_device_metrics(device_id)
+                seq = msg["data"].get("seq", 0)
+                with self.lock:
+                    device_info = self.devices[device_id]
+                    expected = device_info.get("status_seq", 0) + 1
+                    in_order = seq == expected
+                    if in_order:
+                        self.apply_metrics_delta(device_info["metrics"], msg["data"].get("delta", {}))
+                        device_info["status_seq"] = seq
+                    needs_keyframe = not in_order and not device_info.get("keyframe_pending")
+                    if needs_keyframe:
+                        device_info["keyframe_pending"] = True
+                if needs_keyframe:
+                    self.log.warn("status_gap", f"Status delta gap from {device_id} (expected {expected}, got {seq}), requesting keyframe",
+                                  device=device_id, expected=expected, seq=seq)
+                    self.request_keyframe(device_id)
         elif msg["type"] == "image":
             # Image received from device, initiate bidding process
-            print(f"Image received from {device_id}")
+            self.log.info("image_received", f"Image received from {device_id}", device=device_id)
             self.handle_image_received(device_id, msg["data"])
         elif msg["type"] == "bid":
             # Bid received from device
-            print(f"Bid received from {device_id}: {msg['data']}")
+            self.log.debug("bid_raw", device=device_id, task_id=msg.get("task_id"), data=msg["data"])
             self.handle_bid_received(device_id, msg)
         elif msg["type"] == "result":
-            print(f"Result from {device_id}: {msg['data']}")
+            self.log.debug("result_raw", device=device_id, task_id=msg.get("task_id"), data=msg["data"])
             
             # Handle classification results specifically
             if msg['data'].get('status') == 'classification_complete':
                 classification = msg['data'].get('classification', '')
-                print(f"🎯 CLASSIFICATION RESULT from {device_id}:")
-                print(f"   {classification}")
-                print(f"   Image processed successfully!")
+                # The device forwards postprocess's "<confidence> <index> <label>" line
+                parsed = parse_postprocess_line(classification)
+                if parsed and "confidence" not in msg['data']:
+                    msg['data']['confidence'] = parsed[0]
+                self.log.info("classification_result", f"🎯 CLASSIFICATION RESULT from {device_id}: {classification}",
+                              device=device_id, task_id=msg.get("task_id"), classification=classification)
                 
+            self.count("orchestrator_results_total", device=device_id, status=msg["data"].get("status", "unknown"))
+            self.record_result_latency(msg.get("task_id"), msg["data"])
+            self.complete_task(msg.get("task_id"), dict(msg["data"], device=device_id))
+
             # For EdgeMLBalancer: Update scores with confidence
             task = msg["subtask"]
             confidence = msg["data"].get("confidence", 0.5)
@@ -169,24 +364,62 @@ class Orchestrator:
                 cpu_load = self.devices[device_id]["metrics"].get("cpu_load", 0.5)
                 self.update_scores(task, device_id, cpu_load, confidence)
         elif msg["type"] == "heartbeat":
-            print(f"Heartbeat from {device_id}")
+            # Sent whenever a status tick has nothing new; from now on this device's silence means trouble
+            if device_id in self.devices:
+                self.devices[device_id]["heartbeats"] = True
+            self.log.debug("heartbeat", device=device_id)
 
-    def handle_image_received(self, source_device, data):
-        """Handle image received from Android device and initiate bidding"""
+    def complete_task(self, task_id, data):
+        """Hand a task's result, or a {"status": "error"} when it never ran, to whoever is waiting on it"""
+        with self.lock:
+            self.assignments.pop(task_id, None)
+        callback = self.result_callbacks.pop(task_id, None)
+        if callback is not None:
+            try:
+                callback(data)
+            except Exception as e:
+                self.log.error("result_callback_failed", f"Result callback for {task_id} failed: {e}", task_id=task_id)
+
+    def handle_image_received(self, source_device, data, exclude=(), on_result=None):
+        """Handle image received from Android device and initiate bidding.
+
+        Devices in exclude are not asked to bid unless nobody else could;
+        on_result(data) is called with the result. Returns the task_id.
+        """
         task_id = str(uuid.uuid4())
         image_data = data.get("image_base64", "")
+        self.latency.start(task_id)
+        if on_result is not None:
+            self.result_callbacks[task_id] = on_result
         
-        print(f"Starting bidding process for task {task_id}")
+        self.log.info("auction_started", f"Starting bidding process for task {task_id}", task_id=task_id, source=source_device)
         
         # Initialize pending bids for this task
         self.pending_bids[task_id] = {
             "image_data": image_data,
             "bids": {},
             "source_device": source_device,
-            "start_time": time.time()
+            "start_time": time.time(),
+            # Preprocessing runs while the bid window is open
+            "tensor": self.preprocessor.submit(image_data) if self.preprocessor and image_data else None
         }
         
-        # Request bids from all connected devices
+        # Request bids only from devices indexed for this subtask; overloaded
+        # devices are skipped unless nobody else could take the task
+        targets = [d for d in self.eligible_devices("classify") if d not in exclude]
+        if not targets and self.shards is not None and "shard_origin" not in data:
+            # Every device here is busy; a peer shard with free devices runs the auction instead
+            if self.shards.offload(task_id, source_device, data):
+                pending = self.pending_bids.pop(task_id)
+                if pending["tensor"] is not None:
+                    pending["tensor"].cancel()
+                self.latency.mark(task_id, "shard_forward")
+                return task_id
+        if not targets:
+            targets = [d for d in self.eligible_devices("classify", skip_overloaded=False) if d not in exclude]
+        if not targets:
+            targets = self.eligible_devices("classify", skip_overloaded=False)
+
         bid_request = {
             "type": "bid_request",
             "agent_id": "orchestrator",
@@ -198,17 +431,22 @@ class Orchestrator:
             }
         }
         
-        bid_request_json = json.dumps(bid_request)
-        for device_id, device_info in self.devices.items():
-            if "classify" in device_info["capabilities"]:
-                try:
-                    device_info["conn"].send(bid_request_json.encode())
-                    print(f"Sent bid request to {device_id}")
-                except Exception as e:
-                    print(f"Failed to send bid request to {device_id}: {e}")
+        bid_request_json = json.dumps(bid_request).encode()
+        for device_id in targets:
+            device_info = self.devices.get(device_id)
+            if device_info is None:
+                continue
+            try:
+                device_info["conn"].send(bid_request_json)
+                self.count("orchestrator_bid_requests_sent_total", device=device_id)
+                self.log.debug("bid_request_sent", device=device_id, task_id=task_id)
+            except Exception as e:
+                self.log.warn("bid_request_failed", f"Failed to send bid request to {device_id}: {e}", device=device_id, task_id=task_id)
+        self.latency.mark(task_id, "bid_broadcast")
         
-        # Set timer to evaluate bids after 5 seconds
-        threading.Timer(5.0, self.evaluate_bids, args=[task_id]).start()
+        # Evaluate bids once the bid window closes
+        self.schedule(self.bid_window, self.evaluate_bids, task_id)
+        return task_id
 
     def handle_bid_received(self, device_id, msg):
         """Handle bid received from device"""
@@ -217,17 +455,17 @@ class Orchestrator:
         
         if task_id in self.pending_bids:
             self.pending_bids[task_id]["bids"][device_id] = bid_data
-            cpu_load_val = bid_data.get('cpu_load', None)
-            # Safely format CPU even if missing/non-numeric
-            if isinstance(cpu_load_val, (int, float)):
-                cpu_str = f"{cpu_load_val:.2f}"
-            else:
-                cpu_str = "N/A"
-
-            battery = bid_data.get('battery', 'N/A')
-            has_npu = bid_data.get('has_npu', False)
-            npu_str = "✓ NPU" if has_npu else "✗ No NPU"
-            print(f"📨 Bid from {device_id}: CPU={cpu_str}, Battery={battery}%, {npu_str}")
+            self.count("orchestrator_bids_received_total", device=device_id)
+            arrival = self.latency.elapsed(task_id)
+            if arrival is not None:
+                self.latency.record("bid_arrival", arrival)
+            # Everything score_bid and the latency models look at, so replay.py can re-run the auction
+            ram = bid_data.get('ram')
+            self.log.info("bid_received", device=device_id, task_id=task_id,
+                          cpu_load=bid_data.get('cpu_load'), battery=bid_data.get('battery'),
+                          ram_percent=ram.get('usage_percent') if isinstance(ram, dict) else None,
+                          has_npu=bid_data.get('has_npu', False), backend=bid_data.get('backend'),
+                          predicted_latency=bid_data.get('predicted_latency'), uncertainty=bid_data.get('uncertainty'))
 
     def evaluate_bids(self, task_id):
         """Evaluate bids and select winning device based on a weighted score.
@@ -243,95 +481,99 @@ class Orchestrator:
                 ram_score = ((100 - usage_percent) / 100) * 15.
         """
         if task_id not in self.pending_bids:
-            print(f"Task {task_id} not found in pending bids")
+            self.log.warn("auction_unknown_task", f"Task {task_id} not found in pending bids", task_id=task_id)
+            self.count("orchestrator_auctions_total", outcome="unknown_task")
             return
         
         task_info = self.pending_bids[task_id]
         bids = task_info["bids"]
+        self.latency.mark(task_id, "bid_wait")
         
         if not bids:
-            print(f"❌ No bids received for task {task_id}")
+            self.log.warn("auction_no_bids", f"❌ No bids received for task {task_id}", task_id=task_id)
+            self.count("orchestrator_auctions_total", outcome="no_bids")
+            self.latency.discard(task_id)
+            if task_info["tensor"] is not None:
+                task_info["tensor"].cancel()
             del self.pending_bids[task_id]
+            self.complete_task(task_id, {"status": "error", "message": "No bids received"})
             return
         
-        print(f"\n{'='*80}")
-        print(f"🎯 EVALUATING BIDS FOR TASK {task_id} (weighted scoring)")
-        print(f"{'='*80}")
-        
-        # Display all bids
         scores = {}
         for dev_id, bid in bids.items():
-            cpu = bid.get('cpu_load', 1.0)
-            battery = bid.get('battery', 0)
-            ram = bid.get('ram', {})
-            ram_percent = ram.get('usage_percent', None)
-            has_npu = bid.get('has_npu', False)
-
-            # Compute components
-            npu_score = 40 if has_npu else 0
-            if battery is None:
-                battery_score = 0
-            elif battery < 20:
-                battery_score = 0
-            elif battery < 30:
-                battery_score = 20
-            else:
-                # Clamp at 100 for the formula
-                battery_clamped = min(max(battery, 30), 100)
-                battery_score = (10 + ((battery_clamped - 30) / 70.0)) * 15
-
-            # cpu_load expected in [0,1]
-            cpu_val = cpu if isinstance(cpu, (int, float)) else 1.0
-            cpu_score = (1.0 - max(0.0, min(1.0, cpu_val))) * 10
-
-            # RAM usage_percent: lower is better
-            if isinstance(ram_percent, (int, float)):
-                ram_percent_clamped = max(0.0, min(100.0, float(ram_percent)))
-                ram_score = ((100.0 - ram_percent_clamped) / 100.0) * 15
-            else:
-                ram_score = 0
-
-            total_score = npu_score + battery_score + cpu_score + ram_score
-            scores[dev_id] = {
-                'total': total_score,
-                'npu': npu_score,
-                'battery': battery_score,
-                'cpu': cpu_score,
-                'ram': ram_score,
-                'raw_cpu': cpu,
-                'raw_battery': battery,
-                'raw_ram_percent': ram_percent if ram_percent is not None else 'N/A',
-                'has_npu': has_npu
-            }
-
-            npu_icon = '✓' if has_npu else '✗'
-            cpu_display = f"{cpu:.2%}" if isinstance(cpu, (int, float)) else 'N/A'
-            ram_display = f"{ram_percent:.1f}%" if isinstance(ram_percent, (int, float)) else 'N/A'
-            print(
-                f"  {dev_id}: CPU={cpu_display}, Battery={battery}%, RAM={ram_display}, NPU={npu_icon} "
-                f"| score={total_score:.2f} (npu={npu_score:.2f}, bat={battery_score:.2f}, cpu={cpu_score:.2f}, ram={ram_score:.2f})"
-            )
+            score = scores[dev_id] = self.score_bid(bid)
+            self.log.debug("bid_scored", device=dev_id, task_id=task_id, score=round(score['total'], 2),
+                           npu=score['npu'], battery=round(score['battery'], 2), cpu=round(score['cpu'], 2), ram=round(score['ram'], 2))
 
         # Select device with highest total score
         winner = max(scores.keys(), key=lambda d: scores[d]['total'])
-        winner_bid = bids[winner]
+        with self.lock:
+            self.assignments[task_id] = winner
+        self.latency.mark(task_id, "scoring")
+        self.count("orchestrator_auctions_total", outcome="won")
+        self.count("orchestrator_auction_wins_total", device=winner)
+        # Kept even without a prediction: the outcome still counts towards the device's accuracy stats
+        predicted = bids[winner].get("predicted_latency")
+        uncertainty = bids[winner].get("uncertainty")
+        backend = bids[winner].get("backend") or ("npu" if bids[winner].get("has_npu") else "cpu")
+        self.task_predictions[task_id] = (winner, predicted if isinstance(predicted, (int, float)) else None,
+                                          uncertainty if isinstance(uncertainty, (int, float)) else 0.0, backend)
         
-        print(f"\n🏆 WINNER: {winner}")
-        print(f"   CPU Load: {winner_bid.get('cpu_load', 0):.2%}")
-        print(f"   Battery: {winner_bid.get('battery', 0)}%")
-        print(
-            f"   Score Breakdown -> total={scores[winner]['total']:.2f}, "
-            f"npu={scores[winner]['npu']:.2f}, bat={scores[winner]['battery']:.2f}, "
-            f"cpu={scores[winner]['cpu']:.2f}, ram={scores[winner]['ram']:.2f}"
-        )
-        print(f"{'='*80}\n")
+        self.log.info("auction_winner", f"🏆 WINNER for task {task_id}: {winner} (score={scores[winner]['total']:.2f}, {len(bids)} bids)",
+                      task_id=task_id, device=winner, score=round(scores[winner]['total'], 2), bids=len(bids))
         
         # Send image to winning device
-        self.send_image_to_device(winner, task_id, task_info["image_data"])
+        self.send_image_to_device(winner, task_id, task_info["image_data"], task_info["tensor"])
         
         # Clean up
         del self.pending_bids[task_id]
 
+    @staticmethod
+    def score_bid(bid):
+        """Weighted score of one bid (see evaluate_bids); returns the total and its components"""
+        cpu = bid.get('cpu_load', 1.0)
+        battery = bid.get('battery', 0)
+        ram = bid.get('ram', {})
+        ram_percent = ram.get('usage_percent', None)
+        has_npu = bid.get('has_npu', False)
+
+        # Compute components
+        npu_score = 40 if has_npu else 0
+        if battery is None:
+            battery_score = 0
+        elif battery < 20:
+            battery_score = 0
+        elif battery < 30:
+            battery_score = 20
+        else:
+            # Clamp at 100 for the formula
+            battery_clamped = min(max(battery, 30), 100)
+            battery_score = (10 + ((battery_clamped - 30) / 70.0)) * 15
+
+        # cpu_load expected in [0,1]
+        cpu_val = cpu if isinstance(cpu, (int, float)) else 1.0
+        cpu_score = (1.0 - max(0.0, min(1.0, cpu_val))) * 10
+
+        # RAM usage_percent: lower is better
+        if isinstance(ram_percent, (int, float)):
+            ram_percent_clamped = max(0.0, min(100.0, float(ram_percent)))
+            ram_score = ((100.0 - ram_percent_clamped) / 100.0) * 15
+        else:
+            ram_score = 0
+
+        total_score = npu_score + battery_score + cpu_score + ram_score
+        return {
+            'total': total_score,
+            'npu': npu_score,
+            'battery': battery_score,
+            'cpu': cpu_score,
+            'ram': ram_score,
+            'raw_cpu': cpu,
+            'raw_battery': battery,
+            'raw_ram_percent': ram_percent if ram_percent is not None else 'N/A',
+            'has_npu': has_npu
+        }
+
     # Helper left in the same file as requested; not used externally but kept for clarity
     # on the scoring scheme described above.
     def _example_score_formula_doc(self):
@@ -343,10 +585,33 @@ class Orchestrator:
               + (((100 - ram_usage_percent)/100) * 15)
         """
 
-    def send_image_to_device(self, device_id, task_id, image_data):
-        """Send image to the winning device"""
+    def send_image_to_device(self, device_id, task_id, image_data, tensor=None):
+        """Send image to the winning device, as a ready InceptionV3 tensor when tensor (a preprocessing future) succeeds"""
         if device_id not in self.devices:
-            print(f"Device {device_id} not found")
+            self.log.warn("device_missing", f"Device {device_id} not found", device=device_id, task_id=task_id)
+            self.latency.discard(task_id)
+            self.task_predictions.pop(task_id, None)
+            self.complete_task(task_id, {"status": "error", "message": f"Device {device_id} not found"})
+            if tensor is not None:
+                tensor.cancel()
+            return
+        
+        task_data = {
+            "image_base64": image_data,
+            "output_path": "/data/local/tmp/received-images"
+        }
+        if tensor is not None:
+            try:
+                task_data.update(tensor.result(timeout=self.bid_window))
+                del task_data["image_base64"]  # The tensor replaces the image; the device skips decode and preprocess
+                self.count("orchestrator_tensors_sent_total", dtype=task_data["tensor_dtype"])
+            except Exception as e:
+                self.count("orchestrator_preprocess_failures_total")
+                self.log.warn("preprocess_failed", f"Preprocessing failed for {task_id}, sending the raw image: {e}", task_id=task_id)
+            self.latency.mark(task_id, "preprocess_wait")
+        
+        if self.batch_window > 0:
+            self.enqueue_batch(device_id, task_id, task_data)
             return
         
         task_message = {
@@ -354,25 +619,126 @@ class Orchestrator:
             "agent_id": "orchestrator", 
             "task_id": task_id,
             "subtask": "classify",
-            "data": {
-                "image_base64": image_data,
-                "output_path": "/data/local/tmp/received-images"
-            }
+            "data": task_data
         }
         
         try:
             task_json = json.dumps(task_message)
-            self.devices[device_id]["conn"].send(task_json.encode())
-            print(f"Sent image to {device_id} for processing")
+            self.devices[device_id]["conn"].sendall(task_json.encode())
+            self.latency.mark(task_id, "image_send")
+            self.log.info("task_sent", f"Sent image to {device_id} for processing", device=device_id, task_id=task_id)
         except Exception as e:
-            print(f"Failed to send image to {device_id}: {e}")
+            self.latency.discard(task_id)
+            self.task_predictions.pop(task_id, None)
+            self.complete_task(task_id, {"status": "error", "message": str(e)})
+            self.log.error("task_send_failed", f"Failed to send image to {device_id}: {e}", device=device_id, task_id=task_id)
+
+    def send_task(self, device_id, task_id, subtask, data, on_result=None, track=True):
+        """
+        Send a task straight to device_id, without an auction; True if it went out
+
+        With track=False the message is fire-and-forget (story_chunk): the device sends
+        no result for it, so it is not held in assignments and keeps no device busy.
+        """
+        if on_result is not None:
+            self.result_callbacks[task_id] = on_result
+        if track:
+            with self.lock:
+                self.assignments[task_id] = device_id
+        device_info = self.devices.get(device_id)
+        try:
+            if device_info is None:
+                raise ConnectionError(f"device {device_id} not found")
+            task_message = {"type": "task", "agent_id": "orchestrator", "task_id": task_id, "subtask": subtask, "data": data}
+            device_info["conn"].sendall(json.dumps(task_message).encode())
+            return True
+        except Exception as e:
+            self.log.error("task_send_failed", f"Failed to send {subtask} to {device_id}: {e}", device=device_id, task_id=task_id)
+            if track:
+                self.complete_task(task_id, {"status": "error", "message": str(e)})
+            return False
+
+    def enqueue_batch(self, device_id, task_id, task_data):
+        """Hold a classify task for device_id; the batch is sent when full or batch_window after its first task"""
+        with self.lock:
+            batch = self.batches.get(device_id)
+            if batch is None:
+                batch = self.batches[device_id] = {"id": str(uuid.uuid4()), "items": []}
+                self.schedule(self.batch_window, self.flush_batch, device_id, batch["id"])
+            batch["items"].append((task_id, task_data))
+            full = len(batch["items"]) >= self.batch_max
+        if full:
+            self.flush_batch(device_id, batch["id"])
+
+    def flush_batch(self, device_id, batch_id):
+        """Send device_id's held tasks as one classify_batch task; the device answers with one result per task_id"""
+        with self.lock:
+            batch = self.batches.get(device_id)
+            if batch is None or batch["id"] != batch_id:
+                return  # Already sent because it filled up
+            del self.batches[device_id]
+            device_info = self.devices.get(device_id)
+        items = batch["items"]
+        task_ids = [task_id for task_id, _ in items]
+        for task_id in task_ids:
+            self.latency.mark(task_id, "batch_wait")
+        if len(items) == 1:
+            task_message = {"type": "task", "agent_id": "orchestrator", "task_id": task_ids[0],
+                            "subtask": "classify", "data": items[0][1]}
+        else:
+            task_message = {"type": "task", "agent_id": "orchestrator", "task_id": batch_id, "subtask": "classify_batch",
+                            "data": {"items": [dict(task_data, task_id=task_id) for task_id, task_data in items]}}
+        try:
+            if device_info is None:
+                raise ConnectionError("device disconnected")
+            device_info["conn"].sendall(json.dumps(task_message).encode())
+            for task_id in task_ids:
+                self.latency.mark(task_id, "image_send")
+            self.count("orchestrator_batches_sent_total", device=device_id)
+            self.log.info("batch_sent", f"Sent {len(items)} images to {device_id} in one batch", device=device_id,
+                          batch_id=batch_id, size=len(items), task_ids=task_ids)
+        except Exception as e:
+            for task_id in task_ids:
+                self.latency.discard(task_id)
+                self.task_predictions.pop(task_id, None)
+                self.complete_task(task_id, {"status": "error", "message": str(e)})
+            self.log.error("batch_send_failed", f"Failed to send batch of {len(items)} to {device_id}: {e}",
+                           device=device_id, batch_id=batch_id, size=len(items))
+
+    def record_result_latency(self, task_id, data):
+        """Close out a task's timing when its result arrives.
+
+        The device reports its own decode/execution durations; whatever is left
+        of the round trip since the image was sent is transfer and queueing.
+        """
+        roundtrip = self.latency.mark(task_id, "device_roundtrip")
+        prediction = self.task_predictions.pop(task_id, None)
+        if roundtrip is None:
+            return
+        timing = data.get("timing", {})
+        device_ms = 0.0
+        for key, stage in (("decode_ms", "decode"), ("exec_ms", "execution")):
+            if isinstance(timing.get(key), (int, float)):
+                self.latency.record(stage, timing[key] / 1000.0)
+                device_ms += timing[key]
+        if device_ms:
+            self.latency.record("result_return", max(roundtrip - device_ms / 1000.0, 0.0))
+        if prediction:
+            # A device predicts the decode + exec time it reports, not the transfers it cannot see
+            winner, predicted, uncertainty, backend = prediction
+            actual = device_ms / 1000.0 if device_ms else roundtrip
+            if predicted is not None:
+                self.prediction_error.record(winner, abs(predicted - actual))
+            self.accuracy.record(winner, backend, predicted, actual, uncertainty)
+        total = self.latency.finish(task_id)
+        self.log.info("task_latency", task_id=task_id, total=round(total, 4), roundtrip=round(roundtrip, 4), **timing)
 
     def update_scores(self, task, device, U_i, C_i):
         # Placeholder for EdgeMLBalancer scoring
         key = f"{task}-{device}"
         task_logs = [log for log in self.logs[-10:] if log[0] == task and log[1] == device]
-        U_avg = np.mean([log[2] for log in task_logs]) if task_logs else U_i
-        C_avg = np.mean([log[3] for log in task_logs]) if task_logs else C_i
+        U_avg = sum(log[2] for log in task_logs) / len(task_logs) if task_logs else U_i
+        C_avg = sum(log[3] for log in task_logs) / len(task_logs) if task_logs else C_i
         score = min(U_i, U_avg) * (1 - C_avg / C_i if C_i > 0 else 1)
         self.scores[key] = {"score": score, "U_avg": U_avg, "C_avg": C_avg}
         self.logs.append((task, device, U_i, C_i))
@@ -392,11 +758,57 @@ class Orchestrator:
 
     def run(self):
         threading.Thread(target=self.accept_connections).start()
+        threading.Thread(target=self.watch_devices, daemon=True).start()
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Hub orchestrator")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--bid-window", type=float, default=5.0, help="Seconds to collect bids before evaluating")
+    parser.add_argument("--metrics-port", type=int, default=9100, help="Port for /metrics (0 disables it)")
+    parser.add_argument("--preprocess", choices=("off", "uint8", "float32"), default="off",
+                        help="Preprocess images on the hub and send winners a ready tensor of this type")
+    parser.add_argument("--preprocess-workers", type=int, default=2, help="Threads for --preprocess")
+    parser.add_argument("--batch-window", type=float, default=0.0,
+                        help="Seconds to collect classify tasks per device into one SNPE run (0 sends each task alone)")
+    parser.add_argument("--batch-max", type=int, default=16, help="Largest batch sent to a device")
+    parser.add_argument("--send-queue-mb", type=float, default=4.0, help="Outbound queue limit per device connection")
+    parser.add_argument("--send-overflow", choices=("drop", "disconnect"), default="drop",
+                        help="When a device's queue is full: refuse the message, or drop the device")
+    parser.add_argument("--send-stall-timeout", type=float, default=15.0,
+                        help="Seconds without write progress before a device is dropped")
+    parser.add_argument("--phi-threshold", type=float, default=8.0,
+                        help="Failure detector suspicion level at which a device is left out of auctions")
+    parser.add_argument("--evict-after", type=float, default=15.0,
+                        help="Seconds without heartbeats before a device is removed from the registry")
+    parser.add_argument("--shard-id", help="Run as one shard of a multi-orchestrator hub under this unique name")
+    parser.add_argument("--advertise", help="host:port peers and redirected devices reach this shard on "
+                                            "(default: this host's address and --port)")
+    parser.add_argument("--peer", action="append", default=[], help="host:port of another shard (repeatable)")
+    args = parser.parse_args()
+
     print("=== Orchestrator Starting ===")
-    orchestrator = Orchestrator()
+    orchestrator = Orchestrator(host=args.host, port=args.port)
+    orchestrator.bid_window = args.bid_window
+    orchestrator.batch_window = args.batch_window
+    orchestrator.batch_max = args.batch_max
+    orchestrator.send_queue_bytes = int(args.send_queue_mb * 1024 * 1024)
+    orchestrator.send_overflow = args.send_overflow
+    orchestrator.send_stall_timeout = args.send_stall_timeout
+    orchestrator.failure_detector.threshold = args.phi_threshold
+    orchestrator.evict_after = args.evict_after
+    if args.preprocess != "off":
+        from image_pipeline import ImagePipeline
+        orchestrator.preprocessor = ImagePipeline(args.preprocess_workers, args.preprocess, latency=orchestrator.latency)
     orchestrator.run()
+    if args.shard_id:
+        from sharding import ShardCoordinator, parse_address
+        advertise = parse_address(args.advertise) if args.advertise else (
+            socket.gethostbyname(socket.gethostname()) if args.host == "0.0.0.0" else args.host, args.port)
+        orchestrator.shards = ShardCoordinator(orchestrator, args.shard_id, advertise, args.peer).start()
+    if args.metrics_port:
+        MetricsServer(orchestrator, port=args.metrics_port).start()
     
     print("Orchestrator is running. Press Ctrl+C to stop.")
     try:
@@ -411,8 +823,15 @@ if __name__ == "__main__":
                 
                 for device_id in orchestrator.devices:
                     orchestrator.print_device_metrics(device_id)
+
+            latency = orchestrator.latency.snapshot()
+            if latency:
+                orchestrator.log.info("latency_summary", stages=latency)
+                print(f"⏱  STAGE LATENCY\n{orchestrator.latency.format_table(latency)}\n")
                     
     except KeyboardInterrupt:
+        if orchestrator.shards is not None:
+            orchestrator.shards.stop()
         print("\n\n{'='*80}")
         print("Orchestrator stopped.")
         print(f"{'='*80}")
\ No newline at end of file
@@ -11,6 +11,11 @@ import subprocess
 import os
 import sys
 
+from event_log import EventLogger
+from latency import LatencyTracker
+
+STREAM_POLL_INTERVAL = 0.1  # seconds between checks for new RESULT_CHUNKs and the result file
+
 class P2POrchestratorError(Exception):
     """Custom exception for P2P Orchestrator errors"""
     pass
@@ -18,18 +23,17 @@ class P2POrchestratorError(Exception):
 class P2POrchestrator:
     def __init__(self, mesh_dir="/data/local/tmp/mesh"):
         self.mesh_dir = mesh_dir
+        self.log = EventLogger(path=os.path.join(mesh_dir, "orchestrator_events.jsonl"))
+        self.latency = LatencyTracker()
         self.device_id = self.get_device_id()
         self.device_config = self.load_device_config()
         self.peers_file = os.path.join(mesh_dir, "peers.txt")
         self.pending_bids = {}
         self.bid_timeout = 10  # seconds to wait for bids
         
-        print(f"{'='*80}")
-        print(f"P2P Orchestrator Starting on {self.device_id}")
-        print(f"{'='*80}")
-        print(f"Mesh Directory: {mesh_dir}")
-        print(f"NPU Available: {self.device_config.get('has_npu', False)}")
-        print(f"{'='*80}\n")
+        self.log.info("orchestrator_started",
+                      f"P2P Orchestrator starting on {self.device_id} (mesh: {mesh_dir}, NPU: {self.device_config.get('has_npu', False)})",
+                      device=self.device_id, mesh_dir=mesh_dir, has_npu=self.device_config.get('has_npu', False))
     
     def get_device_id(self):
         """Get device ID from mesh configuration"""
@@ -41,7 +45,7 @@ class P2POrchestrator:
                     return f.read().strip().split(':')[0]
             return "unknown"
         except Exception as e:
-            print(f"Warning: Could not read device ID: {e}")
+            self.log.warn("device_id_unreadable", f"Could not read device ID: {e}")
             return "unknown"
     
     def load_device_config(self):
@@ -61,7 +65,7 @@ class P2POrchestrator:
                     json.dump(config, f, indent=2)
                 return config
         except Exception as e:
-            print(f"Warning: Could not load device config: {e}")
+            self.log.warn("device_config_unreadable", f"Could not load device config: {e}")
             return {"device_id": self.device_id, "has_npu": False}
     
     def get_connected_peers(self):
@@ -81,7 +85,7 @@ class P2POrchestrator:
                                     'port': parts[2]
                                 })
         except Exception as e:
-            print(f"Error reading peers file: {e}")
+            self.log.error("peers_unreadable", f"Error reading peers file: {e}")
         return peers
     
     def send_mesh_message(self, target_device, message_type, data):
@@ -109,19 +113,17 @@ class P2POrchestrator:
             
             return result.returncode == 0
         except Exception as e:
-            print(f"Error sending mesh message: {e}")
+            self.log.error("mesh_send_failed", f"Error sending mesh message: {e}", target=target_device, type=message_type)
             return False
     
     def broadcast_bid_request(self, task_id, task_type="slm_inference", prompt=""):
         """Broadcast bid request to all connected peers"""
-        print(f"\n{'='*80}")
-        print(f"📢 Broadcasting Bid Request: {task_id}")
-        print(f"Task Type: {task_type}")
-        print(f"{'='*80}\n")
+        self.log.info("auction_started", f"📢 Broadcasting bid request {task_id} ({task_type})",
+                      task_id=task_id, task_type=task_type, prompt_length=len(prompt))
         
         peers = self.get_connected_peers()
         if not peers:
-            print("❌ No peers connected!")
+            self.log.error("no_peers", "❌ No peers connected!", task_id=task_id)
             return False
         
         bid_data = {
@@ -141,19 +143,20 @@ class P2POrchestrator:
         # Send to all peers
         success_count = 0
         for peer in peers:
-            print(f"Sending bid request to {peer['device_id']}...")
             if self.send_mesh_message(peer['device_id'], "BID_REQUEST", bid_data):
                 success_count += 1
-                print(f"  ✓ Sent to {peer['device_id']}")
+                self.log.debug("bid_request_sent", device=peer['device_id'], task_id=task_id)
             else:
-                print(f"  ✗ Failed to send to {peer['device_id']}")
+                self.log.warn("bid_request_failed", f"✗ Failed to send bid request to {peer['device_id']}",
+                              device=peer['device_id'], task_id=task_id)
         
-        print(f"\n📤 Bid request sent to {success_count}/{len(peers)} peers")
+        self.log.info("bid_requests_sent", f"📤 Bid request sent to {success_count}/{len(peers)} peers",
+                      task_id=task_id, sent=success_count, peers=len(peers))
         return success_count > 0
     
     def collect_bids(self, task_id):
         """Collect bids from bid response file"""
-        print(f"\n⏳ Waiting {self.bid_timeout}s for bids...\n")
+        self.log.info("bid_wait", f"⏳ Waiting {self.bid_timeout}s for bids...", task_id=task_id, timeout=self.bid_timeout)
         
         bid_file = os.path.join(self.mesh_dir, f"bids_{task_id}.json")
         start_time = time.time()
@@ -181,19 +184,15 @@ class P2POrchestrator:
         Priority: NPU devices first, then lowest CPU load
         """
         if task_id not in self.pending_bids:
-            print(f"❌ Task {task_id} not found")
+            self.log.warn("auction_unknown_task", f"❌ Task {task_id} not found", task_id=task_id)
             return None
         
         bids = self.pending_bids[task_id]["bids"]
         
         if not bids:
-            print(f"❌ No bids received for task {task_id}")
+            self.log.warn("auction_no_bids", f"❌ No bids received for task {task_id}", task_id=task_id)
             return None
         
-        print(f"\n{'='*80}")
-        print(f"🎯 EVALUATING BIDS (NPU-First Strategy)")
-        print(f"{'='*80}\n")
-        
         # Separate NPU and non-NPU devices
         npu_devices = {}
         cpu_devices = {}
@@ -203,11 +202,8 @@ class P2POrchestrator:
             cpu_load = bid.get('cpu_load', 1.0)
             battery = bid.get('battery', 0)
             
-            print(f"Device: {device_id}")
-            print(f"  NPU: {'✓ YES' if has_npu else '✗ NO'}")
-            print(f"  CPU Load: {cpu_load:.2%}")
-            print(f"  Battery: {battery}%")
-            print()
+            self.log.info("bid_received", device=device_id, task_id=task_id,
+                          has_npu=has_npu, cpu_load=cpu_load, battery=battery)
             
             if has_npu:
                 npu_devices[device_id] = bid
@@ -223,30 +219,24 @@ class P2POrchestrator:
             winner = min(npu_devices.keys(), 
                         key=lambda d: npu_devices[d].get('cpu_load', 1.0))
             winner_type = "NPU"
-            print(f"🏆 WINNER (NPU Priority): {winner}")
         elif cpu_devices:
             # Select CPU device with lowest load
             winner = min(cpu_devices.keys(), 
                         key=lambda d: cpu_devices[d].get('cpu_load', 1.0))
             winner_type = "CPU"
-            print(f"🏆 WINNER (Lowest CPU): {winner}")
         
         if winner:
             winner_bid = bids[winner]
-            print(f"\n📊 Winner Details:")
-            print(f"   Device: {winner}")
-            print(f"   Type: {winner_type}")
-            print(f"   CPU Load: {winner_bid.get('cpu_load', 0):.2%}")
-            print(f"   Battery: {winner_bid.get('battery', 0)}%")
-            print(f"{'='*80}\n")
+            self.log.info("auction_winner",
+                          f"🏆 WINNER ({winner_type}): {winner} (CPU {winner_bid.get('cpu_load', 0):.2%}, battery {winner_bid.get('battery', 0)}%)",
+                          task_id=task_id, device=winner, winner_type=winner_type, bids=len(bids))
         
         return winner, winner_type
     
     def send_task_to_device(self, device_id, task_id, prompt, use_npu=False):
         """Send task to selected device"""
-        print(f"\n📤 Sending task to {device_id}...")
-        print(f"   Prompt: {prompt[:100]}...")
-        print(f"   Using: {'NPU' if use_npu else 'CPU'}")
+        self.log.info("task_sending", f"📤 Sending task to {device_id} ({'NPU' if use_npu else 'CPU'})",
+                      task_id=task_id, device=device_id, use_npu=use_npu, prompt=prompt[:100])
         
         task_data = {
             "task_id": task_id,
@@ -259,47 +249,94 @@ class P2POrchestrator:
         success = self.send_mesh_message(device_id, "TASK", task_data)
         
         if success:
-            print(f"✓ Task sent successfully")
+            self.log.info("task_sent", "✓ Task sent successfully", task_id=task_id, device=device_id)
         else:
-            print(f"✗ Failed to send task")
+            self.log.error("task_send_failed", "✗ Failed to send task", task_id=task_id, device=device_id)
         
         return success
     
-    def wait_for_result(self, task_id, timeout=300):
-        """Wait for result from device"""
-        print(f"\n⏳ Waiting for result (timeout: {timeout}s)...\n")
+    def wait_for_result(self, task_id, timeout=300, on_chunk=None):
+        """
+        Wait for result from device, passing RESULT_CHUNKs to on_chunk(text, seq) as they arrive
+        
+        mesh_listener.sh appends each chunk to stream_<task>.jsonl; chunks are handed over in seq
+        order (early ones are held back) and the result file still marks the end of the task.
+        """
+        self.log.info("result_wait", f"⏳ Waiting for result (timeout: {timeout}s)...", task_id=task_id, timeout=timeout)
         
         result_file = os.path.join(self.mesh_dir, f"result_{task_id}.json")
+        stream_file = os.path.join(self.mesh_dir, f"stream_{task_id}.jsonl")
+        on_chunk = on_chunk or (lambda text, seq: print(text, flush=True))
+        stream = {"offset": 0, "next_seq": 1, "held": {}, "delivered": 0}
         start_time = time.time()
         
         while (time.time() - start_time) < timeout:
+            self.read_stream(task_id, stream_file, stream, on_chunk)
             if os.path.exists(result_file):
                 try:
                     with open(result_file, 'r') as f:
                         result = json.load(f)
+                        self.read_stream(task_id, stream_file, stream, on_chunk, final=True)
+                        self.log.info("result_received", task_id=task_id, device=result.get('device_id'),
+                                      status=result.get('status'), elapsed=round(time.time() - start_time, 3),
+                                      chunks=stream["delivered"])
+                        self.log.flush()  # Keep queued events ahead of the result on the console
                         print(f"\n{'='*80}")
                         print(f"✅ RESULT RECEIVED")
                         print(f"{'='*80}\n")
                         print(f"Device: {result.get('device_id', 'unknown')}")
                         print(f"Task ID: {result.get('task_id', 'unknown')}")
                         print(f"Status: {result.get('status', 'unknown')}")
-                        print(f"\n{'='*80}")
-                        print(f"OUTPUT:")
-                        print(f"{'='*80}")
-                        print(result.get('output', 'No output'))
+                        if not stream["delivered"]:
+                            print(f"\n{'='*80}")
+                            print(f"OUTPUT:")
+                            print(f"{'='*80}")
+                            print(result.get('output', 'No output'))
                         print(f"{'='*80}\n")
                         
                         # Clean up
                         os.remove(result_file)
+                        if os.path.exists(stream_file):
+                            os.remove(stream_file)
                         return result
                 except Exception as e:
-                    print(f"Error reading result: {e}")
+                    self.log.error("result_unreadable", f"Error reading result: {e}", task_id=task_id)
             
-            time.sleep(1)
+            time.sleep(STREAM_POLL_INTERVAL)
         
-        print("❌ Timeout waiting for result")
+        self.log.error("result_timeout", "❌ Timeout waiting for result", task_id=task_id, timeout=timeout)
         return None
     
+    def read_stream(self, task_id, stream_file, stream, on_chunk, final=False):
+        """Deliver chunks appended since the last call; with final, flush held chunks despite gaps"""
+        if os.path.exists(stream_file):
+            with open(stream_file, 'rb') as f:
+                f.seek(stream["offset"])
+                data = f.read()
+            # Leave a half-written last line for the next poll. The offset counts bytes and
+            # stops only after a newline, so a multibyte character is never split across polls.
+            complete = data[:data.rfind(b"\n") + 1]
+            stream["offset"] += len(complete)
+            for line in complete.decode("utf-8", errors="replace").split("\n")[:-1]:
+                try:
+                    chunk = json.loads(line)
+                    stream["held"][int(chunk["seq"])] = chunk.get("text", "")
+                except (ValueError, KeyError, TypeError):
+                    self.log.warn("stream_chunk_unreadable", task_id=task_id, line=line[:80])
+        
+        held = stream["held"]
+        while held and (stream["next_seq"] in held or final):
+            seq = stream["next_seq"] if stream["next_seq"] in held else min(held)
+            if seq != stream["next_seq"]:
+                self.log.warn("stream_gap", task_id=task_id, expected=stream["next_seq"], got=seq)
+            if not stream["delivered"]:
+                self.latency.mark(task_id, "first_chunk")
+                self.log.info("result_first_chunk", task_id=task_id)
+                self.log.flush()
+            on_chunk(held.pop(seq), seq)
+            stream["delivered"] += 1
+            stream["next_seq"] = seq + 1
+    
     def run_inference_task(self, prompt, use_npu_prompt=None, use_cpu_prompt=None):
         """
         Main workflow: Request bids, select device, send task, get result
@@ -310,20 +347,26 @@ class P2POrchestrator:
             use_cpu_prompt: Optional specific prompt for CPU devices
         """
         task_id = f"task_{int(time.time())}"
+        self.latency.start(task_id)
         
         # Step 1: Broadcast bid request
         if not self.broadcast_bid_request(task_id, prompt=prompt):
-            print("Failed to broadcast bid request")
+            self.log.error("auction_failed", "Failed to broadcast bid request", task_id=task_id)
+            self.latency.discard(task_id)
             return None
+        self.latency.mark(task_id, "bid_broadcast")
         
         # Step 2: Collect bids
         bids = self.collect_bids(task_id)
+        self.latency.mark(task_id, "bid_wait")
         
         # Step 3: Evaluate and select winner
         result = self.evaluate_bids(task_id)
         if not result:
-            print("No device selected")
+            self.log.error("auction_failed", "No device selected", task_id=task_id)
+            self.latency.discard(task_id)
             return None
+        self.latency.mark(task_id, "scoring")
         
         winner_device, winner_type = result
         
@@ -338,11 +381,18 @@ class P2POrchestrator:
         # Step 5: Send task to winner
         use_npu = (winner_type == "NPU")
         if not self.send_task_to_device(winner_device, task_id, final_prompt, use_npu):
-            print("Failed to send task")
+            self.latency.discard(task_id)
             return None
+        self.latency.mark(task_id, "task_send")
         
         # Step 6: Wait for result
         result = self.wait_for_result(task_id)
+        if result:
+            self.latency.mark(task_id, "execution")
+            total = self.latency.finish(task_id)
+            self.log.info("task_latency", task_id=task_id, total=round(total, 3))
+        else:
+            self.latency.discard(task_id)
         
         # Clean up
         if task_id in self.pending_bids:
@@ -392,10 +442,12 @@ def main():
                     use_cpu_prompt=f"[CPU Mode] {prompt}"
                 )
                 
+                orchestrator.log.flush()
                 if result:
                     print("\n✓ Task completed successfully")
                 else:
                     print("\n✗ Task failed")
+                print(f"\n⏱  STAGE LATENCY\n{orchestrator.latency.format_table()}")
                 
             except KeyboardInterrupt:
                 print("\n\nInterrupted by user")
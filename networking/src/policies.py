@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Pluggable bandit policies for scoring bids
+Every policy keeps one model per device, scores a bid as a latency to
+minimise (lowest wins) and learns from the TTFT and stream speed that came
+back, so they are drop-in alternatives to each other:
+
+    linucb    Lower confidence bound of DiscountedLinUCB, what the devices run
+    thompson  A latency sampled from the same posterior; the Cholesky factor of
+              A_inv is cached per device and only refactored after an update
+    ensemble  LinUCB's prediction plus boosted regression stumps fitted to its
+              recent residuals, with LinUCB's uncertainty as the bonus
+
+Compare them on regret and decision time in the fleet simulator:
+
+    python3 policies.py --tasks 3000 --devices 8 --heterogeneity 0.4
+"""
+
+import abc
+import argparse
+import math
+import random
+import sys
+from collections import deque
+
+from linucb import ALPHA, DIM, GAMMA, DiscountedLinUCB, features
+
+TTFT_NOISE_FLOOR = 0.5   # Thompson: posterior scale (s) before a device has any error history
+SPEED_NOISE_FLOOR = 1.0  # Thompson: same for stream speed (tok/s)
+
+
+def cholesky(M):
+    """Lower-triangular L with L L^T = M for a small symmetric matrix; clamps tiny pivots"""
+    n = len(M)
+    L = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1):
+            s = M[i][j] - sum(L[i][k] * L[j][k] for k in range(j))
+            if i == j:
+                L[i][i] = math.sqrt(max(s, 1e-12))
+            else:
+                L[i][j] = s / L[j][j]
+    return L
+
+
+class BanditPolicy(abc.ABC):
+    name = "base"
+
+    def __init__(self, alpha=ALPHA, gamma=GAMMA):
+        """
+        Args:
+            alpha: Exploration weight on the uncertainty term
+            gamma: Forgetting factor of the per-device DiscountedLinUCB models
+        """
+        self.alpha = alpha
+        self.gamma = gamma
+        self.models = {}  # {device: DiscountedLinUCB}
+
+    def model(self, device):
+        model = self.models.get(device)
+        if model is None:
+            model = self.models[device] = DiscountedLinUCB(self.alpha, self.gamma)
+        return model
+
+    @abc.abstractmethod
+    def score(self, device, cpu, ram, prompt_len, tokens):
+        """Latency to minimise for running the task on device (cpu/ram 0-100, prompt in characters)"""
+
+    def update(self, device, cpu, ram, prompt_len, actual_ttft, actual_speed):
+        """Learn from a finished task, with the features the device bid with"""
+        return self.model(device).update(cpu, ram, prompt_len, actual_ttft, actual_speed)
+
+
+class LinUCBPolicy(BanditPolicy):
+    name = "linucb"
+
+    def score(self, device, cpu, ram, prompt_len, tokens):
+        return self.model(device).score(cpu, ram, prompt_len, tokens)
+
+
+class ThompsonPolicy(BanditPolicy):
+    name = "thompson"
+
+    def __init__(self, alpha=ALPHA, gamma=GAMMA, nu=1.0, seed=None):
+        """
+        Args:
+            nu: Posterior scale on top of each device's recent prediction error
+            seed: Seed for the posterior draws
+        """
+        super().__init__(alpha, gamma)
+        self.nu = nu
+        self.rng = random.Random(seed)
+        self.factors = {}  # {device: (model.updates when factored, cholesky(A_inv))}
+
+    def factor(self, device, model):
+        cached = self.factors.get(device)
+        if cached is None or cached[0] != model.updates:
+            cached = self.factors[device] = (model.updates, cholesky(model.A_inv))
+        return cached[1]
+
+    def draw(self, x, L):
+        """x . L z for one z ~ N(0, I): the posterior spread of a prediction at x"""
+        z = [self.rng.gauss(0.0, 1.0) for _ in range(DIM)]
+        return sum(x[i] * sum(L[i][k] * z[k] for k in range(i + 1)) for i in range(DIM))
+
+    def score(self, device, cpu, ram, prompt_len, tokens):
+        model = self.model(device)
+        L = self.factor(device, model)
+        x = features(cpu, ram, prompt_len)
+        ttft, speed, _ = model.predict(x)
+        ttft += self.nu * max(model.err_ttft, TTFT_NOISE_FLOOR) * self.draw(x, L)
+        speed += self.nu * max(model.err_speed, SPEED_NOISE_FLOOR) * self.draw(x, L)
+        return ttft * model.slowdown + tokens / max(speed, 0.1)
+
+
+class StumpEnsemble:
+    def __init__(self, rounds=20, learning_rate=0.3):
+        self.rounds = rounds
+        self.learning_rate = learning_rate
+        self.stumps = []  # [(feature, threshold, left value, right value)]
+
+    def fit(self, X, y):
+        """Least-squares gradient boosting of depth-1 trees on residual targets y"""
+        n = len(y)
+        residual = list(y)
+        orders = [sorted(range(n), key=lambda i: X[i][f]) for f in range(len(X[0]))]
+        self.stumps = []
+        for _ in range(self.rounds):
+            total = sum(residual)
+            best = None  # (gain, feature, threshold, left mean, right mean)
+            for f, order in enumerate(orders):
+                left = 0.0
+                for k in range(n - 1):
+                    left += residual[order[k]]
+                    if X[order[k]][f] == X[order[k + 1]][f]:
+                        continue
+                    n_left = k + 1
+                    gain = left * left / n_left + (total - left) ** 2 / (n - n_left)
+                    if best is None or gain > best[0]:
+                        best = (gain, f, (X[order[k]][f] + X[order[k + 1]][f]) / 2.0,
+                                left / n_left, (total - left) / (n - n_left))
+            if best is None:
+                break
+            _, f, threshold, left_value, right_value = best
+            stump = (f, threshold, self.learning_rate * left_value, self.learning_rate * right_value)
+            self.stumps.append(stump)
+            for i in range(n):
+                residual[i] -= stump[2] if X[i][f] <= threshold else stump[3]
+
+    def predict(self, x):
+        return sum(left if x[f] <= threshold else right for f, threshold, left, right in self.stumps)
+
+
+class EnsemblePolicy(BanditPolicy):
+    name = "ensemble"
+
+    def __init__(self, alpha=ALPHA, gamma=GAMMA, window=200, refit_every=10, min_samples=20, rounds=5):
+        """
+        Args:
+            window: Recent outcomes per device the stumps are fitted on
+            refit_every: Outcomes between refits of a device's ensemble
+            min_samples: Outcomes before a device's ensemble is used at all
+            rounds: Stumps per ensemble; more overfit the few outcomes a device has
+        """
+        super().__init__(alpha, gamma)
+        self.window = window
+        self.refit_every = refit_every
+        self.min_samples = min_samples
+        self.rounds = rounds
+        self.history = {}    # {device: deque of ((cpu, ram, prompt_len), ttft, speed)}
+        self.ensembles = {}  # {device: (ttft StumpEnsemble, speed StumpEnsemble)}
+
+    def score(self, device, cpu, ram, prompt_len, tokens):
+        model = self.model(device)
+        ttft, speed, uncertainty = model.predict(features(cpu, ram, prompt_len))
+        ttft *= model.slowdown
+        ensembles = self.ensembles.get(device)
+        if ensembles:
+            x = (cpu, ram, prompt_len)
+            ttft += ensembles[0].predict(x)
+            speed += ensembles[1].predict(x)
+        return ttft + tokens / max(speed, 0.1) - self.alpha * uncertainty
+
+    def update(self, device, cpu, ram, prompt_len, actual_ttft, actual_speed):
+        errors = super().update(device, cpu, ram, prompt_len, actual_ttft, actual_speed)
+        history = self.history.get(device)
+        if history is None:
+            history = self.history[device] = deque(maxlen=self.window)
+        history.append(((cpu, ram, prompt_len), actual_ttft, actual_speed))
+        model = self.models[device]
+        if len(history) >= self.min_samples and model.updates % self.refit_every == 0:
+            X = [x for x, _, _ in history]
+            predictions = [model.predict(features(*x)) for x in X]
+            ttft_fit, speed_fit = StumpEnsemble(self.rounds), StumpEnsemble(self.rounds)
+            ttft_fit.fit(X, [ttft - p[0] * model.slowdown for (_, ttft, _), p in zip(history, predictions)])
+            speed_fit.fit(X, [speed - p[1] for (_, _, speed), p in zip(history, predictions)])
+            self.ensembles[device] = (ttft_fit, speed_fit)
+        return errors
+
+
+POLICIES = {policy.name: policy for policy in (LinUCBPolicy, ThompsonPolicy, EnsemblePolicy)}
+
+
+def make_policy(name, seed=None, **kwargs):
+    """Policy instance by name (see POLICIES); seed only applies to policies that draw samples"""
+    if name not in POLICIES:
+        raise ValueError(f"unknown policy {name} (expected one of {', '.join(POLICIES)})")
+    if name == "thompson":
+        kwargs["seed"] = seed
+    return POLICIES[name](**kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bandit policies against each other in the fleet simulator")
+    parser.add_argument("--policy", action="append", choices=sorted(POLICIES), help="Policy to run (repeatable); default all")
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=0.05, help="Task arrivals per simulated second")
+    parser.add_argument("--heterogeneity", type=float, default=0.4, help="Hidden per-device slowdown spread (log scale)")
+    parser.add_argument("--dataset", action="append", help="Measurement CSV (repeatable); defaults to v5p/dataset.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from fleet_simulator import FleetSimulator, TraceSampler
+
+    print(f"{'policy':<10} {'tasks':>6} {'regret s/task':>14} {'slow picks':>11} {'decide p50 us':>14} "
+          f"{'decide p95 us':>14} {'e2e p50 s':>10} {'e2e p95 s':>10}")
+    for name in args.policy or list(POLICIES):
+        sim = FleetSimulator(num_devices=args.devices, mode="bandit", policy=name, rate=args.rate,
+                             heterogeneity=args.heterogeneity, sampler=TraceSampler(args.dataset, seed=args.seed),
+                             seed=args.seed)
+        stats = sim.run(args.tasks)
+        bandit, e2e = stats["bandit"], stats["e2e"]
+        print(f"{name:<10} {bandit['decisions']:>6} {bandit['mean_regret']:>14.3f} {bandit['slow_picks']:>11.1%} "
+              f"{bandit['decision_p50'] * 1e6:>14.0f} {bandit['decision_p95'] * 1e6:>14.0f} "
+              f"{e2e['p50']:>10.2f} {e2e['p95']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
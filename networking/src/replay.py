@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Offline replay of recorded auctions
+Rebuilds every auction from the trace events both orchestrators log (the hub's
+orchestrator_events.jsonl, the mesh's orchestrator.log) and re-runs it under
+alternative selection policies, so a new ALPHA or set of score weights can be
+compared against what the fleet actually did without touching the fleet.
+
+Bids that carry no prediction (every hub bid before its device has run a
+task, or traces from older devices) get one recomputed from the trace the way
+DeviceClient makes it: an EWMA of the device's measured times, using only the
+results that had arrived when the auction started. LCB can then rank them.
+
+When a policy picks the device that actually ran the task, its latency is the
+measured one. Otherwise it is estimated from the trace: that device's bid
+prediction corrected by the device's mean residual, or its mean measured
+latency when the bid carried no prediction. The estimate ignores the load a
+different choice would have put on the chosen device, so treat small
+differences between policies as noise.
+
+Trace events (one JSON object per line; other lines are skipped):
+    auction_started  task_id, prompt_length
+    bid_received     task_id, device, cpu_load (0-1) or cpu_percent, ram_percent,
+                     battery, has_npu, free_npu, predicted_latency, uncertainty, score
+    auction_winner   task_id, device
+    task_latency     task_id, latency (mesh) or roundtrip (hub), ttft, speed,
+                     decode_ms, exec_ms (hub: the device's share of the round trip)
+
+    python3 replay.py orchestrator_events.jsonl --alpha 0 0.25 0.5 1 2
+    python3 replay.py /sdcard/mesh_network/orchestrator.log --policy lcb --policy weighted:cpu=2
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+
+from accuracy import ALPHA
+from latency import LatencyHistogram
+
+TRACE_EVENTS = ("auction_started", "bid_received", "auction_winner", "task_latency")
+
+
+def load_auctions(paths):
+    """Auctions in trace order: [{task_id, prompt_length, bids: {device: bid}, winner, actual, ttft, speed}]"""
+    auctions = {}
+    for path in paths:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict) or record.get("event") not in TRACE_EVENTS or "task_id" not in record:
+                    continue
+                auction = auctions.setdefault(record["task_id"], {
+                    "task_id": record["task_id"], "ts": record.get("ts", 0.0), "prompt_length": None,
+                    "bids": {}, "winner": None, "actual": None, "ttft": None, "speed": None,
+                    "device_time": None, "done": None})
+                event = record["event"]
+                if event == "auction_started":
+                    auction["prompt_length"] = record.get("prompt_length")
+                elif event == "bid_received":
+                    auction["bids"][record.get("device", "?")] = parse_bid(record)
+                elif event == "auction_winner":
+                    auction["winner"] = record.get("device")
+                else:
+                    actual = record.get("latency", record.get("roundtrip"))
+                    auction["actual"] = actual if isinstance(actual, (int, float)) else None
+                    auction["ttft"], auction["speed"] = record.get("ttft"), record.get("speed")
+                    device_ms = [record[key] for key in ("decode_ms", "exec_ms") if isinstance(record.get(key), (int, float))]
+                    auction["device_time"] = sum(device_ms) / 1000.0 if device_ms else None
+                    auction["done"] = record.get("ts")
+    return sorted((a for a in auctions.values() if a["bids"]), key=lambda a: a["ts"] or 0.0)
+
+
+def parse_bid(record):
+    """Normalise a bid_received event to the hub's bid shape (cpu_load in [0, 1], ram.usage_percent)"""
+    def number(key):
+        value = record.get(key)
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    cpu = number("cpu_load")
+    if cpu is None and number("cpu_percent") is not None:
+        cpu = number("cpu_percent") / 100.0
+    return {
+        "cpu_load": cpu if cpu is not None else 1.0,
+        "battery": number("battery"),
+        "ram": {"usage_percent": number("ram_percent")},
+        "has_npu": record.get("has_npu") is True,
+        "free_npu": record.get("free_npu") is True,
+        "predicted_latency": number("predicted_latency"),
+        "uncertainty": number("uncertainty") or 0.0,
+        "score": number("score"),
+    }
+
+
+def fill_predictions(auctions, weight=0.2):
+    """Give bids without predicted_latency the EWMA a device keeps of its own measured times.
+
+    What a device predicts is what it can measure: decode + exec on the hub,
+    the whole latency on the mesh. Only results in before the auction started
+    count, so a recomputed prediction never knows the outcome it predicts.
+    Returns the number of bids filled in.
+    """
+    finished = sorted((a for a in auctions if a["winner"] and a["actual"] is not None),
+                      key=lambda a: a["done"] if a["done"] is not None else a["ts"] or 0.0)
+    state = {}  # {device: (mean, variance)}
+    filled = applied = 0
+    for auction in auctions:
+        while applied < len(finished) and (finished[applied]["done"] or finished[applied]["ts"] or 0.0) <= (auction["ts"] or 0.0):
+            done = finished[applied]
+            applied += 1
+            measured = done["device_time"] if done["device_time"] is not None else done["actual"]
+            if done["winner"] not in state:
+                state[done["winner"]] = (measured, 0.0)
+                continue
+            mean, var = state[done["winner"]]
+            diff = measured - mean
+            state[done["winner"]] = (mean + weight * diff, (1 - weight) * (var + weight * diff * diff))
+        for device, bid in auction["bids"].items():
+            if bid["predicted_latency"] is None and device in state:
+                bid["predicted_latency"] = state[device][0]
+                bid["uncertainty"] = math.sqrt(state[device][1])
+                filled += 1
+    return filled
+
+
+class OutcomeModel:
+    def __init__(self, auctions):
+        """Per-device residuals and latencies of every executed task in the trace"""
+        residuals, latencies = {}, {}
+        for auction in auctions:
+            winner, actual = auction["winner"], auction["actual"]
+            if winner is None or actual is None:
+                continue
+            latencies.setdefault(winner, []).append(actual)
+            predicted = auction["bids"].get(winner, {}).get("predicted_latency")
+            if predicted is not None:
+                residuals.setdefault(winner, []).append(actual - predicted)
+        self.bias = {device: sum(r) / len(r) for device, r in residuals.items()}
+        self.mean = {device: sum(l) / len(l) for device, l in latencies.items()}
+
+    def estimate(self, auction, device):
+        """(latency, how) for running the auction's task on device; how is observed, model, mean or None"""
+        if device == auction["winner"] and auction["actual"] is not None:
+            return auction["actual"], "observed"
+        predicted = auction["bids"][device]["predicted_latency"]
+        if predicted is not None:
+            return max(predicted + self.bias.get(device, 0.0), 0.0), "model"
+        if device in self.mean:
+            return self.mean[device], "mean"
+        return None, None
+
+
+class LoggedPolicy:
+    name = "logged"
+
+    def choose(self, auction):
+        return auction["winner"] if auction["winner"] in auction["bids"] else None
+
+
+class LCBPolicy:
+    def __init__(self, alpha=ALPHA, prefer_free_npu=True):
+        """
+        Args:
+            alpha: Exploration weight; a bid scores predicted_latency - alpha * uncertainty, lowest wins
+            prefer_free_npu: Take a device with a free NPU first, as orchestrator.sh does
+        """
+        self.alpha = alpha
+        self.prefer_free_npu = prefer_free_npu
+        self.name = f"lcb(alpha={alpha:g})"
+
+    def choose(self, auction):
+        bids = auction["bids"]
+        if self.prefer_free_npu:
+            for device, bid in bids.items():
+                if bid["has_npu"] and bid["free_npu"]:
+                    return device
+        scored = {device: bid["predicted_latency"] - self.alpha * bid["uncertainty"]
+                  for device, bid in bids.items() if bid["predicted_latency"] is not None}
+        return min(scored, key=scored.get) if scored else None
+
+
+class WeightedPolicy:
+    def __init__(self, npu=1.0, battery=1.0, cpu=1.0, ram=1.0):
+        """The hub's score_bid with each component scaled by its weight; highest wins"""
+        from orchestrator import Orchestrator
+        self.score_bid = Orchestrator.score_bid
+        self.weights = {"npu": npu, "battery": battery, "cpu": cpu, "ram": ram}
+        changed = ",".join(f"{k}={v:g}" for k, v in self.weights.items() if v != 1.0)
+        self.name = f"weighted({changed})" if changed else "weighted"
+
+    def choose(self, auction):
+        totals = {}
+        for device, bid in auction["bids"].items():
+            score = self.score_bid(bid)
+            totals[device] = sum(weight * score[key] for key, weight in self.weights.items())
+        return max(totals, key=totals.get)
+
+
+class LeastLoadedPolicy:
+    name = "least_loaded"
+
+    def choose(self, auction):
+        return min(auction["bids"], key=lambda device: auction["bids"][device]["cpu_load"])
+
+
+class RandomPolicy:
+    name = "random"
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def choose(self, auction):
+        return self.rng.choice(sorted(auction["bids"]))
+
+
+def replay(auctions, policies, outcomes=None):
+    """Per-policy counterfactual summary over the auctions whose logged winner has a measured latency"""
+    outcomes = outcomes or OutcomeModel(auctions)
+    measured = [a for a in auctions if a["actual"] is not None and a["winner"] in a["bids"]]
+    results = []
+    for policy in policies:
+        hist = LatencyHistogram()
+        agree = unestimated = 0
+        for auction in measured:
+            device = policy.choose(auction)
+            latency, how = outcomes.estimate(auction, device) if device else (None, None)
+            if latency is None:
+                unestimated += 1
+                continue
+            agree += how == "observed"
+            hist.record(latency)
+        summary = hist.summary()
+        results.append({"policy": policy.name, "auctions": len(measured), "agreement": agree / len(measured) if measured else 0.0,
+                        "estimated": hist.count, "unestimated": unestimated, "mean": summary["mean"],
+                        "p50": summary["p50"], "p95": summary["p95"]})
+    return results
+
+
+def format_table(results):
+    lines = [f"{'policy':<32} {'tasks':>6} {'agree':>6} {'mean s':>8} {'p50 s':>8} {'p95 s':>8} {'no est':>7}"]
+    for r in results:
+        lines.append(f"{r['policy']:<32} {r['estimated']:>6} {r['agreement']:>6.0%} {r['mean']:>8.2f} "
+                     f"{r['p50']:>8.2f} {r['p95']:>8.2f} {r['unestimated']:>7}")
+    return "\n".join(lines)
+
+
+def parse_policy(spec):
+    """logged | lcb[:alpha=A,npu=0] | weighted[:npu=W,battery=W,cpu=W,ram=W] | least_loaded | random[:seed=S]"""
+    name, _, args = spec.partition(":")
+    params = dict(part.split("=", 1) for part in args.split(",") if "=" in part)
+    if name == "logged":
+        return LoggedPolicy()
+    if name == "lcb":
+        return LCBPolicy(float(params.get("alpha", ALPHA)), params.get("npu", "1") not in ("0", "false"))
+    if name == "weighted":
+        return WeightedPolicy(**{key: float(value) for key, value in params.items()})
+    if name == "least_loaded":
+        return LeastLoadedPolicy()
+    if name == "random":
+        return RandomPolicy(int(params.get("seed", 0)))
+    raise ValueError(f"unknown policy {spec}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded auctions under alternative scoring policies")
+    parser.add_argument("files", nargs="+", help="Hub event logs and/or mesh orchestrator.log files")
+    parser.add_argument("--policy", action="append", default=[],
+                        help="Policy to replay (repeatable), e.g. lcb:alpha=1, weighted:cpu=2,battery=0.5")
+    parser.add_argument("--alpha", type=float, nargs="*", default=[], help="Shorthand for one lcb policy per ALPHA")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    auctions = load_auctions(args.files)
+    if not auctions:
+        print("No auctions found in the trace")
+        return 1
+    recomputed = fill_predictions(auctions)
+    policies = [LoggedPolicy()] + [parse_policy(spec) for spec in args.policy] + [LCBPolicy(a) for a in args.alpha]
+    if len(policies) == 1:
+        policies += [LCBPolicy(), LeastLoadedPolicy(), RandomPolicy()]
+    results = replay(auctions, policies)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    executed = sum(a["actual"] is not None for a in auctions)
+    print(f"{len(auctions)} auctions, {executed} with a measured latency, {recomputed} bid predictions recomputed")
+    print(format_table(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
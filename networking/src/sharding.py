@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Sharded hub: several orchestrators, each owning part of the fleet
+Orchestrators (shards) find each other from one or more --peer seeds and then
+gossip: every shard_status lists the members the sender knows, and each shard
+dials the ones it is not linked to yet. A consistent-hash ring over the live
+shard IDs decides which shard owns each device:
+
+    register     a device that registers with a shard that does not own it is
+                 sent a redirect and reconnects to its owner
+    rebalance    when a shard joins or stops answering (member_timeout), the
+                 ring changes; once it has been stable for settle seconds,
+                 idle devices that now belong elsewhere are redirected. Only
+                 about 1/N of the devices move
+    work stealing  every status carries how many of the sender's devices are
+                 free. A shard whose own devices are all overloaded hands a
+                 new task to the peer with the most free devices, which runs
+                 the auction and returns the result
+    leave        stop() tells the peers and hands every device to its next
+                 owner before the process exits
+
+Shards talk over the ordinary orchestrator port with shard_* messages. Each
+shard sends on the links it dialed and receives on the ones it accepted.
+
+    python3 orchestrator.py --shard-id hub-a --advertise 192.168.1.10:8080
+    python3 orchestrator.py --shard-id hub-b --advertise 192.168.1.11:8080 --peer 192.168.1.10:8080
+"""
+
+import bisect
+import hashlib
+import json
+import socket
+import threading
+import time
+
+from conn_writer import ConnWriter
+from failure_detector import enable_keepalive
+
+VNODES = 64  # Points per shard on the ring; more spread devices more evenly
+
+
+def parse_address(text):
+    """(host, port) from "host:port" """
+    host, _, port = text.rpartition(":")
+    return host, int(port)
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes=(), vnodes=VNODES):
+        self.vnodes = vnodes
+        self.points = []  # Sorted [(hash, node)], vnodes per node
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes():
+            return
+        for i in range(self.vnodes):
+            bisect.insort(self.points, (ring_hash(f"{node}#{i}"), node))
+
+    def remove(self, node):
+        self.points = [point for point in self.points if point[1] != node]
+
+    def nodes(self):
+        return {node for _, node in self.points}
+
+    def owner(self, key):
+        """Node owning key: the first point clockwise from its hash, or None on an empty ring"""
+        if not self.points:
+            return None
+        i = bisect.bisect(self.points, (ring_hash(key),))
+        return self.points[i % len(self.points)][1]
+
+
+class ShardCoordinator:
+    def __init__(self, orchestrator, shard_id, address, peers=(), vnodes=VNODES, status_interval=1.0,
+                 member_timeout=5.0, settle=3.0, retry_interval=5.0):
+        """
+        Args:
+            orchestrator: This shard's Orchestrator
+            shard_id: Unique name of this shard on the ring
+            address: (host, port) that peers and redirected devices connect to
+            peers: "host:port" seeds; the rest of the members are learned from them
+            vnodes: Ring points per shard
+            status_interval: Seconds between shard_status messages to every peer
+            member_timeout: Seconds without a status before a peer is dropped from the ring
+            settle: Seconds the ring must stay unchanged before devices are moved
+            retry_interval: Seconds between attempts to (re)connect to a peer
+        """
+        self.orchestrator = orchestrator
+        self.shard_id = shard_id
+        self.address = tuple(address)
+        self.seeds = [parse_address(peer) for peer in peers]
+        self.status_interval = status_interval
+        self.member_timeout = member_timeout
+        self.settle = settle
+        self.retry_interval = retry_interval
+        self.lock = threading.Lock()
+        self.members = {}     # {shard_id: {"address": (host, port), "status": latest shard_status data, "seen": t}}
+        self.links = {}       # {(host, port): ConnWriter} connections this shard dialed
+        self.dialing = set()  # Addresses with a dialer thread
+        self.ring = HashRing([shard_id], vnodes)
+        self.ring_changed = time.monotonic()
+        self.leaving = False
+
+    @property
+    def log(self):
+        return self.orchestrator.log
+
+    def start(self):
+        for address in self.seeds:
+            self.dial(address)
+        threading.Thread(target=self.tick_loop, daemon=True).start()
+        self.log.info("shard_started", f"Shard {self.shard_id} at {self.address[0]}:{self.address[1]}",
+                      shard=self.shard_id, peers=len(self.seeds))
+        return self
+
+    # Links
+
+    def dial(self, address):
+        address = tuple(address)
+        with self.lock:
+            if address == self.address or address in self.dialing:
+                return
+            self.dialing.add(address)
+        threading.Thread(target=self.dial_loop, args=(address,), daemon=True).start()
+
+    def dial_loop(self, address):
+        """Keep one outgoing link to a peer; the peer never writes on it, so recv only returns at EOF"""
+        while not self.leaving:
+            try:
+                sock = socket.create_connection(address, timeout=self.retry_interval)
+                sock.settimeout(None)
+                enable_keepalive(sock)
+            except OSError:
+                time.sleep(self.retry_interval)
+                continue
+            link = ConnWriter(sock, name=f"shard {address[0]}:{address[1]}", log=self.log)
+            with self.lock:
+                self.links[address] = link
+            self.send_link(link, "shard_status", self.status())
+            try:
+                while sock.recv(4096):
+                    pass
+            except OSError:
+                pass
+            link.close()
+            sock.close()
+            with self.lock:
+                if self.links.get(address) is link:
+                    del self.links[address]
+            time.sleep(self.retry_interval)
+
+    def message(self, kind, data, task_id=""):
+        return json.dumps({"type": kind, "agent_id": self.shard_id, "task_id": task_id, "subtask": "",
+                           "data": data}).encode()
+
+    def send_link(self, link, kind, data, task_id=""):
+        try:
+            link.send(self.message(kind, data, task_id))
+            return True
+        except Exception as e:
+            self.log.warn("shard_send_failed", f"Failed to send {kind} to {link.name}: {e}", kind=kind)
+            return False
+
+    def send_to(self, shard, kind, data, task_id=""):
+        with self.lock:
+            member = self.members.get(shard)
+            link = self.links.get(member["address"]) if member else None
+        return link is not None and self.send_link(link, kind, data, task_id)
+
+    # Membership
+
+    def status(self):
+        """This shard's shard_status: where to reach it, its spare capacity and the members it knows"""
+        orchestrator = self.orchestrator
+        with self.lock:
+            members = [[shard, *member["address"]] for shard, member in self.members.items()]
+        return {"address": list(self.address), "free": len(orchestrator.eligible_devices("classify")),
+                "devices": len(orchestrator.devices), "pending": len(orchestrator.pending_bids), "members": members}
+
+    def handle_message(self, msg, conn):
+        """Route a shard_* message received on a link a peer dialed"""
+        kind, sender, data = msg["type"], msg.get("agent_id"), msg.get("data", {})
+        if kind == "shard_status":
+            self.on_status(sender, data)
+        elif kind == "shard_leave":
+            self.drop_member(sender, "left")
+        elif kind == "shard_task":
+            self.run_remote_task(sender, msg.get("task_id"), data)
+        elif kind == "shard_result":
+            self.finish_remote_task(msg.get("task_id"), data.get("result", {}))
+
+    def on_status(self, shard, data):
+        address = tuple(data["address"])
+        with self.lock:
+            joined = shard not in self.members
+            self.members[shard] = {"address": address, "status": data, "seen": time.monotonic()}
+            if joined:
+                self.ring.add(shard)
+                self.ring_changed = time.monotonic()
+        if joined:
+            self.log.info("shard_joined", f"Shard {shard} joined at {address[0]}:{address[1]}", shard=shard)
+        self.dial(address)
+        for member, host, port in data.get("members", ()):
+            if member != self.shard_id:
+                self.dial((host, port))
+
+    def drop_member(self, shard, reason):
+        with self.lock:
+            member = self.members.pop(shard, None)
+            if member is None:
+                return
+            self.ring.remove(shard)
+            self.ring_changed = time.monotonic()
+            link = self.links.pop(member["address"], None)
+        if link is not None:
+            link.close()  # A silent peer may never send FIN; dial_loop then redials and it rejoins once it answers
+        self.log.warn("shard_left", f"Shard {shard} left the ring: {reason}", shard=shard, reason=reason)
+
+    def tick_loop(self):
+        while True:
+            time.sleep(self.status_interval)
+            if self.leaving:
+                return  # No status may follow shard_leave, or the peers would take this shard back
+            status = self.status()
+            with self.lock:
+                links = list(self.links.values())
+                silent = [shard for shard, member in self.members.items()
+                          if time.monotonic() - member["seen"] > self.member_timeout]
+            for link in links:
+                self.send_link(link, "shard_status", status)
+            for shard in silent:
+                self.drop_member(shard, f"no status for {self.member_timeout:.0f}s")
+            if time.monotonic() - self.ring_changed >= self.settle:
+                self.rebalance()
+
+    # Device ownership
+
+    def foreign_owner(self, device_id, ring=None):
+        """(shard, address) of the peer owning device_id, or None if it is ours or the ring is still settling"""
+        with self.lock:
+            if ring is None and time.monotonic() - self.ring_changed < self.settle:
+                return None
+            owner = (ring or self.ring).owner(device_id)
+            member = self.members.get(owner)
+            return (owner, member["address"]) if owner != self.shard_id and member else None
+
+    def redirect_if_foreign(self, device_id, conn):
+        """At registration: send device_id to its owner; True if it was redirected"""
+        target = self.foreign_owner(device_id)
+        if target is None:
+            return False
+        self.redirect(device_id, *target, conn=conn)
+        return True
+
+    def rebalance(self, ring=None):
+        """Redirect registered devices that belong to another shard; busy ones wait for their results"""
+        orchestrator = self.orchestrator
+        busy = orchestrator.busy_devices()
+        for device_id in list(orchestrator.devices):
+            if ring is None and device_id in busy:
+                continue
+            target = self.foreign_owner(device_id, ring)
+            if target is not None:
+                self.redirect(device_id, *target)
+
+    def redirect(self, device_id, shard, address, conn=None):
+        """Drop device_id from this shard's registry and tell it to reconnect to address"""
+        orchestrator = self.orchestrator
+        with orchestrator.lock:
+            device_info = orchestrator.devices.pop(device_id, None)
+            orchestrator.unindex_device(device_id)
+        conn = conn or (device_info or {}).get("conn")
+        if conn is None:
+            return
+        redirect = {"type": "redirect", "agent_id": "orchestrator", "task_id": "", "subtask": "",
+                    "data": {"host": address[0], "port": address[1], "shard": shard}}
+        try:
+            conn.send(json.dumps(redirect).encode())
+        except Exception as e:
+            self.log.warn("redirect_failed", f"Failed to redirect {device_id} to {shard}: {e}", device=device_id, shard=shard)
+            return
+        orchestrator.count("orchestrator_device_redirects_total", shard=shard)
+        self.log.info("device_redirected", f"{device_id} belongs to shard {shard}, redirected to {address[0]}:{address[1]}",
+                      device=device_id, shard=shard)
+
+    def stop(self, timeout=2.0):
+        """Leave the ring: tell the peers, then hand every device to its owner among the remaining shards"""
+        with self.lock:
+            links = list(self.links.values())
+            remaining = HashRing(list(self.members), self.ring.vnodes)
+        conns = [info["conn"] for info in list(self.orchestrator.devices.values())] + links
+        self.leaving = True
+        for link in links:
+            self.send_link(link, "shard_leave", {})
+        self.rebalance(ring=remaining)
+        # Writers are daemon threads; let the redirects out before the process exits
+        deadline = time.monotonic() + timeout
+        for conn in conns:
+            if isinstance(conn, ConnWriter):
+                conn.flush(max(deadline - time.monotonic(), 0.0))
+        self.log.info("shard_stopped", f"Shard {self.shard_id} left the ring", shard=self.shard_id)
+
+    # Work stealing
+
+    def offload(self, task_id, source_device, data):
+        """Hand a task to the peer with the most free devices; returns that shard, or None if none has room"""
+        with self.lock:
+            candidates = [(member["status"].get("free", 0), shard) for shard, member in self.members.items()
+                          if member["address"] in self.links]
+            free, shard = max(candidates, default=(0, None))
+            if free <= 0:
+                return None
+            self.members[shard]["status"]["free"] = free - 1  # Until its next status, count the task against it
+        task = {"image_base64": data.get("image_base64", ""), "source": source_device}
+        if not self.send_to(shard, "shard_task", task, task_id):
+            return None
+        self.orchestrator.count("orchestrator_shard_offloads_total", shard=shard)
+        self.log.info("task_offloaded", f"No free device here, task {task_id} handed to shard {shard}",
+                      task_id=task_id, shard=shard, free=free)
+        return shard
+
+    def run_remote_task(self, origin, origin_task_id, data):
+        """Auction a task a saturated peer handed over, and send the result back to it"""
+        def reply(result):
+            if not self.send_to(origin, "shard_result", {"result": result}, origin_task_id):
+                self.log.warn("shard_result_lost", f"Could not return task {origin_task_id} to shard {origin}",
+                              task_id=origin_task_id, shard=origin)
+
+        # shard_origin keeps the task from being handed on again
+        self.orchestrator.handle_image_received(f"shard:{origin}", dict(data, shard_origin=origin), on_result=reply)
+
+    def finish_remote_task(self, task_id, result):
+        orchestrator = self.orchestrator
+        orchestrator.latency.mark(task_id, "shard_remote")
+        orchestrator.latency.finish(task_id)
+        orchestrator.count("orchestrator_results_total", device=result.get("device", "unknown"),
+                           status=result.get("status", "unknown"))
+        orchestrator.complete_task(task_id, result)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Vectorised postprocessing of SNPE InceptionV3 outputs
+Memory-maps every Result_N/InceptionV3/Predictions/Reshape_1:0.raw under an
+output directory, stacks them into one (images, classes) array and takes the
+top-k labels and confidences of all of them in one pass, instead of forking
+the postprocess binary (plus awk and cut) once per result. The parsed label
+file is cached until it changes on disk. numpy is only imported once there
+are outputs to load, so the hub can use parse_postprocess_line without it.
+
+Rows come back in Result_N order, which is the order of target_raw_list.txt.
+A Result_N without an output tensor keeps its row as missing_file (confidence
+0.0, index -1), like the shell fallback that runs the binary per result.
+
+    python3 snpe_postprocess.py /data/local/tmp/snpe-bundle/output -k 3
+    python3 snpe_postprocess.py output --format postprocess   # "<confidence> <index> <label>" per image
+    python3 snpe_postprocess.py output --format labels        # "label; label; " like postprocess_all
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+OUTPUT_TENSOR = os.path.join("InceptionV3", "Predictions", "Reshape_1:0.raw")
+DEFAULT_LABELS = "/data/local/tmp/snpe-bundle/imagenet_slim_labels.txt"
+
+_labels_cache = {}  # {path: (mtime, [label])}
+
+
+def load_labels(path=DEFAULT_LABELS):
+    """Labels by class index, parsed once per version of the file"""
+    mtime = os.path.getmtime(path)
+    cached = _labels_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            cached = _labels_cache[path] = (mtime, [line.rstrip("\r\n") for line in f])
+    return cached[1]
+
+
+MISSING = ("missing_file", -1, 0.0)  # Top entry of a result without output tensor
+
+
+def result_files(output_dir):
+    """Reshape_1:0.raw path of every Result_N directory, in numeric N order, whether it exists or not"""
+    found = []
+    for name in os.listdir(output_dir):
+        match = re.fullmatch(r"Result_(\d+)", name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(output_dir, name, OUTPUT_TENSOR)))
+    return [path for _, path in sorted(found)]
+
+
+def load_outputs(paths):
+    """(len(paths), classes) float32 array of the memory-mapped output tensors"""
+    import numpy as np
+    if not paths:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack([np.memmap(path, dtype=np.float32, mode="r") for path in paths])
+
+
+def top_k(scores, k=5):
+    """(indices, confidences), both (images, k), best first for every row"""
+    import numpy as np
+    k = min(k, scores.shape[1])
+    part = np.argpartition(scores, -k, axis=1)[:, -k:]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    indices = np.take_along_axis(part, order, axis=1)
+    return indices, np.take_along_axis(scores, indices, axis=1)
+
+
+def classify(output_dir, labels_path=DEFAULT_LABELS, k=5):
+    """[{result, top: [(label, index, confidence)]}] for every result under output_dir"""
+    paths = result_files(output_dir)
+    if not paths:
+        return []
+    labels = load_labels(labels_path)
+    present = [path for path in paths if os.path.isfile(path)]
+    top = {}
+    if present:
+        indices, confidences = top_k(load_outputs(present), k)
+        for path, row_i, row_c in zip(present, indices, confidences):
+            top[path] = [(labels[i] if i < len(labels) else "unknown", int(i), float(c)) for i, c in zip(row_i, row_c)]
+    return [{"result": os.path.relpath(path, output_dir), "top": top.get(path, [MISSING])} for path in paths]
+
+
+def parse_postprocess_line(line):
+    """(confidence, index, label) from the postprocess binary's "<maxValue> <maxIdx> <label>", or None"""
+    parts = line.strip().split(" ", 2)
+    try:
+        return float(parts[0]), int(parts[1]), parts[2] if len(parts) > 2 else ""
+    except (ValueError, IndexError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Top-k labels for every SNPE InceptionV3 result in an output directory")
+    parser.add_argument("output_dir", help="snpe-net-run --output_dir")
+    parser.add_argument("--labels", default=DEFAULT_LABELS)
+    parser.add_argument("-k", type=int, default=5, help="Labels per image")
+    parser.add_argument("--format", choices=("json", "postprocess", "labels"), default="json")
+    args = parser.parse_args()
+
+    results = classify(args.output_dir, args.labels, args.k)
+    if not results:
+        print(f"No results under {args.output_dir}", file=sys.stderr)
+        return 1
+    if args.format == "postprocess":
+        for r in results:
+            label, index, confidence = r["top"][0]
+            print(f"{confidence:g} {index} {label}")
+    elif args.format == "labels":
+        print("".join(f"{r['top'][0][0]}; " for r in results))
+    else:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the orchestrator entry points
+Starts each entry point in a fresh interpreter, the way a supervisor restarts
+a crashed orchestrator, and times it from spawn until it is ready: for the hub
+that means a client connection was accepted on its port. It also reports any
+heavy optional module (numpy, cv2, ...) that got imported on the way. Those
+belong in the feature that needs them (image_pipeline, snpe_postprocess.classify,
+features), not in the startup path.
+
+Exits 1 when an entry point misses the budget or loads a heavy module, so it
+can gate changes on the phones as well as on a laptop:
+
+    python3 startup_bench.py --runs 5 --budget 0.5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ("numpy", "cv2", "tokenizers", "torch")
+
+# Each snippet runs in a fresh interpreter with src on sys.path and ends up ready to serve
+ENTRY_POINTS = {
+    "orchestrator": (
+        "import socket\n"
+        "from orchestrator import Orchestrator\n"
+        "hub = Orchestrator(host='127.0.0.1', port=0, log_path=None)\n"
+        "hub.run()\n"
+        "socket.create_connection(hub.server.getsockname(), timeout=5).close()\n"
+    ),
+    "orchestrator_p2p": (
+        "from orchestrator_p2p import P2POrchestrator\n"
+        "P2POrchestrator(mesh_dir={mesh_dir!r})\n"
+    ),
+    "story_pipeline": (
+        "import story_pipeline\n"
+    ),
+}
+
+# Written to a file: the hub's accept thread prints to stdout while this runs
+REPORT = (
+    "\nimport json, os, sys\n"
+    "with open({report!r}, 'w') as f:\n"
+    "    json.dump([m for m in {heavy!r} if m in sys.modules], f)\n"
+    "os._exit(0)\n"  # The hub's accept thread is not a daemon
+)
+
+
+def measure(name, mesh_dir):
+    """(seconds from spawn to ready, heavy modules loaded) for one cold start of an entry point"""
+    report = os.path.join(mesh_dir, "startup_report.json")
+    if os.path.exists(report):
+        os.remove(report)
+    code = ENTRY_POINTS[name].format(mesh_dir=mesh_dir) + REPORT.format(report=report, heavy=HEAVY_MODULES)
+    src = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], cwd=src, capture_output=True, text=True, timeout=60)
+    elapsed = time.perf_counter() - start
+    if os.path.exists(report):
+        with open(report) as f:
+            return elapsed, json.load(f)
+    raise RuntimeError(f"{name} did not start: {(proc.stderr.strip().splitlines() or ['no output'])[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time cold starts of the orchestrator entry points against a budget")
+    parser.add_argument("--entry", action="append", choices=sorted(ENTRY_POINTS), help="Entry point (repeatable); default all")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per entry point; the median is compared")
+    parser.add_argument("--budget", type=float, default=0.5, help="Seconds from spawn to ready")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'entry point':<18} {'median ms':>10} {'max ms':>8}  heavy modules")
+    with tempfile.TemporaryDirectory() as mesh_dir:
+        for name in args.entry or list(ENTRY_POINTS):
+            try:
+                runs = [measure(name, mesh_dir) for _ in range(args.runs)]
+            except (RuntimeError, subprocess.TimeoutExpired) as e:
+                print(f"{name:<18} {'-':>10} {'-':>8}  FAILED: {e}")
+                failed = True
+                continue
+            times = sorted(t for t, _ in runs)
+            median = times[len(times) // 2]
+            heavy = sorted({m for _, loaded in runs for m in loaded})
+            over = median > args.budget
+            failed |= over or bool(heavy)
+            print(f"{name:<18} {median * 1000:>10.1f} {times[-1] * 1000:>8.1f}  {', '.join(heavy) or '-'}"
+                  f"{'  OVER BUDGET' if over else ''}")
+    print(f"Budget: {args.budget * 1000:.0f} ms, no heavy modules at startup -> {'FAIL' if failed else 'OK'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
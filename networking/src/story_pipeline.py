@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Overlapped vision-to-story pipeline on the hub
+primitive_agent.sh runs its stages back to back: classify every image, then
+postprocess, then one Genie generation. Here the three stages run at once,
+connected by bounded queues:
+
+    dispatch   auctions the images; at most max_inflight are outstanding, so
+               a slow prompt stage pushes back on classification
+    assemble   takes labels as results arrive and streams each one to the
+               story device as a story_chunk, while images are still being
+               classified elsewhere
+    generate   the story device is picked up front and kept out of the
+               classification auctions; generate_story goes out the moment
+               the last label is in (or the deadline passes, dropping
+               stragglers)
+
+genie-t2t-run takes its prompt at launch, so the device cannot prefill chunk
+by chunk; what overlaps is classification with prompt transfer and the story
+device's idle time, and end-to-end latency tracks the slowest classification
+instead of the sum of all of them.
+
+    python3 story_pipeline.py photos/*.jpg --query "Write a short story" --devices 3
+"""
+
+import argparse
+import base64
+import queue
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from snpe_postprocess import parse_postprocess_line
+
+PROMPT = "Write a short story that includes these objects: {labels}"
+
+
+class StoryPipeline:
+    def __init__(self, orchestrator, max_inflight=4, deadline=120.0, story_timeout=300.0):
+        """
+        Args:
+            orchestrator: Hub Orchestrator that runs the auctions and talks to devices
+            max_inflight: Classifications dispatched but not yet consumed by the prompt stage
+            deadline: Seconds after the start to stop waiting for labels and generate anyway
+            story_timeout: Seconds to wait for the story device once generate_story is sent
+        """
+        self.orchestrator = orchestrator
+        self.max_inflight = max_inflight
+        self.deadline = deadline
+        self.story_timeout = story_timeout
+
+    def pick_story_device(self):
+        """Least loaded device that can generate stories, or None"""
+        candidates = self.orchestrator.eligible_devices("generate_story", skip_overloaded=False)
+        devices = self.orchestrator.devices
+        loads = {d: devices[d]["metrics"].get("cpu_load", 1.0) for d in candidates if d in devices}
+        return min(loads, key=loads.get) if loads else None
+
+    def run(self, images, query=None, source="story_pipeline"):
+        """Start a story from base64 images; returns a Future of {story, labels, device, timing}"""
+        future = Future()
+        story_device = self.pick_story_device()
+        if story_device is None:
+            future.set_exception(RuntimeError("no device can generate stories"))
+            return future
+        story_id = str(uuid.uuid4())
+        run = {
+            "story_id": story_id, "device": story_device, "query": query, "source": source,
+            "labels": queue.Queue(maxsize=self.max_inflight),  # Never fills: slots bound what is in flight
+            "slots": threading.Semaphore(self.max_inflight),
+            "start": time.monotonic(), "timing": {}, "future": future, "stopped": False,
+        }
+        self.orchestrator.log.info("story_started", f"Story {story_id}: {len(images)} images, story on {story_device}",
+                                   story_id=story_id, device=story_device, images=len(images))
+        threading.Thread(target=self.dispatch, args=(run, images), daemon=True).start()
+        threading.Thread(target=self.assemble, args=(run, len(images)), daemon=True).start()
+        return future
+
+    def mark(self, run, stage):
+        run["timing"].setdefault(stage, round(time.monotonic() - run["start"], 4))
+
+    def dispatch(self, run, images):
+        """Stage 1: auction each image once a slot is free; the label (or None) lands on the queue"""
+        for index, image_base64 in enumerate(images):
+            run["slots"].acquire()
+            if run["stopped"]:
+                return
+            # Called on a device's reader thread; a free slot guarantees room on the queue
+            self.orchestrator.handle_image_received(
+                run["source"], {"image_base64": image_base64}, exclude=(run["device"],),
+                on_result=lambda data, index=index: run["labels"].put_nowait((index, self.label_of(data))))
+        self.mark(run, "dispatched")
+
+    @staticmethod
+    def label_of(data):
+        if data.get("status") != "classification_complete":
+            return None
+        parsed = parse_postprocess_line(data.get("classification", ""))
+        return parsed[2] if parsed else data.get("classification") or None
+
+    def assemble(self, run, expected):
+        """Stage 2: stream labels to the story device as they arrive, then start generation"""
+        labels, received = {}, 0
+        while received < expected:
+            remaining = self.deadline - (time.monotonic() - run["start"])
+            try:
+                index, label = run["labels"].get(timeout=max(remaining, 0.0))
+            except queue.Empty:
+                self.orchestrator.log.warn("story_deadline", f"Story {run['story_id']}: generating with "
+                                           f"{received}/{expected} labels", story_id=run["story_id"],
+                                           received=received, expected=expected)
+                break
+            received += 1
+            run["slots"].release()
+            self.mark(run, "first_label")
+            if label is None:
+                continue
+            labels[index] = label
+            self.orchestrator.send_task(run["device"], f"{run['story_id']}-chunk-{index}", "story_chunk",
+                                        {"story_id": run["story_id"], "seq": index, "label": label}, track=False)
+        self.mark(run, "last_label")
+        # Dispatch may still be waiting for a slot after the deadline
+        run["stopped"] = True
+        run["slots"].release()
+        self.generate(run, [labels[i] for i in sorted(labels)])
+
+    def generate(self, run, labels):
+        """Stage 3: ask the story device to generate from the labels it already has"""
+        prompt = (run["query"] + " " if run["query"] else "") + PROMPT.format(labels=", ".join(labels))
+        timer = threading.Timer(self.story_timeout, self.orchestrator.complete_task, args=(
+            run["story_id"], {"status": "error", "message": "story timed out"}))
+        timer.daemon = True
+
+        def on_story(data):
+            timer.cancel()
+            self.mark(run, "story")
+            result = {"story_id": run["story_id"], "device": run["device"], "labels": labels,
+                      "story": data.get("story"), "status": data.get("status"), "timing": run["timing"]}
+            self.orchestrator.log.info("story_finished", f"Story {run['story_id']} ({data.get('status')}) in "
+                                       f"{run['timing']['story']:.1f}s", story_id=run["story_id"],
+                                       status=data.get("status"), labels=len(labels), **run["timing"])
+            if not run["future"].done():
+                run["future"].set_result(result)
+
+        self.mark(run, "generate_sent")
+        if self.orchestrator.send_task(run["device"], run["story_id"], "generate_story",
+                                       {"story_id": run["story_id"], "prompt": prompt, "labels": labels}, on_story):
+            timer.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify images across the fleet and stream the labels into a story")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--query", help="Instruction prepended to the label prompt")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--devices", type=int, default=2, help="Connected devices to wait for before starting")
+    parser.add_argument("--max-inflight", type=int, default=4)
+    parser.add_argument("--deadline", type=float, default=120.0)
+    parser.add_argument("--bid-window", type=float, default=1.0)
+    args = parser.parse_args()
+
+    from orchestrator import Orchestrator
+    orchestrator = Orchestrator(port=args.port)
+    orchestrator.bid_window = args.bid_window
+    orchestrator.run()
+    print(f"Waiting for {args.devices} devices...")
+    while len(orchestrator.devices) < args.devices:
+        time.sleep(1)
+
+    images = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            images.append(base64.b64encode(f.read()).decode("ascii"))
+    pipeline = StoryPipeline(orchestrator, args.max_inflight, args.deadline)
+    result = pipeline.run(images, args.query).result()
+    print(f"Labels: {', '.join(result['labels'])}")
+    print(f"Timing: {result['timing']}")
+    print(result["story"] or f"(no story: {result['status']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
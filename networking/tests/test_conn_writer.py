@@ -0,0 +1,81 @@
+import socket
+import threading
+
+import pytest
+
+from conn_writer import ConnWriter, QueueFull
+
+
+def read_exactly(sock, size):
+    chunks, received = [], 0
+    while received < size:
+        chunk = sock.recv(min(65536, size - received))
+        assert chunk, "peer closed early"
+        chunks.append(chunk)
+        received += len(chunk)
+    return b"".join(chunks)
+
+
+@pytest.fixture
+def pair():
+    hub, device = socket.socketpair()
+    yield hub, device
+    hub.close()
+    device.close()
+
+
+def test_message_larger_than_cap_goes_out_on_an_empty_queue(pair):
+    hub, device = pair
+    writer = ConnWriter(hub, max_bytes=1024)
+    payload = bytes(range(256)) * 8192  # 2 MB, far over the cap
+    received = {}
+    reader = threading.Thread(target=lambda: received.setdefault("data", read_exactly(device, len(payload))))
+    reader.start()
+    writer.send(payload)
+    reader.join(10)
+    assert received["data"] == payload
+
+
+def test_float32_tensor_batch_fits_default_cap(pair):
+    hub, device = pair
+    writer = ConnWriter(hub)  # The orchestrator's default send_queue_bytes
+    batch = b"x" * 4_291_354  # Three float32 tensors in base64, as in a classify_batch message
+    reader = threading.Thread(target=read_exactly, args=(device, len(batch)))
+    reader.start()
+    assert writer.send(batch) == len(batch)
+    reader.join(10)
+    assert writer.flush(5)
+
+
+def test_backlog_over_cap_is_refused_in_drop_mode(pair):
+    hub, device = pair
+    drops = []
+    writer = ConnWriter(hub, max_bytes=64 * 1024, on_drop=drops.append)
+    writer.send(b"a" * (4 * 1024 * 1024))  # Device never reads: stays queued
+    with pytest.raises(QueueFull):
+        writer.send(b"b" * (128 * 1024))
+    assert drops == ["queue_full"]
+    assert not writer.closed
+    writer.close()
+
+
+def test_backlog_over_cap_drops_the_connection_in_disconnect_mode(pair):
+    hub, device = pair
+    writer = ConnWriter(hub, max_bytes=64 * 1024, overflow="disconnect")
+    writer.send(b"a" * (4 * 1024 * 1024))
+    with pytest.raises(ConnectionError) as raised:
+        writer.send(b"b" * (128 * 1024))
+    assert not isinstance(raised.value, QueueFull)
+    assert writer.closed
+    with pytest.raises(ConnectionError):
+        writer.send(b"c")
+
+
+def test_messages_arrive_whole_and_in_order(pair):
+    hub, device = pair
+    writer = ConnWriter(hub)
+    messages = [f'{{"seq": {i}}}'.encode() for i in range(200)]
+    for message in messages:
+        writer.send(message)
+    assert writer.flush(5)
+    assert read_exactly(device, sum(map(len, messages))) == b"".join(messages)
@@ -0,0 +1,69 @@
+import math
+
+from failure_detector import PhiAccrualDetector, phi
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def regular_device(interval=1.0, beats=20):
+    """Detector and clock for a device that sent beats heartbeats, interval apart; the clock is at the last one"""
+    clock = Clock()
+    detector = PhiAccrualDetector(clock=clock, first_interval=interval)
+    for n in range(beats):
+        clock.now = n * interval
+        detector.heartbeat("d")
+    return detector, clock
+
+
+def test_phi_rises_with_silence_until_the_device_is_suspected():
+    detector, clock = regular_device()
+    last = clock.now
+    values = []
+    for silence in (0.0, 1.0, 2.0, 3.0, 4.0, 6.0):
+        clock.now = last + silence
+        values.append(detector.phi("d"))
+    assert values == sorted(values) and values[0] < values[-1]
+
+    clock.now = last + 2.0  # Within mean interval + acceptable_pause
+    assert detector.is_available("d")
+    clock.now = last + 6.0
+    assert not detector.is_available("d")
+    assert detector.silence("d") == 6.0
+
+
+def test_jittery_device_gets_more_slack():
+    steady, steady_clock = regular_device()
+    jittery_clock = Clock()
+    jittery = PhiAccrualDetector(clock=jittery_clock)
+    for n in range(20):  # Same 1s mean interval, alternating 0.2s and 1.8s
+        jittery_clock.now = n * 1.0 + (0.8 if n % 2 else 0.0)
+        jittery.heartbeat("d")
+    steady_clock.now += 4.0
+    jittery_clock.now += 4.0
+    assert steady.silence("d") == jittery.silence("d") == 4.0
+    assert jittery.phi("d") < steady.phi("d")
+
+
+def test_unknown_and_removed_devices_are_not_suspected():
+    detector, clock = regular_device()
+    clock.now += 60.0
+    assert not detector.is_available("d")
+    detector.remove("d")
+    assert detector.phi("d") == 0.0 and detector.is_available("d")
+    assert detector.silence("d") is None
+    assert detector.keys() == []
+
+
+def test_phi_stays_finite_far_out_in_both_tails():
+    for y in (-1e6, -50.0, 0.0, 50.0, 1e6):
+        value = phi(y, 0.0, 1.0)
+        assert math.isfinite(value) and value >= 0.0
+    assert phi(-50.0, 0.0, 1.0) < 1e-12  # Long before the expected heartbeat
+    assert phi(50.0, 0.0, 1.0) > phi(10.0, 0.0, 1.0) > phi(0.0, 0.0, 1.0)
+    assert math.isclose(phi(0.0, 0.0, 1.0), math.log10(2))
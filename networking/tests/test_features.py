@@ -0,0 +1,46 @@
+import pytest
+
+import linucb
+from features import DEFAULT_PRED_TOKENS, FEATURE_NAMES, SOLVER_FEATURE_VERSION, check_version, featurise, featurise_one
+
+
+def named(vector, version=2):
+    return dict(zip(FEATURE_NAMES[version], vector))
+
+
+def test_harness_sentinels_fall_back_to_neutral_defaults():
+    # get_battery_state writes -1 for both when adb cannot read them
+    x = named(featurise_one(cpu_load=50, ram_load=40, prompt_tokens=20, battery=-1, temp_c=-1))
+    assert x["battery"] == 1.0
+    assert x["thermal"] == 0.0
+
+
+def test_real_readings_are_scaled():
+    x = named(featurise_one(cpu_load=50, ram_load=40, prompt_tokens=20, battery=30, temp_c=40))
+    assert x["cpu"] == 0.5 and x["ram"] == 0.4
+    assert x["battery"] == pytest.approx(0.3)
+    assert x["thermal"] == pytest.approx(0.6)
+    assert x["thermal_x_cpu"] == pytest.approx(0.3)
+
+
+def test_measured_tokens_stand_in_for_pred_tokens():
+    rows = [{"cpu_load": "10", "ram_load": "10", "prompt_length": "40", "tokens": "300"},
+            {"cpu_load": "10", "ram_load": "10", "prompt_length": "40", "tokens": "-1"},
+            {"cpu_load": "10", "ram_load": "10", "prompt_length": "40", "tokens": "300", "pred_tokens": "120"}]
+    pred = [named(x)["pred_tokens"] for x in featurise(rows)]
+    assert pred == pytest.approx([0.3, DEFAULT_PRED_TOKENS / 1000.0, 0.12])
+
+
+def test_prompt_length_in_characters_becomes_tokens():
+    assert named(featurise_one(prompt_length="400"))["prompt_tokens"] == pytest.approx(1.0)
+
+
+def test_version_one_keeps_the_solver_layout():
+    assert list(featurise_one(version=1, cpu_load=20, ram_load=30, prompt_length=500)) == [1.0, 0.2, 0.3, 0.5]
+    assert featurise([{"cpu_load": 20, "ram_load": 30, "prompt_length": 500}], version=1).tolist() == [[1.0, 0.2, 0.3, 0.5]]
+    assert linucb.features(20, 30, 500) == [1.0, 0.2, 0.3, 0.5]
+    assert linucb.FEATURE_VERSION == SOLVER_FEATURE_VERSION == 1
+    with pytest.raises(ValueError):
+        featurise_one(version=3)
+    with pytest.raises(ValueError):
+        check_version(1)
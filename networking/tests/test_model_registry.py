@@ -0,0 +1,18 @@
+from linucb import DiscountedLinUCB
+from model_registry import ModelRegistry, encode_state
+
+
+def trained(ttft, runs=30):
+    model = DiscountedLinUCB()
+    for i in range(runs):
+        model.update(20 + i, 50, 100, ttft, 8.0)
+    return model
+
+
+def test_fleet_prior_ignores_models_that_never_learned():
+    registry = ModelRegistry(path=None)
+    registry.update("a", encode_state(trained(10.0), "cpu"))
+    alone = registry.fleet_prior("cpu").predict_latency(30, 50, 100, 60)
+    registry.update("fresh", encode_state(DiscountedLinUCB(), "cpu"))
+    assert registry.fleet_prior("cpu").predict_latency(30, 50, 100, 60) == alone
+    assert registry.fleet_prior("cpu", exclude="a") is None
@@ -0,0 +1,25 @@
+import json
+
+from orchestrator_p2p import P2POrchestrator
+
+
+def chunk_line(seq, text):
+    return (json.dumps({"task_id": "t", "seq": seq, "text": text}, ensure_ascii=False) + "\n").encode()
+
+
+def test_read_stream_waits_for_a_split_multibyte_character(tmp_path):
+    hub = P2POrchestrator(mesh_dir=str(tmp_path))
+    stream_file = tmp_path / "stream_t.jsonl"
+    stream = {"offset": 0, "next_seq": 1, "held": {}, "delivered": 0}
+    got = []
+    data = chunk_line(1, "café   नम") + chunk_line(2, "über")
+    split = data.index("ü".encode()) + 1  # Inside the two bytes of the ü
+
+    stream_file.write_bytes(data[:split])
+    hub.read_stream("t", str(stream_file), stream, lambda text, seq: got.append((seq, text)))
+    assert got == [(1, "café   नम")]
+
+    stream_file.write_bytes(data)
+    hub.read_stream("t", str(stream_file), stream, lambda text, seq: got.append((seq, text)), final=True)
+    assert got[1:] == [(2, "über")]
+    assert stream["offset"] == len(data)
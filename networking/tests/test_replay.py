@@ -0,0 +1,61 @@
+import json
+
+from replay import LCBPolicy, fill_predictions, load_auctions, replay
+
+
+def bid(predicted=None, uncertainty=0.0, has_npu=False, free_npu=False):
+    return {"cpu_load": 0.5, "battery": 80, "ram": {"usage_percent": 40}, "has_npu": has_npu, "free_npu": free_npu,
+            "predicted_latency": predicted, "uncertainty": uncertainty, "score": None}
+
+
+def auction(bids, ts=0.0, winner=None, actual=None, done=None, device_time=None):
+    return {"task_id": f"t{ts}", "ts": ts, "prompt_length": None, "bids": bids, "winner": winner, "actual": actual,
+            "ttft": None, "speed": None, "device_time": device_time, "done": done}
+
+
+def test_lcb_takes_the_lowest_confidence_bound():
+    bids = {"a": bid(2.0, 0.0), "b": bid(2.5, 2.0)}
+    assert LCBPolicy(alpha=0.0).choose(auction(bids)) == "a"
+    assert LCBPolicy(alpha=0.5).choose(auction(bids)) == "b"  # 2.5 - 1.0 beats 2.0
+
+
+def test_lcb_prefers_a_free_npu_and_skips_bids_without_prediction():
+    bids = {"cpu": bid(1.0), "npu": bid(None, has_npu=True, free_npu=True), "blind": bid(None)}
+    assert LCBPolicy().choose(auction(bids)) == "npu"
+    assert LCBPolicy(prefer_free_npu=False).choose(auction(bids)) == "cpu"
+    assert LCBPolicy().choose(auction({"blind": bid(None)})) is None
+
+
+def test_filled_predictions_only_use_results_already_in():
+    first = auction({"a": bid(), "b": bid()}, ts=0.0, winner="a", actual=3.0, done=5.0, device_time=2.0)
+    early = auction({"a": bid(), "b": bid()}, ts=4.0)
+    late = auction({"a": bid(), "b": bid(1.0)}, ts=6.0)
+    assert fill_predictions([first, early, late]) == 1
+    assert early["bids"]["a"]["predicted_latency"] is None  # a's result was not back yet
+    assert late["bids"]["a"]["predicted_latency"] == 2.0    # The device's own time, not the round trip
+    assert late["bids"]["b"]["predicted_latency"] == 1.0    # Logged predictions are kept
+
+
+def test_lcb_scores_a_hub_trace_without_logged_predictions(tmp_path):
+    events = []
+    for i in range(20):
+        task_id = f"task-{i}"
+        winner = "fast" if i % 2 else "slow"
+        events += [
+            {"event": "auction_started", "ts": i * 10.0, "task_id": task_id},
+            {"event": "bid_received", "ts": i * 10.0 + 1, "task_id": task_id, "device": "fast", "cpu_load": 0.2,
+             "predicted_latency": None},
+            {"event": "bid_received", "ts": i * 10.0 + 1, "task_id": task_id, "device": "slow", "cpu_load": 0.1,
+             "predicted_latency": None},
+            {"event": "auction_winner", "ts": i * 10.0 + 2, "task_id": task_id, "device": winner},
+            {"event": "task_latency", "ts": i * 10.0 + 5, "task_id": task_id, "roundtrip": 1.5 if winner == "fast" else 4.5,
+             "exec_ms": 1000.0 if winner == "fast" else 4000.0},
+        ]
+    trace = tmp_path / "orchestrator_events.jsonl"
+    trace.write_text("\n".join(json.dumps(e) for e in events) + "\n")
+
+    auctions = load_auctions([str(trace)])
+    fill_predictions(auctions)
+    result = replay(auctions, [LCBPolicy(alpha=0.0)])[0]
+    assert result["unestimated"] == 1  # Only the first auction, before any result was back
+    assert LCBPolicy(alpha=0.0).choose(auctions[-1]) == "fast"
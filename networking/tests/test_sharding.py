@@ -0,0 +1,130 @@
+import contextlib
+import io
+import json
+
+import pytest
+
+from orchestrator import Orchestrator
+from sharding import HashRing, ShardCoordinator
+
+
+class FakeConn:
+    """Records what the hub sends to a device"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, payload):
+        self.sent.append(json.loads(payload))
+        return len(payload)
+
+    sendall = send
+
+    def types(self):
+        return [msg["type"] for msg in self.sent]
+
+
+def test_ring_owner_is_stable_and_empty_ring_has_none():
+    assert HashRing().owner("device") is None
+    ring = HashRing(["a", "b", "c"])
+    assert ring.owner("device-1") == HashRing(["c", "a", "b"]).owner("device-1")
+    assert ring.nodes() == {"a", "b", "c"}
+
+
+def test_removing_a_node_only_moves_its_keys():
+    keys = [f"device-{i}" for i in range(2000)]
+    ring = HashRing(["a", "b", "c", "d"])
+    before = {key: ring.owner(key) for key in keys}
+    ring.remove("d")
+    after = {key: ring.owner(key) for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    assert moved and all(before[key] == "d" for key in moved)
+    assert "d" not in after.values()
+
+
+def test_ring_spreads_keys_over_all_nodes():
+    ring = HashRing(["a", "b", "c", "d"])
+    owners = [ring.owner(f"device-{i}") for i in range(4000)]
+    for node in "abcd":
+        assert 500 < owners.count(node) < 1500  # Within 2x of the fair 1000 with 64 vnodes
+
+
+@pytest.fixture
+def hub():
+    hub = Orchestrator(bind=False, log_path=None)
+    hub.schedule = lambda delay, fn, *args: None  # Auctions are evaluated by hand
+    hub.shards = ShardCoordinator(hub, "hub-a", ("127.0.0.1", 9000), settle=0.0)
+    return hub
+
+
+def register(hub, device_id):
+    conn = FakeConn()
+    with contextlib.redirect_stdout(io.StringIO()):
+        hub.process_message({"type": "register", "agent_id": device_id, "data": {
+            "hasNpu": False, "capabilities": ["classify"],
+            "metrics": {"cpu_load": 0.1, "battery": 80, "ram": {"usage_percent": 30}}}}, conn)
+    return conn
+
+
+def join_peer(shards, shard="hub-b"):
+    shards.members[shard] = {"address": ("127.0.0.1", 9001), "status": {"free": 0}, "seen": 0.0}
+    shards.ring.add(shard)
+
+
+def owned_by(ring, shard, count):
+    return [d for d in (f"device-{i}" for i in range(1000)) if ring.owner(d) == shard][:count]
+
+
+def test_rebalance_waits_for_the_running_task(hub):
+    peer_ring = HashRing(["hub-a", "hub-b"])
+    busy_id, idle_id = owned_by(peer_ring, "hub-b", 2)
+    busy, idle = register(hub, busy_id), register(hub, idle_id)
+    join_peer(hub.shards)
+
+    # busy wins an auction; the task is out, nothing records a prediction for it
+    task_id = hub.handle_image_received("client", {"image_base64": ""}, exclude=(idle_id,))
+    hub.handle_bid_received(busy_id, {"task_id": task_id, "data": {"cpu_load": 0.1, "battery": 80}})
+    hub.evaluate_bids(task_id)
+    assert "task" in busy.types()
+
+    hub.shards.rebalance()
+    assert "redirect" in idle.types() and idle_id not in hub.devices
+    assert "redirect" not in busy.types() and busy_id in hub.devices
+
+    hub.process_message({"type": "result", "agent_id": busy_id, "task_id": task_id, "subtask": "classify",
+                         "data": {"status": "classification_complete", "classification": "0.9 1 cat"}}, busy)
+    hub.shards.rebalance()
+    assert busy.types()[-1] == "redirect"
+
+
+def test_direct_task_also_holds_the_device(hub):
+    device_id = owned_by(HashRing(["hub-a", "hub-b"]), "hub-b", 1)[0]
+    conn = register(hub, device_id)
+    join_peer(hub.shards)
+    hub.send_task(device_id, "story-1", "generate_story", {})
+    hub.shards.rebalance()
+    assert "redirect" not in conn.types()
+
+
+def test_untracked_story_chunks_do_not_hold_the_device(hub):
+    device_id = owned_by(HashRing(["hub-a", "hub-b"]), "hub-b", 1)[0]
+    conn = register(hub, device_id)
+    join_peer(hub.shards)
+    hub.send_task(device_id, "story-1-chunk-0", "story_chunk", {"label": "cat"}, track=False)
+    assert conn.types()[-1] == "task" and not hub.busy_devices()
+    hub.shards.rebalance()
+    assert conn.types()[-1] == "redirect"
+
+
+def test_silent_member_loses_its_link(hub):
+    class Link:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    join_peer(hub.shards)
+    link = hub.shards.links[("127.0.0.1", 9001)] = Link()
+    hub.shards.drop_member("hub-b", "no status")
+    assert link.closed and not hub.shards.links
+    assert hub.shards.ring.nodes() == {"hub-a"}
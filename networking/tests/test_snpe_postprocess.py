@@ -0,0 +1,26 @@
+import os
+
+import numpy as np
+
+from snpe_postprocess import OUTPUT_TENSOR, classify, top_k
+
+
+def test_top_k_is_sorted_best_first_per_row():
+    scores = np.array([[0.1, 0.5, 0.2, 0.9], [0.4, 0.3, 0.2, 0.1]], dtype=np.float32)
+    indices, confidences = top_k(scores, k=3)
+    assert indices.tolist() == [[3, 1, 2], [0, 1, 2]]
+    assert np.allclose(confidences, [[0.9, 0.5, 0.2], [0.4, 0.3, 0.2]])
+    assert top_k(scores, k=10)[0].shape == (2, 4)  # k is capped at the number of classes
+
+
+def test_classify_keeps_result_order_and_missing_results(tmp_path):
+    labels = tmp_path / "labels.txt"
+    labels.write_text("cat\ndog\nfox\n")
+    for n, scores in ((0, [0.7, 0.2, 0.1]), (2, [0.1, 0.1, 0.8]), (10, [0.1, 0.6, 0.3]), (1, None)):
+        path = tmp_path / "output" / f"Result_{n}" / OUTPUT_TENSOR
+        os.makedirs(path.parent)
+        if scores is not None:
+            np.array(scores, dtype=np.float32).tofile(path)
+
+    results = classify(str(tmp_path / "output"), str(labels), k=1)
+    assert [r["top"][0][:2] for r in results] == [("cat", 0), ("missing_file", -1), ("fox", 2), ("dog", 1)]
@@ -44,7 +44,10 @@ for device in $DEVICES; do
     
     echo "Deploying to $DEVICE_NAME ($device)..."
     
-    # Push scripts
+    # Push scripts (log.sh and prompt_cache.sh hold the helpers the others source)
+    adb -s "$device" push "$SCRIPT_DIR/device_scripts/log.sh" "$DEVICE_DIR/log.sh" 2>&1 | grep -v "bytes"
+    adb -s "$device" push "$SCRIPT_DIR/device_scripts/prompt_cache.sh" "$DEVICE_DIR/prompt_cache.sh" 2>&1 | grep -v "bytes"
+    
     adb -s "$device" push "$SCRIPT_DIR/device_scripts/collect_metrics.sh" "$DEVICE_DIR/collect_metrics.sh" 2>&1 | grep -v "bytes"
     adb -s "$device" shell "chmod +x $DEVICE_DIR/collect_metrics.sh"
     
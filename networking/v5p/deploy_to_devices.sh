@@ -51,6 +51,10 @@ deploy_to_device() {
     # Create directory on device
     adb -s "$DEVICE_SERIAL" shell "mkdir -p $DEVICE_DIR" 2>/dev/null
     
+    # Shared helpers every device script sources
+    adb -s "$DEVICE_SERIAL" push "$SCRIPT_DIR/device_scripts/log.sh" "$DEVICE_DIR/log.sh"
+    adb -s "$DEVICE_SERIAL" push "$SCRIPT_DIR/device_scripts/prompt_cache.sh" "$DEVICE_DIR/prompt_cache.sh"
+    
     # Push LinUCB bid_listener.sh, orchestrator.sh, and feedback_listener.sh (NEW)
     adb -s "$DEVICE_SERIAL" push "$SCRIPT_DIR/device_scripts/bid_listener.sh" "$DEVICE_DIR/bid_listener.sh"
     adb -s "$DEVICE_SERIAL" shell "chmod +x $DEVICE_DIR/bid_listener.sh"
@@ -64,6 +68,9 @@ deploy_to_device() {
     adb -s "$DEVICE_SERIAL" push "$SCRIPT_DIR/device_scripts/collect_metrics.sh" "$DEVICE_DIR/collect_metrics.sh"
     adb -s "$DEVICE_SERIAL" shell "chmod +x $DEVICE_DIR/collect_metrics.sh"
     
+    adb -s "$DEVICE_SERIAL" push "$SCRIPT_DIR/device_scripts/model_sync.sh" "$DEVICE_DIR/model_sync.sh"
+    adb -s "$DEVICE_SERIAL" shell "chmod +x $DEVICE_DIR/model_sync.sh"
+    
     # Push old mesh_node.sh (for backward compatibility)
     adb -s "$DEVICE_SERIAL" push "$SCRIPT_DIR/mesh_node.sh" "$DEVICE_DIR/mesh_node.sh"
     adb -s "$DEVICE_SERIAL" shell "chmod +x $DEVICE_DIR/mesh_node.sh"
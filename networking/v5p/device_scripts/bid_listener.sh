@@ -5,21 +5,88 @@
 MESH_DIR="/sdcard/mesh_network"
 CONFIG_FILE="$MESH_DIR/device_config.json"
 LOG_FILE="$MESH_DIR/bid_listener.log"
+LOG_SRC="bid_listener"
+STAGE_FILE="$MESH_DIR/stage_latency.csv"
 BID_PORT=5001
 MULTILIN_BIN="/data/local/tmp/multilin"
 STATE_A="/data/local/tmp/state_A.dat"
 STATE_B="/data/local/tmp/state_B.dat"
-PENDING_BIDS_FILE="/data/local/tmp/pending_bids.txt"
+PENDING_BIDS_DIR="/data/local/tmp/pending_bids"  # One file per BidID, shared with feedback_listener.sh
+PENDING_BID_TTL_MIN=15  # Losing bids never get feedback; expire them after this long
+EXPIRE_EVERY=12         # Listener loop iterations (~5-6 s each) between expiry sweeps
+SCORE_CACHE_DIR="/data/local/tmp/score_cache"  # Solver predictions per quantised state, see score_bid
+SCORE_CPU_STEP=4       # Score cache buckets: cpu/ram in percent, prompt length in
+SCORE_RAM_STEP=4       # characters; every bid in a bucket is scored at its centre
+SCORE_PROMPT_STEP=32
+SOLVER_STATE="${MULTILIN_STATE:-/data/local/tmp/multilin_state}"  # Same prefix the solver uses
 PROMPT_EXEC_PORT=5004
+STREAM_PORT=5006  # Generated text goes back to the orchestrator here while it is produced
 NPU_FLAG_FILE="$MESH_DIR/npu_free.flag"
 
+. "$MESH_DIR/log.sh"  # log LEVEL MESSAGE..., json_escape, now_ms, stage ID NAME
+. "$MESH_DIR/prompt_cache.sh"  # prefix_cache_file, lock_prefix_cache, touch_prefix_cache
+
 # Parse device name
 DEVICE_NAME=$(grep -o '"device_name"[[:space:]]*:[[:space:]]*"[^"]*"' "$CONFIG_FILE" | sed 's/.*"\([^"]*\)".*/\1/')
 
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Bid listener starting on port $BID_PORT" >> "$LOG_FILE"
+log INFO "Bid listener starting on port $BID_PORT"
+
+# Pending bids are stored as $PENDING_BIDS_DIR/<BidID>, so feedback looks one up
+# and removes it by name in constant time; an occasional find sweep drops the
+# ones that lost their auction. The old flat file only holds stale entries.
+mkdir -p "$PENDING_BIDS_DIR"
+rm -f /data/local/tmp/pending_bids.txt "$MESH_DIR/pending_bids.txt"
+expire_pending_bids() {
+    find "$PENDING_BIDS_DIR" -type f -mmin +$PENDING_BID_TTL_MIN -exec rm -f {} + 2>/dev/null
+}
+LOOP_COUNT=0
+
+# Score a bid for $BACKEND from $CPU_LOAD, $RAM_LOAD, $PROMPT_LENGTH and $PROMPT;
+# sets SCORE, PRED_TOKENS and PREDICTION (ttft,speed,latency,uncertainty).
+# The solver's prediction for a (backend, cpu, ram, prompt length) bucket is
+# cached as "ttft,speed,uncertainty,alpha*uncertainty". Every train, reset and
+# fleet-prior install rewrites the state or prior file, so an entry newer than
+# both still matches the model and a bid storm costs a file read and one awk
+# instead of a solver run. Predicted output tokens depend on the prompt text
+# only and are cached by its checksum, which also covers the orchestrator's
+# retried requests.
+mkdir -p "$SCORE_CACHE_DIR"
+score_bid() {
+    CPU_Q=${CPU_LOAD%.*}
+    RAM_Q=${RAM_LOAD%.*}
+    CPU_Q=$((${CPU_Q:-0} / SCORE_CPU_STEP * SCORE_CPU_STEP + SCORE_CPU_STEP / 2))
+    RAM_Q=$((${RAM_Q:-0} / SCORE_RAM_STEP * SCORE_RAM_STEP + SCORE_RAM_STEP / 2))
+    PROMPT_Q=$((PROMPT_LENGTH / SCORE_PROMPT_STEP * SCORE_PROMPT_STEP + SCORE_PROMPT_STEP / 2))
+
+    TOKENS_FILE="$SCORE_CACHE_DIR/tokens_$(printf '%s' "$PROMPT" | cksum | tr ' ' '_')"
+    if [ -s "$TOKENS_FILE" ]; then
+        read -r PRED_TOKENS < "$TOKENS_FILE"
+    else
+        PRED_TOKENS=$($MULTILIN_BIN tokens "$PROMPT" 2>/dev/null)
+        [ -n "$PRED_TOKENS" ] || return 1
+        echo "$PRED_TOKENS" > "$TOKENS_FILE"
+    fi
+
+    SCORE_CACHE_FILE="$SCORE_CACHE_DIR/${BACKEND}_${CPU_Q}_${RAM_Q}_${PROMPT_Q}"
+    if [ "$SCORE_CACHE_FILE" -nt "${SOLVER_STATE}_$BACKEND.dat" ] && [ "$SCORE_CACHE_FILE" -nt "${SOLVER_STATE}_$BACKEND.prior" ]; then
+        SCORE_SOURCE=cache
+    else
+        SCORE_SOURCE=solver
+        $MULTILIN_BIN --backend $BACKEND score $CPU_Q $RAM_Q $PROMPT_Q $PRED_TOKENS 2>&1 | awk '
+            /^Predicted ttft:/ { t = $3; s = $5 } /^Predicted latency:/ { l = $3 } /^Uncertainty:/ { u = $2 } { last = $1 }
+            END { if (t != "" && u != "") printf "%s,%s,%s,%.6f\n", t, s, u, l - last }' > "$SCORE_CACHE_FILE.tmp"
+        [ -s "$SCORE_CACHE_FILE.tmp" ] || return 1
+        mv "$SCORE_CACHE_FILE.tmp" "$SCORE_CACHE_FILE"
+    fi
+    IFS=',' read -r CACHED_TTFT CACHED_SPEED CACHED_UNCERTAINTY CACHED_BONUS < "$SCORE_CACHE_FILE"
+    # Same arithmetic as get_score in multi_linucb_solver.c
+    set -- $(awk -v t="$CACHED_TTFT" -v s="$CACHED_SPEED" -v b="$CACHED_BONUS" -v n="$PRED_TOKENS" \
+        'BEGIN { if (s < 0.1) s = 0.1; l = t + n / s; printf "%.3f %.6f", l, l - b }')
+    PREDICTION="$CACHED_TTFT,$CACHED_SPEED,$1,$CACHED_UNCERTAINTY"
+    SCORE=$2
+    [ -n "$SCORE" ]
+}
 
-# Initialize pending bids file
-touch "$PENDING_BIDS_FILE"
     
 # Initialize NPU free flag (true if device has NPU, false otherwise)
 HAS_NPU=$(grep -o '"has_npu"[[:space:]]*:[[:space:]]*[a-z]*' "$CONFIG_FILE" | sed 's/.*: *\([a-z]*\)/\1/')
@@ -29,13 +96,36 @@ else
     echo "false" > "$NPU_FLAG_FILE"
 fi
 
+# Result streaming: stream_result TASK_ID ORCHESTRATOR_IP reads generated text
+# on stdin and forwards it over one connection as it is produced, one word per
+# line: RESULT_CHUNK|task:ID|from:DEVICE|seq:N|text:WORD, then a final
+# RESULT_CHUNK|task:ID|from:DEVICE|seq:N|done:true. Backslashes and newlines in
+# the text are escaped so every chunk stays on one line (printf %b undoes it).
+# Without a task ID (an orchestrator that does not stream) the text is dropped.
+stream_result() {
+    if [ -z "$1" ] || [ -z "$2" ]; then
+        cat > /dev/null
+        return
+    fi
+    awk -v task="$1" -v from="$DEVICE_NAME" 'BEGIN { RS = " " }
+        { gsub(/\\/, "\\\\\\\\"); gsub(/\n/, "\\n")
+          printf "RESULT_CHUNK|task:%s|from:%s|seq:%d|text:%s \n", task, from, NR, $0; fflush() }
+        END { printf "RESULT_CHUNK|task:%s|from:%s|seq:%d|done:true\n", task, from, NR + 1 }' | \
+        nc -w 5 -q 1 "$2" $STREAM_PORT > /dev/null 2>&1
+}
+
 # Function to execute NPU prompt
 execute_npu_prompt() {
     local prompt="$1"
     local orchestrator_device="$2"
+    local stream_task="$3"
+    local stream_ip="$4"
+    # Names this run's files and keys its stage row (the task ID, so it joins the
+    # orchestrator's rows); $$ in the background subshell is still the listener's PID
+    local run_id="${stream_task:-${orchestrator_device}_$(date +%s)_$RANDOM}"
     
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] [NPU EXEC] Starting NPU execution..." >> "$LOG_FILE"
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] [NPU EXEC] Prompt: $prompt" >> "$LOG_FILE"
+    log INFO "[NPU EXEC] Starting NPU execution..."
+    log INFO "[NPU EXEC] Prompt: $prompt"
     
     # Set NPU as busy
     echo "false" > "$MESH_DIR/npu_free.flag"
@@ -45,12 +135,19 @@ execute_npu_prompt() {
     
     # Execute on NPU (run in background and capture output)
     (
+        now_ms
+        STAGE_MARK=$NOW_MS
         cd /data/local/tmp/genie-bundle
         export LD_LIBRARY_PATH=$PWD
         export ADSP_LIBRARY_PATH=$PWD/hexagon-v75/unsigned
-        RESULT=$(./genie-t2t-run -c genie_config.json -p "$FORMATTED_PROMPT" 2>&1 | tail -20)
+        OUTPUT_FILE="/data/local/tmp/genie_output_$run_id.txt"
+        ./genie-t2t-run -c genie_config.json -p "$FORMATTED_PROMPT" 2>&1 | tee "$OUTPUT_FILE" | \
+            stream_result "$stream_task" "$stream_ip"
+        RESULT=$(tail -20 "$OUTPUT_FILE")
+        rm -f "$OUTPUT_FILE"
+        stage "$run_id" execution
         
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] [NPU EXEC] Execution complete" >> "$LOG_FILE"
+        log INFO "[NPU EXEC] Execution complete"
         
         # Free up NPU
         echo "true" > "$MESH_DIR/npu_free.flag"
@@ -61,38 +158,58 @@ execute_npu_prompt() {
 execute_cpu_prompt() {
     local prompt="$1"
     local orchestrator_device="$2"
+    local stream_task="$3"
+    local stream_ip="$4"
+    # Names this run's files and keys its stage row (the task ID, so it joins the
+    # orchestrator's rows); $$ in the background subshell is still the listener's PID
+    local run_id="${stream_task:-${orchestrator_device}_$(date +%s)_$RANDOM}"
     
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] [CPU EXEC] Starting CPU execution..." >> "$LOG_FILE"
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] [CPU EXEC] Prompt: $prompt" >> "$LOG_FILE"
+    log INFO "[CPU EXEC] Starting CPU execution..."
+    log INFO "[CPU EXEC] Prompt: $prompt"
     
     # Execute on CPU (run in background and capture output)
+    prefix_cache_file "$prompt"
+    lock_prefix_cache
+    log INFO "[CPU EXEC] Prefix cache: ${PREFIX_CACHE:-none} (cached: $PREFIX_CACHED)"
     (
+        now_ms
+        STAGE_MARK=$NOW_MS
         cd /data/local/tmp/cppllama-bundle/llama.cpp
         export LD_LIBRARY_PATH=$PWD/build/bin
         
-        # Run llama-cli and capture full output
-        FULL_OUTPUT=$(./build/bin/llama-cli -m models/llama-3.2-3b-instruct-q4_k_m.gguf -p "$prompt" -no-cnv 2>&1)
-        
-        # Extract generated text by removing performance stats lines
-        RESULT=$(echo "$FULL_OUTPUT" | grep -v "llama_perf" | grep -v "llama_memory" | grep -v "load time" | grep -v "eval time" | grep -v "sampling time" | grep -v "^\[" | grep -v "^$" | tr '\n' ' ' | sed 's/^[[:space:]]*//;s/[[:space:]]*$//')
+        # Run llama-cli; a cached prefix skips most of the prefill. Generated text is
+        # on stdout (streamed back as it comes), logs and perf stats on stderr
+        OUTPUT_FILE="/data/local/tmp/llama_output_$run_id.txt"
+        ./build/bin/llama-cli -m models/llama-3.2-3b-instruct-q4_k_m.gguf -p "$prompt" $PROMPT_CACHE_ARGS \
+            -no-cnv --no-display-prompt 2>"$OUTPUT_FILE.log" | tee "$OUTPUT_FILE" | \
+            stream_result "$stream_task" "$stream_ip"
+        touch_prefix_cache
         
-        # If result is empty, try alternative: get everything before the first llama_perf line
-        if [ -z "$RESULT" ] || [ "$RESULT" = " " ]; then
-            RESULT=$(echo "$FULL_OUTPUT" | sed '/llama_perf/,$d' | grep -v "^\[" | grep -v "^$" | tr '\n' ' ' | sed 's/^[[:space:]]*//;s/[[:space:]]*$//')
-        fi
+        RESULT=$(grep -v "^$" "$OUTPUT_FILE" | tr '\n' ' ' | sed 's/^[[:space:]]*//;s/[[:space:]]*$//')
+        rm -f "$OUTPUT_FILE" "$OUTPUT_FILE.log"
         
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] [CPU EXEC] Execution complete" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] [CPU EXEC] Generated text: ${RESULT:0:200}..." >> "$LOG_FILE"
+        stage "$run_id" execution
+        log INFO "[CPU EXEC] Execution complete"
+        log INFO "[CPU EXEC] Generated text: ${RESULT:0:200}..."
     ) &
 }
 
 # Start listening for bid requests
 while true; do
+    LOOP_COUNT=$((LOOP_COUNT + 1))
+    if [ $((LOOP_COUNT % EXPIRE_EVERY)) -eq 0 ]; then
+        expire_pending_bids
+        # Stale entries are never read again once the model trains; drop them with the bids
+        find "$SCORE_CACHE_DIR" -type f -mmin +$PENDING_BID_TTL_MIN -exec rm -f {} + 2>/dev/null
+    fi
+    
     # Listen on port 5001 for bid requests
     REQUEST=$(echo "" | nc -l -p $BID_PORT -w 5 2>/dev/null)
     
     if [ $? -eq 0 ] && [ -n "$REQUEST" ]; then
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Received bid request: $REQUEST" >> "$LOG_FILE"
+        now_ms
+        STAGE_MARK=$NOW_MS
+        log INFO "Received bid request: $REQUEST"
         
         # Check if it's a bid request
         if echo "$REQUEST" | grep -q "BID_REQUEST"; then
@@ -100,6 +217,8 @@ while true; do
             ORCHESTRATOR_NAME=$(echo "$REQUEST" | grep -o 'from:[^|]*' | cut -d':' -f2)
             PROMPT_LENGTH=$(echo "$REQUEST" | grep -o 'prompt_length:[0-9]*' | cut -d':' -f2)
             PROMPT=$(echo "$REQUEST" | grep -o 'prompt:.*' | cut -d':' -f2-)
+            # The orchestrator's task ID keys this bid's stage rows (older orchestrators send none)
+            BID_TASK=$(echo "$REQUEST" | grep -o '|task:[^|]*' | head -n 1 | cut -d':' -f2)
             
             # Default to 100 if not provided
             if [ -z "$PROMPT_LENGTH" ]; then
@@ -122,11 +241,11 @@ while true; do
                 fi
                 
                 if [ -z "$ORCHESTRATOR_IP" ]; then
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] WARNING: Could not find IP for orchestrator $ORCHESTRATOR_NAME" >> "$LOG_FILE"
+                    log WARN "Could not find IP for orchestrator $ORCHESTRATOR_NAME"
                     continue
                 fi
                 
-                echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Orchestrator $ORCHESTRATOR_NAME IP: $ORCHESTRATOR_IP" >> "$LOG_FILE"
+                log INFO "Orchestrator $ORCHESTRATOR_NAME IP: $ORCHESTRATOR_IP"
                 
                 # Collect metrics (includes NPU info)
                 METRICS=$(sh "$MESH_DIR/collect_metrics.sh")
@@ -140,43 +259,47 @@ while true; do
                 # Generate BidID (timestamp-based)
                 BID_ID="bid_$(date +%s%N | cut -b1-13)_${DEVICE_NAME}"
                 
-                # Normalize features and build feature vector
-                # Features: [1.0, cpu_load/100, ram_load/100, prompt_length/1000]
-                CPU_NORM=$(echo "$CPU_LOAD" | awk '{printf "%.4f", $1/100}')
-                RAM_NORM=$(echo "$RAM_LOAD" | awk '{printf "%.4f", $1/100}')
-                PROMPT_NORM=$(echo "$PROMPT_LENGTH" | awk '{printf "%.4f", $1/1000}')
-                
-                # Call Multi-LinUCB solver to get score (passes prompt for token prediction)
-                # Capture both stdout (score) and stderr (predicted tokens info)
-                MULTILIN_OUTPUT=$($MULTILIN_BIN score $CPU_NORM $RAM_NORM $PROMPT_NORM "$PROMPT" 2>&1)
-                SCORE=$(echo "$MULTILIN_OUTPUT" | tail -1)
-                PRED_TOKENS=$(echo "$MULTILIN_OUTPUT" | grep "Predicted tokens:" | awk '{print $3}')
-                
-                # If no predicted tokens found, set to 0 (means predictor wasn't used or failed)
-                if [ -z "$PRED_TOKENS" ]; then
-                    PRED_TOKENS=0
+                # The solver builds [1.0, cpu/100, ram/100, prompt_length/1000] itself,
+                # so it gets the raw values (normalising here scaled them twice)
+                # A free NPU wins the task on the orchestrator, so bid with the NPU model then
+                BACKEND="cpu"
+                if [ "$HAS_NPU" = "true" ] && [ "$FREE_NPU" = "true" ]; then
+                    BACKEND="npu"
                 fi
-                
-                if [ $? -eq 0 ] && [ -n "$SCORE" ]; then
+                # Score from the Multi-LinUCB solver, or its cached prediction for this
+                # bucket; PREDICTION is kept so feedback can measure how wrong it was
+                if score_bid; then
+                    # A CPU run whose prompt prefix is already cached here skips most of its
+                    # prefill; bid lower so the orchestrator sends follow-ups back to this device
+                    prefix_cache_file "$PROMPT"
+                    if [ "$BACKEND" = "cpu" ] && [ "$PREFIX_CACHED" = "true" ]; then
+                        SCORE=$(awk -v s="$SCORE" -v t="$CACHED_TTFT" -v f="$PREFIX_TTFT_SAVING" 'BEGIN { printf "%.6f", s - t * f }')
+                    fi
                     # Store features in pending bids for later feedback
-                    echo "$BID_ID,$CPU_NORM,$RAM_NORM,$PROMPT_NORM,$(date +%s)" >> "$PENDING_BIDS_FILE"
+                    echo "$BID_ID,$CPU_LOAD,$RAM_LOAD,$PROMPT_LENGTH,$(date +%s),$BACKEND,$PREDICTION,$SCORE,$PRED_TOKENS" > "$PENDING_BIDS_DIR/$BID_ID"
                     
                     # Create bid response with BidID, Score, NPU info, AND predicted tokens (single line)
                     BID_RESPONSE="BID_RESPONSE|device:$DEVICE_NAME|bid_id:$BID_ID|score:$SCORE|has_npu:$HAS_NPU|free_npu:$FREE_NPU|pred_tokens:$PRED_TOKENS"
+                    # What the score was built from, so the orchestrator can trace the auction for replay.py
+                    IFS=',' read -r _ _ PRED_LATENCY UNCERTAINTY <<EOF_PRED
+$PREDICTION
+EOF_PRED
+                    BID_RESPONSE="$BID_RESPONSE|backend:$BACKEND|cpu_percent:$CPU_LOAD|ram_percent:$RAM_LOAD|predicted_latency:$PRED_LATENCY|uncertainty:$UNCERTAINTY|prefix_cached:$PREFIX_CACHED"
                     
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Sending bid to $ORCHESTRATOR_IP: $BID_RESPONSE (npu:$HAS_NPU/$FREE_NPU cpu:$CPU_LOAD ram:$RAM_LOAD prompt:$PROMPT_LENGTH pred_tokens:$PRED_TOKENS)" >> "$LOG_FILE"
+                    log INFO "Sending bid to $ORCHESTRATOR_IP: $BID_RESPONSE (npu:$HAS_NPU/$FREE_NPU backend:$BACKEND cpu:$CPU_LOAD ram:$RAM_LOAD prompt:$PROMPT_LENGTH pred_tokens:$PRED_TOKENS score from $SCORE_SOURCE)"
                     
                     # Send bid response to orchestrator on port 5002 (single line, no echo -e)
-                    printf "%s\n" "$BID_RESPONSE" | nc -w 2 "$ORCHESTRATOR_IP" 5002 >> "$LOG_FILE" 2>&1
+                    printf "%s\n" "$BID_RESPONSE" | nc -w 2 "$ORCHESTRATOR_IP" 5002 > /dev/null 2>&1
                     RC=$?
                     
+                    stage "${BID_TASK:-$BID_ID}" bid_compute
                     if [ "$RC" -eq 0 ]; then
-                        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Bid sent successfully (BidID: $BID_ID, Score: $SCORE, NPU: $HAS_NPU/$FREE_NPU)" >> "$LOG_FILE"
+                        log INFO "Bid sent successfully (BidID: $BID_ID, Score: $SCORE, NPU: $HAS_NPU/$FREE_NPU)"
                     else
-                        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] ERROR: Failed to send bid to $ORCHESTRATOR_IP (nc rc=$RC, host may be unreachable)" >> "$LOG_FILE"
+                        log ERROR "Failed to send bid to $ORCHESTRATOR_IP (nc rc=$RC, host may be unreachable)"
                     fi
                 else
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] ERROR: Multi-LinUCB solver failed" >> "$LOG_FILE"
+                    log ERROR "Multi-LinUCB solver failed"
                 fi
             fi
         fi
@@ -186,28 +309,34 @@ while true; do
 done &
 
 # Start listener for prompt execution requests on port 5004
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Starting prompt execution listener on port $PROMPT_EXEC_PORT" >> "$LOG_FILE"
+log INFO "Starting prompt execution listener on port $PROMPT_EXEC_PORT"
 
 while true; do
     # Listen on port 5004 for prompt execution requests
     EXEC_REQUEST=$(echo "" | nc -l -p $PROMPT_EXEC_PORT -w 5 2>/dev/null)
     
     if [ $? -eq 0 ] && [ -n "$EXEC_REQUEST" ]; then
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Received execution request: $EXEC_REQUEST" >> "$LOG_FILE"
+        log INFO "Received execution request: $EXEC_REQUEST"
         
         # Parse execution request
         if echo "$EXEC_REQUEST" | grep -q "PROMPT_EXEC"; then
             ORCHESTRATOR=$(echo "$EXEC_REQUEST" | grep -o 'from:[^|]*' | cut -d':' -f2)
             EXEC_MODE=$(echo "$EXEC_REQUEST" | grep -o 'mode:[^|]*' | cut -d':' -f2)
             PROMPT=$(echo "$EXEC_REQUEST" | grep -o 'prompt:[^|]*' | cut -d':' -f2-)
+            # Orchestrators that stream results send the task ID; the text goes back to their IP
+            STREAM_TASK=$(echo "$EXEC_REQUEST" | grep -o '|task:[^|]*' | cut -d':' -f2)
+            STREAM_IP=""
+            if [ -n "$STREAM_TASK" ]; then
+                STREAM_IP=$(grep -A2 "\"name\"[[:space:]]*:[[:space:]]*\"$ORCHESTRATOR\"" "$CONFIG_FILE" | grep '"ip"' | sed 's/.*"\([^"]*\)".*/\1/')
+            fi
             
             if [ -n "$PROMPT" ] && [ -n "$EXEC_MODE" ]; then
-                echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Executing prompt in $EXEC_MODE mode from $ORCHESTRATOR" >> "$LOG_FILE"
+                log INFO "Executing prompt in $EXEC_MODE mode from $ORCHESTRATOR (streaming to: ${STREAM_IP:-none})"
                 
                 if [ "$EXEC_MODE" = "NPU" ]; then
-                    execute_npu_prompt "$PROMPT" "$ORCHESTRATOR"
+                    execute_npu_prompt "$PROMPT" "$ORCHESTRATOR" "$STREAM_TASK" "$STREAM_IP"
                 elif [ "$EXEC_MODE" = "CPU" ]; then
-                    execute_cpu_prompt "$PROMPT" "$ORCHESTRATOR"
+                    execute_cpu_prompt "$PROMPT" "$ORCHESTRATOR" "$STREAM_TASK" "$STREAM_IP"
                 fi
             fi
         fi
@@ -5,20 +5,29 @@
 MESH_DIR="/sdcard/mesh_network"
 CONFIG_FILE="$MESH_DIR/device_config.json"
 LOG_FILE="$MESH_DIR/feedback_listener.log"
+LOG_SRC="feedback_listener"
 FEEDBACK_PORT=5003
 MULTILIN_BIN="/data/local/tmp/multilin"
 STATE_A="/data/local/tmp/state_A.dat"
 STATE_B="/data/local/tmp/state_B.dat"
-PENDING_BIDS_FILE="$MESH_DIR/pending_bids.txt"
+PENDING_BIDS_DIR="/data/local/tmp/pending_bids"  # One file per BidID, written by bid_listener.sh
+SYNC_EVERY=10  # Push the model to the registry every N trainings
+TRAIN_COUNT=0
+
+. "$MESH_DIR/log.sh"  # log LEVEL MESSAGE..., json_escape, record_residual
 
 # Parse device name
 CONFIG_FILE="$MESH_DIR/device_config.json"
 DEVICE_NAME=$(grep -o '"device_name"[[:space:]]*:[[:space:]]*"[^"]*"' "$CONFIG_FILE" | sed 's/.*"\([^"]*\)".*/\1/')
 
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Feedback listener starting on port $FEEDBACK_PORT" >> "$LOG_FILE"
+log INFO "Feedback listener starting on port $FEEDBACK_PORT"
+
+mkdir -p "$PENDING_BIDS_DIR"
 
-# Initialize pending bids file if doesn't exist
-touch "$PENDING_BIDS_FILE"
+# Fetch the fleet prior before listening (no-op without a registry_ip). Not in
+# the background: a prior only seeds a model that has no state file yet, and
+# the first train below would write one (nc -w 3 bounds the wait per backend)
+sh "$MESH_DIR/model_sync.sh"
 
 # Start listening for feedback
 while true; do
@@ -26,79 +35,79 @@ while true; do
     FEEDBACK=$(echo "" | nc -l -p $FEEDBACK_PORT -w 5 2>/dev/null)
     
     if [ $? -eq 0 ] && [ -n "$FEEDBACK" ]; then
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Received feedback: $FEEDBACK" >> "$LOG_FILE"
+        log INFO "Received feedback: $FEEDBACK"
         
         # Check if it's a feedback packet
         if echo "$FEEDBACK" | grep -q "FEEDBACK"; then
-            echo "" >> "$LOG_FILE"
-            echo "$(date '+%Y-%m-%d %H:%M:%S') ========================================" >> "$LOG_FILE"
-            echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] FEEDBACK RECEIVED" >> "$LOG_FILE"
-            echo "$(date '+%Y-%m-%d %H:%M:%S') ========================================" >> "$LOG_FILE"
+            log INFO "FEEDBACK RECEIVED"
             
             # Extract BidID and actual latency from feedback
             BID_ID=$(echo "$FEEDBACK" | grep -o 'bid_id:[^|]*' | cut -d':' -f2)
             ACTUAL_LATENCY=$(echo "$FEEDBACK" | grep -o 'latency:[^|]*' | cut -d':' -f2)
             
             if [ -n "$BID_ID" ] && [ -n "$ACTUAL_LATENCY" ]; then
-                echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Feedback for BidID: $BID_ID" >> "$LOG_FILE"
-                echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Actual Latency: $ACTUAL_LATENCY seconds" >> "$LOG_FILE"
-                echo "" >> "$LOG_FILE"
+                log INFO "Feedback for BidID: $BID_ID"
+                log INFO "Actual Latency: $ACTUAL_LATENCY seconds"
                 
-                # Lookup features from pending bids
-                BID_ENTRY=$(grep "^$BID_ID," "$PENDING_BIDS_FILE")
+                # Lookup features from pending bids (BidIDs are file names, so no paths)
+                case "$BID_ID" in
+                    */*|.*) BID_FILE="" ;;
+                    *) BID_FILE="$PENDING_BIDS_DIR/$BID_ID" ;;
+                esac
                 
-                if [ -n "$BID_ENTRY" ]; then
-                    # Extract features: BidID,cpu_norm,ram_norm,prompt_norm,timestamp
-                    CPU_NORM=$(echo "$BID_ENTRY" | cut -d',' -f2)
-                    RAM_NORM=$(echo "$BID_ENTRY" | cut -d',' -f3)
-                    PROMPT_NORM=$(echo "$BID_ENTRY" | cut -d',' -f4)
+                if [ -n "$BID_FILE" ] && [ -f "$BID_FILE" ]; then
+                    # BidID,cpu_load,ram_load,prompt_length,timestamp,backend,
+                    # pred_ttft,pred_speed,pred_latency,uncertainty,score,pred_tokens
+                    IFS=',' read -r _ CPU_LOAD RAM_LOAD PROMPT_LENGTH _ BACKEND PRED_TTFT PRED_SPEED PRED_LATENCY UNCERTAINTY BID_SCORE PRED_TOKENS < "$BID_FILE"
+                    BACKEND=${BACKEND:-cpu}
                     
-                    # Extract TTFT and Speed from feedback (assuming format: FEEDBACK|bid_id:X|ttft:Y|speed:Z)
+                    # FEEDBACK|bid_id:X|latency:L|ttft:Y|speed:Z (older orchestrators send latency only)
                     ACTUAL_TTFT=$(echo "$FEEDBACK" | grep -o 'ttft:[^|]*' | cut -d':' -f2)
                     ACTUAL_SPEED=$(echo "$FEEDBACK" | grep -o 'speed:[^|]*' | cut -d':' -f2)
                     
-                    # Fallback to latency if TTFT/Speed not provided (backward compatibility)
+                    log INFO "Found features from pending bids:"
+                    log INFO "  CPU load: $CPU_LOAD"
+                    log INFO "  RAM load: $RAM_LOAD"
+                    log INFO "  Prompt length: $PROMPT_LENGTH"
+                    log INFO "  Backend: $BACKEND"
+                    log INFO "  Predicted: latency=$PRED_LATENCY ttft=$PRED_TTFT speed=$PRED_SPEED"
+                    log INFO "  Actual:    latency=$ACTUAL_LATENCY ttft=$ACTUAL_TTFT speed=$ACTUAL_SPEED"
+                    record_residual
+                    
                     if [ -z "$ACTUAL_TTFT" ] || [ -z "$ACTUAL_SPEED" ]; then
-                        ACTUAL_LATENCY=$(echo "$FEEDBACK" | grep -o 'latency:[^|]*' | cut -d':' -f2)
-                        # Assume TTFT is 30% of latency, speed derived from rest
-                        ACTUAL_TTFT=$(echo "$ACTUAL_LATENCY" | awk '{printf "%.2f", $1 * 0.3}')
-                        ACTUAL_SPEED=$(echo "$ACTUAL_LATENCY" | awk '{printf "%.2f", 100 / ($1 * 0.7)}')  # tokens/sec estimate
+                        # Splitting the latency into a made-up TTFT/speed would train the model on noise
+                        log WARN "Latency-only feedback for $BID_ID: residual recorded, model not trained"
+                        rm -f "$BID_FILE"
+                        continue
                     fi
                     
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Found features from pending bids:" >> "$LOG_FILE"
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME]   CPU normalized: $CPU_NORM" >> "$LOG_FILE"
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME]   RAM normalized: $RAM_NORM" >> "$LOG_FILE"
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME]   Prompt normalized: $PROMPT_NORM" >> "$LOG_FILE"
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME]   TTFT: $ACTUAL_TTFT, Speed: $ACTUAL_SPEED tok/s" >> "$LOG_FILE"
-                    echo "" >> "$LOG_FILE"
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Training Multi-LinUCB model..." >> "$LOG_FILE"
+                    log INFO "Training Multi-LinUCB model..."
                     
                     # Train Multi-LinUCB model with TTFT and Speed
-                    TRAIN_OUTPUT=$($MULTILIN_BIN train $CPU_NORM $RAM_NORM $PROMPT_NORM $ACTUAL_TTFT $ACTUAL_SPEED 2>&1)
+                    TRAIN_OUTPUT=$($MULTILIN_BIN --backend $BACKEND train $CPU_LOAD $RAM_LOAD $PROMPT_LENGTH $ACTUAL_TTFT $ACTUAL_SPEED 2>&1)
                     
                     if [ $? -eq 0 ]; then
-                        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] ✓ Multi-LinUCB model updated successfully" >> "$LOG_FILE"
-                        echo "" >> "$LOG_FILE"
+                        log INFO "✓ Multi-LinUCB model updated successfully"
+                        
+                        TRAIN_COUNT=$((TRAIN_COUNT + 1))
+                        if [ $((TRAIN_COUNT % SYNC_EVERY)) -eq 0 ]; then
+                            sh "$MESH_DIR/model_sync.sh" "$BACKEND" &
+                        fi
                         
                         # Remove bid from pending bids
-                        grep -v "^$BID_ID," "$PENDING_BIDS_FILE" > "${PENDING_BIDS_FILE}.tmp"
-                        mv "${PENDING_BIDS_FILE}.tmp" "$PENDING_BIDS_FILE"
+                        rm -f "$BID_FILE"
                         
-                        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] ✓ Cleaned up pending bid: $BID_ID" >> "$LOG_FILE"
+                        log INFO "✓ Cleaned up pending bid: $BID_ID"
                     else
-                        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] ✗ ERROR: Multi-LinUCB training failed" >> "$LOG_FILE"
-                        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME]    Error: $TRAIN_OUTPUT" >> "$LOG_FILE"
+                        log ERROR "✗ Multi-LinUCB training failed: $TRAIN_OUTPUT"
                     fi
                 else
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] ⚠ WARNING: BidID $BID_ID not found in pending bids" >> "$LOG_FILE"
+                    log WARN "⚠ BidID $BID_ID not found in pending bids (expired or already used)"
                 fi
             else
-                echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] ✗ ERROR: Invalid feedback format" >> "$LOG_FILE"
-                echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME]    Missing bid_id or latency/ttft/speed in packet" >> "$LOG_FILE"
+                log ERROR "✗ Invalid feedback format: missing bid_id or latency in $FEEDBACK"
             fi
             
-            echo "$(date '+%Y-%m-%d %H:%M:%S') ========================================" >> "$LOG_FILE"
-            echo "" >> "$LOG_FILE"
         fi
     fi
     
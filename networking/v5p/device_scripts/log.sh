@@ -0,0 +1,72 @@
+# Shared logging, stage timing and residual rows for the device scripts. Set
+# LOG_FILE, LOG_SRC, STAGE_FILE and (once the config is read) DEVICE_NAME, then
+# source it:
+#     . "$MESH_DIR/log.sh"
+
+NL='
+'
+TAB='	'
+CR=$(printf '\r')
+# Control characters JSON needs as \u00XX (all but \t \n \r, which get short escapes)
+JSON_CTRL=$(printf '\001\002\003\004\005\006\007\010\013\014\016\017\020\021\022\023\024\025\026\027\030\031\032\033\034\035\036\037')
+
+# json_escape TEXT... sets JSON_OUT to TEXT escaped for a JSON string, without
+# forking unless TEXT holds a rare control character
+json_escape() {
+    JSON_OUT="$*"
+    JSON_OUT="${JSON_OUT//\\/\\\\}"
+    JSON_OUT="${JSON_OUT//\"/\\\"}"
+    JSON_OUT="${JSON_OUT//$NL/\\n}"
+    JSON_OUT="${JSON_OUT//$TAB/\\t}"
+    JSON_OUT="${JSON_OUT//$CR/\\r}"
+    case "$JSON_OUT" in
+        *[$JSON_CTRL]*) ;;
+        *) return 0 ;;
+    esac
+    JSON_I=0
+    while [ $JSON_I -lt ${#JSON_CTRL} ]; do
+        JSON_C="${JSON_CTRL:$JSON_I:1}"
+        case "$JSON_OUT" in
+            *"$JSON_C"*) JSON_OUT="${JSON_OUT//$JSON_C/\\u00$(printf '%02x' "'$JSON_C")}" ;;
+        esac
+        JSON_I=$((JSON_I + 1))
+    done
+}
+
+# log LEVEL MESSAGE... appends one JSON line to $LOG_FILE. The level is a
+# field of its own, so messages do not repeat it. mksh's EPOCHREALTIME avoids
+# forking date for every line; other shells fall back to whole seconds.
+log() {
+    LOG_LEVEL="$1"
+    shift
+    json_escape "$*"
+    printf '{"ts":%s,"level":"%s","src":"%s","device":"%s","msg":"%s"}\n' \
+        "${EPOCHREALTIME:-$(date +%s)}" "$LOG_LEVEL" "$LOG_SRC" "$DEVICE_NAME" "$JSON_OUT" >> "$LOG_FILE"
+}
+
+# Per-stage timing: stage ID NAME records the ms since $STAGE_MARK as
+# "id,stage,ms" in $STAGE_FILE and starts the next stage (summarise with
+# networking/src/latency.py). now_ms sets NOW_MS; set STAGE_MARK=$NOW_MS to begin.
+now_ms() {
+    if [ -n "$EPOCHREALTIME" ]; then
+        NOW_US="${EPOCHREALTIME/./}"
+        NOW_MS=$((NOW_US / 1000))
+    else
+        NOW_MS=$(($(date +%s) * 1000))
+    fi
+}
+stage() {
+    now_ms
+    printf '%s,%s,%s\n' "$1" "$2" "$((NOW_MS - STAGE_MARK))" >> "$STAGE_FILE"
+    STAGE_MARK=$NOW_MS
+}
+
+# record_residual appends one row to $RESIDUALS_FILE for accuracy.py: what the
+# bid predicted ($PRED_*, $UNCERTAINTY, $BID_SCORE) vs what happened ($ACTUAL_*)
+RESIDUALS_FILE="$MESH_DIR/residuals.csv"
+record_residual() {
+    if [ ! -f "$RESIDUALS_FILE" ]; then
+        echo "ts,device,bid_id,backend,pred_ttft,pred_speed,pred_tokens,pred_latency,uncertainty,score,actual_ttft,actual_speed,actual_latency" > "$RESIDUALS_FILE"
+    fi
+    echo "$(date +%s),$DEVICE_NAME,$BID_ID,$BACKEND,$PRED_TTFT,$PRED_SPEED,$PRED_TOKENS,$PRED_LATENCY,$UNCERTAINTY,$BID_SCORE,$ACTUAL_TTFT,$ACTUAL_SPEED,$ACTUAL_LATENCY" >> "$RESIDUALS_FILE"
+}
@@ -0,0 +1,52 @@
+#!/system/bin/sh
+# Model Sync - Pushes this device's Multi-LinUCB state to the model registry
+# and installs the fleet prior it answers with (one line each way)
+# Usage: sh model_sync.sh [backend...]   (default: cpu, plus npu if has_npu)
+
+MESH_DIR="/sdcard/mesh_network"
+CONFIG_FILE="$MESH_DIR/device_config.json"
+LOG_FILE="$MESH_DIR/model_sync.log"
+LOG_SRC="model_sync"
+MULTILIN_BIN="/data/local/tmp/multilin"
+
+. "$MESH_DIR/log.sh"  # log LEVEL MESSAGE..., json_escape
+
+DEVICE_NAME=$(grep -o '"device_name"[[:space:]]*:[[:space:]]*"[^"]*"' "$CONFIG_FILE" | sed 's/.*"\([^"]*\)".*/\1/')
+REGISTRY_IP=$(grep -o '"registry_ip"[[:space:]]*:[[:space:]]*"[^"]*"' "$CONFIG_FILE" | sed 's/.*"\([^"]*\)".*/\1/')
+REGISTRY_PORT=$(grep -o '"registry_port"[[:space:]]*:[[:space:]]*[0-9]*' "$CONFIG_FILE" | grep -o '[0-9]*$')
+REGISTRY_PORT=${REGISTRY_PORT:-5005}
+
+if [ -z "$REGISTRY_IP" ]; then
+    # No registry configured; devices keep learning on their own
+    exit 0
+fi
+
+BACKENDS="$*"
+if [ -z "$BACKENDS" ]; then
+    BACKENDS="cpu"
+    HAS_NPU=$(grep -o '"has_npu"[[:space:]]*:[[:space:]]*[a-z]*' "$CONFIG_FILE" | sed 's/.*: *\([a-z]*\)/\1/')
+    if [ "$HAS_NPU" = "true" ]; then
+        BACKENDS="cpu npu"
+    fi
+fi
+
+for BACKEND in $BACKENDS; do
+    STATE=$($MULTILIN_BIN --backend $BACKEND export 2>/dev/null)
+    if [ -z "$STATE" ]; then
+        log WARN "Could not export $BACKEND state"
+        continue
+    fi
+
+    REPLY=$(echo "MODEL_STATE|device:$DEVICE_NAME|state:$STATE" | nc -w 3 "$REGISTRY_IP" "$REGISTRY_PORT" 2>/dev/null)
+    PRIOR=$(echo "$REPLY" | grep -o 'state:[^|]*' | cut -d':' -f2)
+
+    if [ -z "$REPLY" ]; then
+        log WARN "Registry $REGISTRY_IP:$REGISTRY_PORT unreachable ($BACKEND)"
+    elif [ -z "$PRIOR" ] || [ "$PRIOR" = "none" ]; then
+        log INFO "Pushed $BACKEND state; no fleet prior yet"
+    elif $MULTILIN_BIN --backend $BACKEND prior "$PRIOR" > /dev/null 2>&1; then
+        log INFO "Pushed $BACKEND state; fleet prior installed"
+    else
+        log WARN "Registry sent an invalid $BACKEND prior: $REPLY"
+    fi
+done
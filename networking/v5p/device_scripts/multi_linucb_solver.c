@@ -6,24 +6,58 @@
  * 3. Calls external predictor to estimate output tokens
  * 4. Combines them: Latency = TTFT + (Tokens / TPS)
  * 5. Applies Optimism: Score = Latency - (Alpha * Uncertainty)
+ *
+ * Non-stationarity (v4):
+ * - Discounted LinUCB: every update first scales A and b by GAMMA, so old
+ *   observations fade with an effective window of ~1/(1-GAMMA) updates
+ * - A_inv is kept up to date with Sherman-Morrison instead of re-inverting A
+ *   on every score; state persists in STATE_PATH (or $MULTILIN_STATE)
+ * - An EWMA of recent prediction error and of the actual/predicted TTFT ratio
+ *   ("slowdown") is tracked; the slowdown scales predicted TTFT so a throttled
+ *   phone bids worse within a few feedbacks, before the weights catch up
+ *
+ * Per-backend models with a fleet prior:
+ * - CPU (llama-cli) and NPU (genie-t2t-run) have unrelated latency curves, so
+ *   each backend keeps its own state file (--backend cpu|npu, default cpu)
+ * - A fresh or reset model starts from the fleet prior pushed by the model
+ *   registry (model_registry.py via model_sync.sh), falling back to the lab
+ *   warm start below; "export"/"prior" move state as one compact text line
  */
 
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include <math.h>
+#include <time.h>
 
 #define DIM 4
 #define ALPHA 0.5 // Exploration parameter
 #define PREDICTOR_PATH "/data/local/tmp/cppllama-bundle/llama.cpp/predictor"
 #define DEFAULT_TOKENS 75  // Fallback if predictor fails
+#define STATE_PREFIX "/data/local/tmp/multilin_state"  // + "_<backend>.dat" / ".prior"
+#define SYNC_TAG "ML1"     // Version tag of the compact export/prior line
+#define STATE_MAGIC 0x4D4C5534  // "MLU4"
+#define GAMMA 0.995        // Forgetting factor per update (effective window ~200 updates)
+#define LAMBDA_FLOOR 1.0   // Minimum diagonal of A so it stays invertible as old data fades
+#define REFRESH_EVERY 256  // Re-invert A this often to shed Sherman-Morrison rounding drift
+#define ERR_WEIGHT 0.2     // EWMA weight of the newest error (reacts within ~5 feedbacks)
+#define SLOWDOWN_MIN 0.5
+#define SLOWDOWN_MAX 4.0
 
 // Data Structures
 typedef struct {
-    double A[DIM][DIM];     // Shared Covariance Matrix
+    unsigned int magic;
+    double A[DIM][DIM];     // Shared Covariance Matrix (discounted)
+    double A_inv[DIM][DIM]; // Maintained incrementally alongside A
     double b_ttft[DIM];     // Weights for TTFT
     double b_speed[DIM];    // Weights for Speed
     double alpha;
+    double gamma;
+    long updates;
+    double err_ttft;        // EWMA |predicted - actual| TTFT (s)
+    double err_speed;       // EWMA |predicted - actual| speed (tok/s)
+    double slowdown;        // EWMA actual / predicted TTFT
+    long last_update;       // Unix time of the last train
 } MultiLinUCB;
 
 // --- HARDCODED WARM START DATA ---
@@ -40,14 +74,126 @@ double b_speed_init[DIM] = {18712.935297, 7022.409791, 9165.157313, 3868.617305}
 // ---------------------------------
 
 
-// Initialize
-void solver_init(MultiLinUCB *solver) {
+int invert_matrix(double A[DIM][DIM], double A_inv[DIM][DIM]);
+
+const char *backend = "cpu";
+
+const char* state_file(const char *suffix) {
+    static char path[2][512];
+    static int which = 0;
+    const char *prefix = getenv("MULTILIN_STATE");
+    which ^= 1;
+    snprintf(path[which], sizeof(path[which]), "%s_%s%s", (prefix && *prefix) ? prefix : STATE_PREFIX, backend, suffix);
+    return path[which];
+}
+
+const char* state_path() { return state_file(".dat"); }
+const char* prior_path() { return state_file(".prior"); }
+
+// Compact line: ML1,<backend>,gamma,updates,err_ttft,err_speed,slowdown,A (upper triangle),b_ttft,b_speed
+void solver_format(MultiLinUCB *solver, char *out, size_t size) {
+    int n = snprintf(out, size, "%s,%s,%.6g,%ld,%.6g,%.6g,%.6g", SYNC_TAG, backend, solver->gamma,
+                     solver->updates, solver->err_ttft, solver->err_speed, solver->slowdown);
+    for(int i=0; i<DIM; i++)
+        for(int j=i; j<DIM; j++) n += snprintf(out + n, size - n, ",%.9g", solver->A[i][j]);
+    for(int i=0; i<DIM; i++) n += snprintf(out + n, size - n, ",%.9g", solver->b_ttft[i]);
+    for(int i=0; i<DIM; i++) n += snprintf(out + n, size - n, ",%.9g", solver->b_speed[i]);
+}
+
+// Parse a compact line into solver; returns 0 on success (backend must match ours)
+int solver_parse(MultiLinUCB *solver, const char *line) {
+    char buf[2048];
+    char *fields[64];
+    int count = 0;
+    snprintf(buf, sizeof(buf), "%s", line);
+    buf[strcspn(buf, "\r\n")] = '\0';
+    for (char *tok = strtok(buf, ","); tok && count < 64; tok = strtok(NULL, ",")) fields[count++] = tok;
+    int expected = 7 + DIM * (DIM + 1) / 2 + 2 * DIM;
+    if (count != expected || strcmp(fields[0], SYNC_TAG) != 0 || strcmp(fields[1], backend) != 0) return -1;
+
+    MultiLinUCB parsed;
+    memset(&parsed, 0, sizeof(parsed));
+    parsed.magic = STATE_MAGIC;
+    parsed.alpha = ALPHA;
+    parsed.gamma = atof(fields[2]);
+    parsed.updates = atol(fields[3]);
+    parsed.err_ttft = atof(fields[4]);
+    parsed.err_speed = atof(fields[5]);
+    parsed.slowdown = atof(fields[6]);
+    int f = 7;
+    for(int i=0; i<DIM; i++)
+        for(int j=i; j<DIM; j++) parsed.A[i][j] = parsed.A[j][i] = atof(fields[f++]);
+    for(int i=0; i<DIM; i++) parsed.b_ttft[i] = atof(fields[f++]);
+    for(int i=0; i<DIM; i++) parsed.b_speed[i] = atof(fields[f++]);
+    if (parsed.gamma <= 0.0 || parsed.gamma > 1.0 || parsed.slowdown <= 0.0) return -1;
+    if (invert_matrix(parsed.A, parsed.A_inv) != 0) return -1;
+    *solver = parsed;
+    return 0;
+}
+
+// Initialize; returns 1 if the fleet prior was used, 0 for the lab warm start
+int solver_init(MultiLinUCB *solver, double gamma) {
+    // Hierarchical start: the fleet prior for this backend if the registry sent one
+    char line[2048];
+    FILE *fp = fopen(prior_path(), "r");
+    if (fp) {
+        int ok = fgets(line, sizeof(line), fp) != NULL && solver_parse(solver, line) == 0;
+        fclose(fp);
+        if (ok) {
+            solver->gamma = gamma;
+            solver->updates = 0;
+            solver->err_ttft = solver->err_speed = 0.0;
+            solver->slowdown = 1.0;
+            solver->last_update = 0;
+            return 1;
+        }
+    }
+
+    memset(solver, 0, sizeof(*solver));
+    solver->magic = STATE_MAGIC;
     solver->alpha = ALPHA;
+    solver->gamma = gamma;
+    solver->slowdown = 1.0;
     
-    // Copy Warm Start values
-    memcpy(solver->A, A_init, sizeof(A_init));
-    memcpy(solver->b_ttft, b_ttft_init, sizeof(b_ttft_init));
-    memcpy(solver->b_speed, b_speed_init, sizeof(b_speed_init));
+    // Copy Warm Start values, scaled down to one forgetting window so the lab
+    // rows act as a prior rather than outweighing the first ~2,900 feedbacks
+    double scale = 1.0;
+    if (gamma < 1.0 && A_init[0][0] > 1.0 / (1.0 - gamma)) {
+        scale = (1.0 / (1.0 - gamma)) / A_init[0][0];
+    }
+    for(int i=0; i<DIM; i++) {
+        for(int j=0; j<DIM; j++) solver->A[i][j] = A_init[i][j] * scale;
+        solver->b_ttft[i] = b_ttft_init[i] * scale;
+        solver->b_speed[i] = b_speed_init[i] * scale;
+    }
+    invert_matrix(solver->A, solver->A_inv);
+    return 0;
+}
+
+// Load persisted state; falls back to the warm start if missing or from another version
+void solver_load(MultiLinUCB *solver) {
+    FILE *fp = fopen(state_path(), "rb");
+    if (fp) {
+        size_t n = fread(solver, sizeof(*solver), 1, fp);
+        fclose(fp);
+        if (n == 1 && solver->magic == STATE_MAGIC) return;
+    }
+    solver_init(solver, GAMMA);
+}
+
+// Write to a temp file and rename so a concurrent score never reads a torn state
+int write_atomic(const char *path, const void *data, size_t size) {
+    char tmp[512];
+    snprintf(tmp, sizeof(tmp), "%s.tmp", path);
+    FILE *fp = fopen(tmp, "wb");
+    if (!fp) return -1;
+    size_t n = fwrite(data, size, 1, fp);
+    if (fclose(fp) != 0 || n != 1) return -1;
+    return rename(tmp, path);
+}
+
+int solver_save(MultiLinUCB *solver) {
+    return write_atomic(state_path(), solver, sizeof(*solver));
 }
 
 // Matrix Inversion (Gauss-Jordan)
@@ -133,107 +279,160 @@ double predict_tokens(const char* prompt) {
     return DEFAULT_TOKENS;
 }
 
-// Core Scoring Function
-// Note: Expects RAW values (cpu: 0-100, ram: 0-100, prompt_len: actual length)
-double get_score(MultiLinUCB *solver, double cpu, double ram, double prompt_len, double pred_tokens) {
-    // 1. Construct Feature Vector x [Bias, NormCPU, NormRAM, NormLen]
-    // Normalize the raw input values to 0-1 range
-    double x[DIM] = {
-        1.0, 
-        cpu / 100.0,        // CPU: 0-100 -> 0-1
-        ram / 100.0,        // RAM: 0-100 -> 0-1
-        prompt_len / 1000.0 // Prompt: actual length -> normalized
-    };
-
-    // 2. Invert A
-    double A_inv[DIM][DIM];
-    if(invert_matrix(solver->A, A_inv) != 0) return 9999.0; // Fail safe
-
-    // 3. Calculate Weights (Theta = A_inv * b)
-    double theta_ttft[DIM] = {0};
-    double theta_speed[DIM] = {0};
+// Feature Vector x [Bias, NormCPU, NormRAM, NormLen] from RAW values
+void build_features(double x[DIM], double cpu, double ram, double prompt_len) {
+    x[0] = 1.0;
+    x[1] = cpu / 100.0;        // CPU: 0-100 -> 0-1
+    x[2] = ram / 100.0;        // RAM: 0-100 -> 0-1
+    x[3] = prompt_len / 1000.0; // Prompt: actual length -> normalized
+}
 
+// Raw model predictions for x (no slowdown correction)
+void predict(MultiLinUCB *solver, double x[DIM], double *pred_ttft, double *pred_speed, double *uncertainty) {
+    double A_inv_x[DIM] = {0};
+    double uncertainty_sq = 0.0;
+    *pred_ttft = 0.0;
+    *pred_speed = 0.0;
     for(int i=0; i<DIM; i++) {
         for(int j=0; j<DIM; j++) {
-            theta_ttft[i] += A_inv[i][j] * solver->b_ttft[j];
-            theta_speed[i] += A_inv[i][j] * solver->b_speed[j];
+            A_inv_x[i] += solver->A_inv[i][j] * x[j];
         }
     }
-
-    // 4. Predict Individual Components (Dot Product)
-    double pred_ttft = 0.0;
-    double pred_speed = 0.0;
-    double uncertainty_sq = 0.0;
-
-    // Also calculate Uncertainty term: x^T * A_inv * x
-    // First calculate (A_inv * x)
-    double A_inv_x[DIM] = {0};
-    for(int i=0; i<DIM; i++) {
-        for(int j=0; j<DIM; j++) A_inv_x[i] += A_inv[i][j] * x[j];
-    }
-
+    // Theta = A_inv * b, so x . Theta = (A_inv x) . b since A_inv is symmetric
     for(int i=0; i<DIM; i++) {
-        pred_ttft += theta_ttft[i] * x[i];
-        pred_speed += theta_speed[i] * x[i];
+        *pred_ttft += A_inv_x[i] * solver->b_ttft[i];
+        *pred_speed += A_inv_x[i] * solver->b_speed[i];
         uncertainty_sq += x[i] * A_inv_x[i];
     }
+    *uncertainty = sqrt(fabs(uncertainty_sq));
+}
 
-    double uncertainty = sqrt(fabs(uncertainty_sq));
+// Core Scoring Function
+// Note: Expects RAW values (cpu: 0-100, ram: 0-100, prompt_len: actual length)
+double get_score(MultiLinUCB *solver, double cpu, double ram, double prompt_len, double pred_tokens) {
+    double x[DIM];
+    build_features(x, cpu, ram, prompt_len);
+
+    double pred_ttft, pred_speed, uncertainty;
+    predict(solver, x, &pred_ttft, &pred_speed, &uncertainty);
+    pred_ttft *= solver->slowdown;
 
-    // 5. Apply Formula: Latency = TTFT + (Tokens / Speed)
-    // Guard against div/0 or negative speed
+    // Latency = TTFT + (Tokens / Speed); guard against div/0 or negative speed
     if(pred_speed < 0.1) pred_speed = 0.1; 
-    
     double total_latency = pred_ttft + (pred_tokens / pred_speed);
 
-    // 6. Apply Lower Confidence Bound (Optimism)
+    // Lower Confidence Bound (Optimism)
     double score = total_latency - (solver->alpha * uncertainty);
-    
+
+    fprintf(stderr, "Predicted ttft: %.3f speed: %.3f\n", pred_ttft, pred_speed);
+    fprintf(stderr, "Predicted latency: %.3f\n", total_latency);
+    fprintf(stderr, "Uncertainty: %.4f\n", uncertainty);
+    fprintf(stderr, "Recent error: ttft=%.3f speed=%.3f slowdown=%.2f\n",
+            solver->err_ttft, solver->err_speed, solver->slowdown);
     return score;
 }
 
 // Training Function (Update Brain)
 // Note: Expects RAW values (cpu: 0-100, ram: 0-100, prompt_len: actual length)
 void train(MultiLinUCB *solver, double cpu, double ram, double prompt_len, double actual_ttft, double actual_speed) {
-    // Normalize raw values to match scoring function
-    double x[DIM] = { 
-        1.0, 
-        cpu/100.0,        // CPU: 0-100 -> 0-1
-        ram/100.0,        // RAM: 0-100 -> 0-1
-        prompt_len/1000.0 // Prompt: actual length -> normalized
-    };
-
-    // Update A += x * x^T
+    double x[DIM];
+    build_features(x, cpu, ram, prompt_len);
+
+    // Track recent error against what the model would have bid with
+    double pred_ttft, pred_speed, uncertainty;
+    predict(solver, x, &pred_ttft, &pred_speed, &uncertainty);
+    double err_ttft = fabs(pred_ttft * solver->slowdown - actual_ttft);
+    double err_speed = fabs(pred_speed - actual_speed);
+    if (solver->updates == 0) {
+        solver->err_ttft = err_ttft;
+        solver->err_speed = err_speed;
+    } else {
+        solver->err_ttft += ERR_WEIGHT * (err_ttft - solver->err_ttft);
+        solver->err_speed += ERR_WEIGHT * (err_speed - solver->err_speed);
+    }
+    if (pred_ttft > 0.1) {
+        double ratio = actual_ttft / pred_ttft;
+        solver->slowdown += ERR_WEIGHT * (ratio - solver->slowdown);
+        if (solver->slowdown < SLOWDOWN_MIN) solver->slowdown = SLOWDOWN_MIN;
+        if (solver->slowdown > SLOWDOWN_MAX) solver->slowdown = SLOWDOWN_MAX;
+    }
+
+    // Discount: A = gamma*A + x*x^T, b = gamma*b + x*y
+    double g = solver->gamma;
     for(int i=0; i<DIM; i++) {
         for(int j=0; j<DIM; j++) {
-            solver->A[i][j] += x[i] * x[j];
+            solver->A[i][j] = g * solver->A[i][j] + x[i] * x[j];
+            solver->A_inv[i][j] /= g;  // (gamma*A)^-1
         }
+        solver->b_ttft[i] = g * solver->b_ttft[i] + x[i] * actual_ttft;
+        solver->b_speed[i] = g * solver->b_speed[i] + x[i] * actual_speed;
     }
 
-    // Update b += x * y
+    // Sherman-Morrison: (M + x x^T)^-1 = M^-1 - (M^-1 x)(M^-1 x)^T / (1 + x^T M^-1 x)
+    double Mx[DIM] = {0};
+    double denom = 1.0;
     for(int i=0; i<DIM; i++) {
-        solver->b_ttft[i] += x[i] * actual_ttft;
-        solver->b_speed[i] += x[i] * actual_speed;
+        for(int j=0; j<DIM; j++) Mx[i] += solver->A_inv[i][j] * x[j];
     }
+    for(int i=0; i<DIM; i++) denom += x[i] * Mx[i];
+    for(int i=0; i<DIM; i++) {
+        for(int j=0; j<DIM; j++) solver->A_inv[i][j] -= Mx[i] * Mx[j] / denom;
+    }
+
+    // Directions that stop being exercised decay towards singular; floor them
+    int refresh = (++solver->updates % REFRESH_EVERY) == 0;
+    for(int i=0; i<DIM; i++) {
+        if (solver->A[i][i] < LAMBDA_FLOOR) {
+            solver->A[i][i] = LAMBDA_FLOOR;
+            refresh = 1;
+        }
+    }
+    if (refresh) invert_matrix(solver->A, solver->A_inv);
+
+    solver->last_update = (long)time(NULL);
+    fprintf(stderr, "Prediction error: ttft=%.3f speed=%.3f (recent ttft=%.3f speed=%.3f slowdown=%.2f)\n",
+            err_ttft, err_speed, solver->err_ttft, solver->err_speed, solver->slowdown);
 }
 
 // Main CLI for Testing
 int main(int argc, char *argv[]) {
+    // Strip "--backend <name>" wherever it appears so positional arguments stay put
+    for (int i = 1; i < argc; i++) {
+        if (strcmp(argv[i], "--backend") == 0 && i + 1 < argc) {
+            backend = argv[i + 1];
+            for (int k = i; k + 2 <= argc; k++) argv[k] = argv[k + 2];
+            argc -= 2;
+            break;
+        }
+    }
+    if (strlen(backend) == 0 || strspn(backend, "abcdefghijklmnopqrstuvwxyz0123456789") != strlen(backend)) {
+        printf("Error: backend must be lowercase letters/digits (e.g. cpu, npu)\n");
+        return 1;
+    }
+
     if(argc < 2) {
         printf("Multi-LinUCB Solver - Edge SLM Orchestration\n");
         printf("Usage:\n");
         printf("  Score (with prompt): %s score <cpu> <ram> <prompt_len> \"<prompt>\"\n", argv[0]);
         printf("  Score (manual):      %s score <cpu> <ram> <prompt_len> <pred_tokens>\n", argv[0]);
         printf("  Train:               %s train <cpu> <ram> <prompt_len> <actual_ttft> <actual_speed>\n", argv[0]);
+        printf("  Predict tokens only: %s tokens \"<prompt>\"\n", argv[0]);
+        printf("  Status:              %s status\n", argv[0]);
+        printf("  Reset:               %s reset [gamma]\n", argv[0]);
+        printf("  Export state line:   %s export\n", argv[0]);
+        printf("  Install fleet prior: %s prior \"<line>\"\n", argv[0]);
+        printf("\nAll modes accept --backend cpu|npu (default cpu)\n");
+        printf("State: %s (prefix overridable with $MULTILIN_STATE)\n", state_path());
         printf("\nExamples:\n");
         printf("  %s score 45.2 60.5 150 \"What is the capital of France?\"\n", argv[0]);
         printf("  %s score 45.2 60.5 150 75\n", argv[0]);
         printf("  %s train 45.2 60.5 150 2.5 8.3\n", argv[0]);
+        printf("  %s --backend npu score 45.2 60.5 150 75\n", argv[0]);
         return 1;
     }
 
     MultiLinUCB solver;
-    solver_init(&solver);
+    solver_load(&solver);
     
     const char* mode = argv[1];
     
@@ -272,6 +471,15 @@ int main(int argc, char *argv[]) {
         double score = get_score(&solver, cpu, ram, prompt_len, pred_tokens);
         printf("%.6f\n", score);
         
+    } else if (strcmp(mode, "tokens") == 0) {
+        // Output length depends on the prompt alone, so bid_listener.sh caches it
+        // per prompt and scores with the number
+        if (argc < 3) {
+            printf("Usage: %s tokens \"<prompt>\"\n", argv[0]);
+            return 1;
+        }
+        printf("%.0f\n", predict_tokens(argv[2]));
+
     } else if (strcmp(mode, "train") == 0) {
         if(argc < 7) {
             printf("Error: train mode requires 6 arguments\n");
@@ -286,11 +494,66 @@ int main(int argc, char *argv[]) {
         double actual_speed = atof(argv[6]);
         
         train(&solver, cpu, ram, prompt_len, actual_ttft, actual_speed);
+        if (solver_save(&solver) != 0) {
+            printf("Error: could not save state to %s\n", state_path());
+            return 1;
+        }
         printf("Training completed\n");
         
+    } else if (strcmp(mode, "status") == 0) {
+        printf("backend: %s\n", backend);
+        printf("state: %s\n", state_path());
+        FILE *prior = fopen(prior_path(), "r");
+        printf("fleet_prior: %s\n", prior ? prior_path() : "none (lab warm start)");
+        if (prior) fclose(prior);
+        printf("gamma: %.4f (window ~%.0f updates)\n", solver.gamma, solver.gamma < 1.0 ? 1.0 / (1.0 - solver.gamma) : 0.0);
+        printf("updates: %ld\n", solver.updates);
+        printf("effective_n: %.1f\n", solver.A[0][0]);
+        printf("recent_err_ttft: %.4f\n", solver.err_ttft);
+        printf("recent_err_speed: %.4f\n", solver.err_speed);
+        printf("slowdown: %.3f\n", solver.slowdown);
+        printf("last_update: %ld\n", solver.last_update);
+        
+    } else if (strcmp(mode, "reset") == 0) {
+        double gamma = argc >= 3 ? atof(argv[2]) : GAMMA;
+        if (gamma <= 0.0 || gamma > 1.0) {
+            printf("Error: gamma must be in (0, 1]\n");
+            return 1;
+        }
+        int from_prior = solver_init(&solver, gamma);
+        if (solver_save(&solver) != 0) {
+            printf("Error: could not save state to %s\n", state_path());
+            return 1;
+        }
+        printf("State reset to %s (gamma %.4f)\n", from_prior ? "fleet prior" : "warm start", gamma);
+        
+    } else if (strcmp(mode, "export") == 0) {
+        char line[2048];
+        solver_format(&solver, line, sizeof(line));
+        printf("%s\n", line);
+        
+    } else if (strcmp(mode, "prior") == 0) {
+        if (argc < 3) {
+            printf("Usage: %s prior \"<line from model_registry>\"\n", argv[0]);
+            return 1;
+        }
+        MultiLinUCB parsed;
+        if (solver_parse(&parsed, argv[2]) != 0) {
+            printf("Error: invalid prior line for backend %s\n", backend);
+            return 1;
+        }
+        char line[2048];
+        solver_format(&parsed, line, sizeof(line));
+        strcat(line, "\n");
+        if (write_atomic(prior_path(), line, strlen(line)) != 0) {
+            printf("Error: could not save prior to %s\n", prior_path());
+            return 1;
+        }
+        printf("Fleet prior saved (effective_n %.1f); used on first run and reset\n", parsed.A[0][0]);
+        
     } else {
         printf("Error: Unknown mode '%s'\n", mode);
-        printf("Valid modes: score, train\n");
+        printf("Valid modes: score, tokens, train, status, reset, export, prior\n");
         return 1;
     }
 
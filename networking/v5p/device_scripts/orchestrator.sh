@@ -5,25 +5,87 @@
 MESH_DIR="/sdcard/mesh_network"
 CONFIG_FILE="$MESH_DIR/device_config.json"
 LOG_FILE="$MESH_DIR/orchestrator.log"
+LOG_SRC="orchestrator"
+STAGE_FILE="$MESH_DIR/stage_latency.csv"
 BID_RESPONSE_PORT=5002
+STREAM_PORT=5006      # Remote executions stream their text back here (stream_result in bid_listener.sh)
+STREAM_TIMEOUT=600    # Longest a streamed generation may run
 TIMEOUT=30
 MULTILIN_BIN="/data/local/tmp/multilin"
 STATE_A="/data/local/tmp/state_A.dat"
 STATE_B="/data/local/tmp/state_B.dat"
 
+. "$MESH_DIR/log.sh"  # log LEVEL MESSAGE..., json_escape, now_ms, stage ID NAME, record_residual
+. "$MESH_DIR/prompt_cache.sh"  # prefix_cache_file, lock_prefix_cache, touch_prefix_cache
+
+# Auction trace for networking/src/replay.py: trace EVENT key value [key value ...]
+# appends {"ts","level","src","event",key:value...} to $LOG_FILE; numbers and
+# true/false are written bare, anything else as a string
+trace() {
+    TRACE_LINE="{\"ts\":${EPOCHREALTIME:-$(date +%s)},\"level\":\"INFO\",\"src\":\"$LOG_SRC\",\"event\":\"$1\""
+    shift
+    while [ $# -ge 2 ]; do
+        case "$2" in
+            true|false) TRACE_LINE="$TRACE_LINE,\"$1\":$2" ;;
+            ''|*[!0-9.-]*|?*-*|*.*.*|.*|-.*|*.|-|0[0-9]*|-0[0-9]*)
+                json_escape "$2"
+                TRACE_LINE="$TRACE_LINE,\"$1\":\"$JSON_OUT\"" ;;
+            *) TRACE_LINE="$TRACE_LINE,\"$1\":$2" ;;
+        esac
+        shift 2
+    done
+    printf '%s}\n' "$TRACE_LINE" >> "$LOG_FILE"
+}
+
+# Print the RESULT_CHUNKs for $TASK_ID read from stdin as they arrive, so the
+# caller sees text after the first token instead of after the whole generation.
+# Chunks come over one connection and so in order; a gap in seq is logged.
+print_stream() {
+    NEXT_SEQ=1
+    while IFS= read -r chunk_line; do
+        case "$chunk_line" in
+            "RESULT_CHUNK|task:$TASK_ID|"*) ;;
+            *) continue ;;
+        esac
+        CHUNK_REST="${chunk_line#*"|seq:"}"
+        CHUNK_SEQ="${CHUNK_REST%%"|"*}"
+        CHUNK_BODY="${CHUNK_REST#*"|"}"
+        if [ "$NEXT_SEQ" -eq 1 ]; then
+            stage "$TASK_ID" first_token
+            log INFO "First token from $BEST_DEVICE"
+        fi
+        if [ "$CHUNK_SEQ" -ne "$NEXT_SEQ" ]; then
+            log WARN "Stream gap for $TASK_ID: expected chunk $NEXT_SEQ, got $CHUNK_SEQ"
+        fi
+        NEXT_SEQ=$((CHUNK_SEQ + 1))
+        case "$CHUNK_BODY" in
+            done:true)
+                echo ""
+                stage "$TASK_ID" stream
+                log INFO "Stream from $BEST_DEVICE complete ($((CHUNK_SEQ - 1)) chunks)"
+                return 0
+                ;;
+            text:*) printf '%b' "${CHUNK_BODY#text:}" ;;
+        esac
+    done
+    log WARN "Stream for $TASK_ID ended before its last chunk"
+    return 1
+}
+
+now_ms
+TASK_START=$NOW_MS
+STAGE_MARK=$NOW_MS
+TASK_ID="task_${TASK_START}_$$"
+
 # Get prompt length and prompt from arguments
 PROMPT_LENGTH=${1:-100}
 PROMPT=${2:-"Hello, how are you?"}
 
-echo "" >> "$LOG_FILE"
-echo "========================================" >> "$LOG_FILE"
-echo "$(date '+%Y-%m-%d %H:%M:%S') Orchestrator Starting" >> "$LOG_FILE"
-echo "  Prompt Length: $PROMPT_LENGTH" >> "$LOG_FILE"
-echo "  Prompt: $PROMPT" >> "$LOG_FILE"
-echo "========================================" >> "$LOG_FILE"
-
 # Parse device info
 DEVICE_NAME=$(grep -o '"device_name"[[:space:]]*:[[:space:]]*"[^"]*"' "$CONFIG_FILE" | sed 's/.*"\([^"]*\)".*/\1/')
+
+log INFO "Orchestrator Starting (prompt length: $PROMPT_LENGTH)"
+log DEBUG "Prompt: $PROMPT"
 DEVICE_IP=$(ip addr show wlan0 2>/dev/null | grep 'inet ' | awk '{print $2}' | cut -d'/' -f1)
 if [ -z "$DEVICE_IP" ]; then
     DEVICE_IP=$(hostname -I 2>/dev/null | awk '{print $1}')
@@ -35,25 +97,26 @@ if [ -z "$DEVICE_IP" ]; then
     DEVICE_IP=""
 fi
 
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Running on IP: $DEVICE_IP" >> "$LOG_FILE"
+log INFO "Running on IP: $DEVICE_IP"
 
 # Get list of peer IPs
 PEER_IPS=$(grep -o '"ip"[[:space:]]*:[[:space:]]*"[^"]*"' "$CONFIG_FILE" | sed 's/.*"\([^"]*\)".*/\1/')
 
 # Collect self metrics first to check for NPU
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Collecting self metrics..." >> "$LOG_FILE"
+log INFO "Collecting self metrics..."
 SELF_METRICS=$(sh "$MESH_DIR/collect_metrics.sh" 2>/dev/null)
 SELF_HAS_NPU=$(echo "$SELF_METRICS" | cut -d',' -f1)
 SELF_FREE_NPU=$(echo "$SELF_METRICS" | cut -d',' -f2)
 SELF_CPU_LOAD=$(echo "$SELF_METRICS" | cut -d',' -f3)
 SELF_RAM_LOAD=$(echo "$SELF_METRICS" | cut -d',' -f4)
 
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Self metrics: has_npu=$SELF_HAS_NPU free_npu=$SELF_FREE_NPU cpu=$SELF_CPU_LOAD ram=$SELF_RAM_LOAD" >> "$LOG_FILE"
+log INFO "Self metrics: has_npu=$SELF_HAS_NPU free_npu=$SELF_FREE_NPU cpu=$SELF_CPU_LOAD ram=$SELF_RAM_LOAD"
+stage "$TASK_ID" self_metrics
 
 # Check if self has free NPU - if so, execute locally without orchestration
 if [ "$SELF_HAS_NPU" = "true" ] && [ "$SELF_FREE_NPU" = "true" ]; then
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] ✓ Self device has FREE NPU - executing locally" >> "$LOG_FILE"
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Skipping bid collection, executing on self NPU" >> "$LOG_FILE"
+    log INFO "✓ Self device has FREE NPU - executing locally"
+    log INFO "Skipping bid collection, executing on self NPU"
     echo ""
     echo "✓ Winner: $DEVICE_NAME (NPU - Local)"
     echo ""
@@ -64,8 +127,8 @@ if [ "$SELF_HAS_NPU" = "true" ] && [ "$SELF_FREE_NPU" = "true" ]; then
         PROMPT="Hello, how are you?"
     fi
     
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Prompt: $PROMPT" >> "$LOG_FILE"
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] [NPU EXEC] Starting NPU execution locally..." >> "$LOG_FILE"
+    log INFO "Prompt: $PROMPT"
+    log INFO "[NPU EXEC] Starting NPU execution locally..."
     
     # Set NPU as busy
     echo "false" > "$MESH_DIR/npu_free.flag"
@@ -83,8 +146,8 @@ if [ "$SELF_HAS_NPU" = "true" ] && [ "$SELF_FREE_NPU" = "true" ]; then
         
         RESULT=$(./genie-t2t-run -c genie_config.json -p "$FORMATTED_PROMPT" 2>&1 | tail -20)
         
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] [NPU EXEC] Execution complete" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Result: $RESULT" >> "$LOG_FILE"
+        log INFO "[NPU EXEC] Execution complete"
+        log INFO "Result: $RESULT"
         
         # Free up NPU
         echo "true" > "$MESH_DIR/npu_free.flag"
@@ -93,7 +156,7 @@ if [ "$SELF_HAS_NPU" = "true" ] && [ "$SELF_FREE_NPU" = "true" ]; then
     END_TIME=$(date +%s)
     ACTUAL_LATENCY=$((END_TIME - START_TIME))
     
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] ✓ NPU execution initiated locally (latency: ${ACTUAL_LATENCY}s)" >> "$LOG_FILE"
+    log INFO "✓ NPU execution initiated locally (latency: ${ACTUAL_LATENCY}s)"
     echo ""
     echo "========================================="
     echo "✓ NPU execution initiated on self"
@@ -106,7 +169,8 @@ if [ "$SELF_HAS_NPU" = "true" ] && [ "$SELF_FREE_NPU" = "true" ]; then
 fi
 
 # If self doesn't have free NPU, proceed with orchestration - collect bids from peers
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] No free NPU on self - proceeding with orchestration" >> "$LOG_FILE"
+log INFO "No free NPU on self - proceeding with orchestration"
+trace auction_started task_id "$TASK_ID" source "$DEVICE_NAME" prompt_length "$PROMPT_LENGTH"
 
 # Create temporary file for bid responses
 BID_FILE="$MESH_DIR/bids_temp.txt"
@@ -114,7 +178,7 @@ BID_FILE="$MESH_DIR/bids_temp.txt"
 
 # Start persistent bid response listener in background using a loop
 # This accepts multiple connections on port 5002 until TIMEOUT
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Starting persistent bid response listener on port $BID_RESPONSE_PORT" >> "$LOG_FILE"
+log INFO "Starting persistent bid response listener on port $BID_RESPONSE_PORT"
 
 (
     LISTENER_START=$(date +%s)
@@ -131,7 +195,7 @@ echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Starting persistent bid respon
         # Continue in all cases to keep accepting connections
         
         if [ "$LISTEN_RC" -eq 0 ]; then
-            echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Received bid response" >> "$LOG_FILE"
+            log INFO "Received bid response"
         fi
         
         # Short pause between accepts to avoid busy loop
@@ -145,27 +209,26 @@ LISTENER_PID=$!
 sleep 1
 
 # Broadcast bid request to all peers with prompt_length and prompt
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Broadcasting BID_REQUEST to all peers" >> "$LOG_FILE"
-echo "" >> "$LOG_FILE"
+log INFO "Broadcasting BID_REQUEST to all peers"
 
 for peer_ip in $PEER_IPS; do
     if [ -n "$peer_ip" ]; then
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Sending bid request to $peer_ip:5001" >> "$LOG_FILE"
+        log INFO "Sending bid request to $peer_ip:5001"
         
         # Send bid request with retries for robustness
-        # Include prompt for token prediction
-        BID_REQUEST="BID_REQUEST|from:$DEVICE_NAME|prompt_length:$PROMPT_LENGTH|prompt:$PROMPT"
+        # Include prompt for token prediction, and the task ID the devices key their stage rows by
+        BID_REQUEST="BID_REQUEST|from:$DEVICE_NAME|prompt_length:$PROMPT_LENGTH|task:$TASK_ID|prompt:$PROMPT"
         RETRY_COUNT=0
         MAX_RETRIES=2
         
         while [ "$RETRY_COUNT" -le "$MAX_RETRIES" ]; do
             (
-                printf "%s\n" "$BID_REQUEST" | nc -w 3 -q 1 "$peer_ip" 5001 >> "$LOG_FILE" 2>&1
+                printf "%s\n" "$BID_REQUEST" | nc -w 3 -q 1 "$peer_ip" 5001 > /dev/null 2>&1
                 RC=$?
                 if [ "$RC" -eq 0 ]; then
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Bid request sent to $peer_ip (attempt $((RETRY_COUNT+1)))" >> "$LOG_FILE"
+                    log INFO "Bid request sent to $peer_ip (attempt $((RETRY_COUNT+1)))"
                 else
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] WARNING: failed to send bid to $peer_ip (nc rc=$RC, attempt $((RETRY_COUNT+1))/$((MAX_RETRIES+1)))" >> "$LOG_FILE"
+                    log WARN "Failed to send bid to $peer_ip (nc rc=$RC, attempt $((RETRY_COUNT+1))/$((MAX_RETRIES+1)))"
                 fi
             ) &
             
@@ -174,14 +237,12 @@ for peer_ip in $PEER_IPS; do
     fi
 done
 
-# Normalize self features for Multi-LinUCB
-CPU_NORM=$(echo "$SELF_CPU_LOAD" | awk '{printf "%.4f", $1/100}')
-RAM_NORM=$(echo "$SELF_RAM_LOAD" | awk '{printf "%.4f", $1/100}')
-PROMPT_NORM=$(echo "$PROMPT_LENGTH" | awk '{printf "%.4f", $1/1000}')
+stage "$TASK_ID" bid_broadcast
 
 # Get self score from Multi-LinUCB (passes prompt for token prediction)
 # Capture both stdout (score) and stderr (predicted tokens info)
-MULTILIN_SELF_OUTPUT=$($MULTILIN_BIN score $CPU_NORM $RAM_NORM $PROMPT_NORM "$PROMPT" 2>&1)
+MULTILIN_SELF_OUTPUT=$($MULTILIN_BIN --backend cpu score $SELF_CPU_LOAD $SELF_RAM_LOAD $PROMPT_LENGTH "$PROMPT" 2>&1)
+SELF_RC=$?  # Before the parsing below overwrites $?
 SELF_SCORE=$(echo "$MULTILIN_SELF_OUTPUT" | tail -1)
 SELF_PRED_TOKENS=$(echo "$MULTILIN_SELF_OUTPUT" | grep "Predicted tokens:" | awk '{print $3}')
 
@@ -189,43 +250,58 @@ SELF_PRED_TOKENS=$(echo "$MULTILIN_SELF_OUTPUT" | grep "Predicted tokens:" | awk
 if [ -z "$SELF_PRED_TOKENS" ]; then
     SELF_PRED_TOKENS=0
 fi
+SELF_PREDICTION=$(echo "$MULTILIN_SELF_OUTPUT" | awk '/^Predicted ttft:/ { t = $3; s = $5 } /^Predicted latency:/ { l = $3 } /^Uncertainty:/ { u = $2 } END { printf "%s,%s,%s,%s", t, s, l, u }')
 
-if [ $? -eq 0 ] && [ -n "$SELF_SCORE" ]; then
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Self score: $SELF_SCORE (cpu:$SELF_CPU_LOAD ram:$SELF_RAM_LOAD pred_tokens:$SELF_PRED_TOKENS)" >> "$LOG_FILE"
+if [ "$SELF_RC" -eq 0 ] && [ -n "$SELF_SCORE" ]; then
+    # Same prefix affinity as bid_listener.sh: a cached prompt prefix here skips most of the prefill
+    prefix_cache_file "$PROMPT"
+    if [ "$PREFIX_CACHED" = "true" ]; then
+        SELF_SCORE=$(awk -v s="$SELF_SCORE" -v t="${SELF_PREDICTION%%,*}" -v f="$PREFIX_TTFT_SAVING" 'BEGIN { printf "%.6f", s - t * f }')
+    fi
+    log INFO "Self score: $SELF_SCORE (cpu:$SELF_CPU_LOAD ram:$SELF_RAM_LOAD pred_tokens:$SELF_PRED_TOKENS prefix_cached:$PREFIX_CACHED)"
+    IFS=',' read -r _ _ SELF_PRED_LATENCY SELF_UNCERTAINTY <<EOF_PRED
+$SELF_PREDICTION
+EOF_PRED
+    trace bid_received task_id "$TASK_ID" device "$DEVICE_NAME" bid_id self score "$SELF_SCORE" \
+        has_npu "$SELF_HAS_NPU" free_npu "$SELF_FREE_NPU" pred_tokens "$SELF_PRED_TOKENS" backend cpu \
+        cpu_percent "$SELF_CPU_LOAD" ram_percent "$SELF_RAM_LOAD" \
+        predicted_latency "$SELF_PRED_LATENCY" uncertainty "$SELF_UNCERTAINTY" prefix_cached "$PREFIX_CACHED"
     LOWEST_SCORE=$SELF_SCORE
     BEST_DEVICE="$DEVICE_NAME"
     BEST_BID_ID="self"
     BEST_PRED_TOKENS=$SELF_PRED_TOKENS
 else
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] WARNING: Multi-LinUCB solver failed for self" >> "$LOG_FILE"
+    log WARN "Multi-LinUCB solver failed for self"
     LOWEST_SCORE=999999
     BEST_DEVICE=""
     BEST_BID_ID=""
     BEST_PRED_TOKENS=0
 fi
 
+stage "$TASK_ID" self_score
+
 # Wait for responses (up to TIMEOUT seconds) or until all peers replied
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Waiting for bid responses..." >> "$LOG_FILE"
+log INFO "Waiting for bid responses..."
 
 # Determine number of peers expected (non-empty entries in PEER_IPS)
 EXPECTED=$(echo "$PEER_IPS" | tr ' ' '\n' | grep -v '^$' | wc -l)
 
 if [ "$(echo "$EXPECTED" | tr -d '[:space:]')" -eq 0 ]; then
     # No peers configured — proceed after a short pause
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] No peers configured, using self" >> "$LOG_FILE"
+    log INFO "No peers configured, using self"
     sleep 1
 else
     START_TS=$(date +%s)
     END_TS=$((START_TS + TIMEOUT))
     
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Waiting for $EXPECTED peer bids (timeout: ${TIMEOUT}s)" >> "$LOG_FILE"
+    log INFO "Waiting for $EXPECTED peer bids (timeout: ${TIMEOUT}s)"
 
     while [ "$(date +%s)" -lt "$END_TS" ]; do
         COUNT=$(grep -c "BID_RESPONSE" "$BID_FILE" 2>/dev/null || true)
         ELAPSED=$(($(date +%s) - START_TS))
         
         if [ "$COUNT" -ge "$EXPECTED" ]; then
-            echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Received all $COUNT/$EXPECTED bids (after ${ELAPSED}s)" >> "$LOG_FILE"
+            log INFO "Received all $COUNT/$EXPECTED bids (after ${ELAPSED}s)"
             break
         fi
         
@@ -233,12 +309,19 @@ else
     done
     
     FINAL_COUNT=$(grep -c "BID_RESPONSE" "$BID_FILE" 2>/dev/null || true)
-    echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Bid collection complete: received $FINAL_COUNT/$EXPECTED bids" >> "$LOG_FILE"
+    log INFO "Bid collection complete: received $FINAL_COUNT/$EXPECTED bids"
 fi
 
-echo "" >> "$LOG_FILE"
-echo "$(date '+%Y-%m-%d %H:%M:%S') [$DEVICE_NAME] Processing received bids" >> "$LOG_FILE"
-echo "----------------------------------------" >> "$LOG_FILE"
+stage "$TASK_ID" bid_wait
+log INFO "Processing received bids"
+
+# Trace every bid before the NPU pass below can stop early; BID_RESPONSE
+# fields are already named like the trace keys
+if [ -s "$BID_FILE" ]; then
+    grep "BID_RESPONSE" "$BID_FILE" | while IFS= read -r bid_line; do
+        trace bid_received task_id "$TASK_ID" $(echo "$bid_line" | tr '|' '\n' | sed -n 's/^\([a-z_]*\):/\1 /p')
+    done
+fi
 
 # Parse bid responses and select lowest score
 # First pass: check for NPU devices with free NPU
@@ -260,14 +343,11 @@ if [ -s "$BID_FILE" ]; then
                 PRED_TOKENS=0
             fi
             
-            echo "$(date '+%Y-%m-%d %H:%M:%S') Bid from $DEVICE:" >> "$LOG_FILE"
-            echo "  - bid_id: $BID_ID" >> "$LOG_FILE"
-            echo "  - has_npu: $HAS_NPU, free_npu: $FREE_NPU" >> "$LOG_FILE"
-            echo "  - predicted_tokens: $PRED_TOKENS" >> "$LOG_FILE"
+            log INFO "Bid from $DEVICE: bid_id=$BID_ID has_npu=$HAS_NPU free_npu=$FREE_NPU predicted_tokens=$PRED_TOKENS"
             
             # Check for NPU availability
             if [ "$HAS_NPU" = "true" ] && [ "$FREE_NPU" = "true" ]; then
-                echo "  ✓ NPU DEVICE FOUND" >> "$LOG_FILE"
+                log DEBUG "✓ NPU DEVICE FOUND"
                 NPU_DEVICE="$DEVICE"
                 NPU_BID_ID="$BID_ID"
                 NPU_PRED_TOKENS="$PRED_TOKENS"
@@ -275,7 +355,6 @@ if [ -s "$BID_FILE" ]; then
                 break
             fi
             
-            echo "" >> "$LOG_FILE"
         fi
     done < "$BID_FILE"
 fi
@@ -294,10 +373,7 @@ if [ "$SEND_TO_NPU" = "no" ] && [ -s "$BID_FILE" ]; then
                 PRED_TOKENS=0
             fi
             
-            echo "$(date '+%Y-%m-%d %H:%M:%S') Bid from $DEVICE:" >> "$LOG_FILE"
-            echo "  - bid_id: $BID_ID" >> "$LOG_FILE"
-            echo "  - score: $SCORE" >> "$LOG_FILE"
-            echo "  - predicted_tokens: $PRED_TOKENS" >> "$LOG_FILE"
+            log INFO "Bid from $DEVICE: bid_id=$BID_ID score=$SCORE predicted_tokens=$PRED_TOKENS"
             
             # Compare scores (lower is better)
             SCORE_INT=$(echo "$SCORE" | awk '{printf "%d", $1 * 1000}')
@@ -308,10 +384,9 @@ if [ "$SEND_TO_NPU" = "no" ] && [ -s "$BID_FILE" ]; then
                 BEST_DEVICE="$DEVICE"
                 BEST_BID_ID="$BID_ID"
                 BEST_PRED_TOKENS="$PRED_TOKENS"
-                echo "  ✓ Lowest score so far" >> "$LOG_FILE"
+                log DEBUG "✓ Lowest score so far"
             fi
             
-            echo "" >> "$LOG_FILE"
         fi
     done < "$BID_FILE"
 fi
@@ -323,15 +398,17 @@ if [ "$SEND_TO_NPU" = "yes" ]; then
     BEST_PRED_TOKENS="$NPU_PRED_TOKENS"
 fi
 
+stage "$TASK_ID" scoring
+if [ -n "$BEST_DEVICE" ]; then
+    trace auction_winner task_id "$TASK_ID" device "$BEST_DEVICE" bid_id "$BEST_BID_ID" npu "$SEND_TO_NPU"
+fi
+
 # Print final decision
-echo "========================================" >> "$LOG_FILE"
-echo "$(date '+%Y-%m-%d %H:%M:%S') ORCHESTRATOR DECISION" >> "$LOG_FILE"
-echo "========================================" >> "$LOG_FILE"
-echo "" >> "$LOG_FILE"
+log INFO "ORCHESTRATOR DECISION"
 
 if [ -n "$BEST_DEVICE" ]; then
     if [ "$SEND_TO_NPU" = "yes" ]; then
-        echo "$(date '+%Y-%m-%d %H:%M:%S') ✓ NPU device chosen: $BEST_DEVICE (bid_id: $BEST_BID_ID, predicted_tokens: $BEST_PRED_TOKENS)" >> "$LOG_FILE"
+        log INFO "✓ NPU device chosen: $BEST_DEVICE (bid_id: $BEST_BID_ID, predicted_tokens: $BEST_PRED_TOKENS)"
         echo ""
         echo "✓ Winner: $BEST_DEVICE (NPU)"
         echo "BidID: $BEST_BID_ID"
@@ -344,28 +421,36 @@ if [ -n "$BEST_DEVICE" ]; then
             PROMPT="Hello, how are you?"
         fi
         
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [NPU EXEC] Sending prompt to NPU device $BEST_DEVICE (no feedback required)..." >> "$LOG_FILE"
+        log INFO "[NPU EXEC] Sending prompt to NPU device $BEST_DEVICE (no feedback required)..."
         
         # Get target device IP from peers
         TARGET_IP=$(grep -A2 "\"name\"[[:space:]]*:[[:space:]]*\"$BEST_DEVICE\"" "$CONFIG_FILE" | grep '"ip"' | sed 's/.*"\([^"]*\)".*/\1/')
         
         if [ -n "$TARGET_IP" ]; then
-            EXEC_MSG="PROMPT_EXEC|from:$DEVICE_NAME|mode:NPU|prompt:$PROMPT"
-            echo "$EXEC_MSG" | nc -w 2 "$TARGET_IP" 5004 >> "$LOG_FILE" 2>&1
+            # Listen for the streamed result before the device can start sending it
+            ( timeout $STREAM_TIMEOUT nc -l -p $STREAM_PORT 2>/dev/null | print_stream ) &
+            STREAM_PID=$!
+            sleep 1
+            
+            EXEC_MSG="PROMPT_EXEC|from:$DEVICE_NAME|mode:NPU|task:$TASK_ID|prompt:$PROMPT"
+            echo "$EXEC_MSG" | nc -w 2 "$TARGET_IP" 5004 > /dev/null 2>&1
             
             if [ $? -eq 0 ]; then
-                echo "$(date '+%Y-%m-%d %H:%M:%S') ✓ Prompt sent to NPU device, continuing..." >> "$LOG_FILE"
+                stage "$TASK_ID" prompt_send
+                log INFO "✓ Prompt sent to NPU device, streaming its output..."
                 echo "✓ Prompt sent to NPU device"
                 echo ""
+                wait $STREAM_PID
             else
-                echo "$(date '+%Y-%m-%d %H:%M:%S') ✗ Failed to send prompt to NPU device" >> "$LOG_FILE"
+                kill $STREAM_PID 2>/dev/null
+                log ERROR "✗ Failed to send prompt to NPU device"
                 echo "✗ Failed to send prompt to NPU device"
             fi
         else
-            echo "$(date '+%Y-%m-%d %H:%M:%S') WARNING: Could not find IP for NPU device $BEST_DEVICE" >> "$LOG_FILE"
+            log WARN "Could not find IP for NPU device $BEST_DEVICE"
         fi
     else
-        echo "$(date '+%Y-%m-%d %H:%M:%S') ✓ Lowest score chosen: $BEST_DEVICE (score: $LOWEST_SCORE, bid_id: $BEST_BID_ID, predicted_tokens: $BEST_PRED_TOKENS)" >> "$LOG_FILE"
+        log INFO "✓ Lowest score chosen: $BEST_DEVICE (score: $LOWEST_SCORE, bid_id: $BEST_BID_ID, predicted_tokens: $BEST_PRED_TOKENS)"
         echo ""
         echo "✓ Winner: $BEST_DEVICE (score: $LOWEST_SCORE)"
         echo "BidID: $BEST_BID_ID"
@@ -373,11 +458,8 @@ if [ -n "$BEST_DEVICE" ]; then
         echo ""
         
         # Execute SLM and measure latency
-        echo "" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') ----------------------------------------" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') SLM EXECUTION PHASE" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') ----------------------------------------" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') Executing SLM on $BEST_DEVICE..." >> "$LOG_FILE"
+        log INFO "SLM EXECUTION PHASE"
+        log INFO "Executing SLM on $BEST_DEVICE..."
         echo "Executing SLM on $BEST_DEVICE..."
         
         # Get prompt from command line args
@@ -386,43 +468,56 @@ if [ -n "$BEST_DEVICE" ]; then
             PROMPT="Hello, how are you?"
         fi
         
-        echo "$(date '+%Y-%m-%d %H:%M:%S') Prompt: $PROMPT" >> "$LOG_FILE"
+        log INFO "Prompt: $PROMPT"
         
-        START_TIME=$(date +%s)
+        now_ms
+        EXEC_START_MS=$NOW_MS
+        stage "$TASK_ID" prompt_send
         
         # Execute on CPU using llama.cpp
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [CPU EXEC] Starting CPU execution..." >> "$LOG_FILE"
+        log INFO "[CPU EXEC] Starting CPU execution..."
         
         cd /data/local/tmp/cppllama-bundle/llama.cpp
         export LD_LIBRARY_PATH=$PWD/build/bin
         
-        # Run llama-cli and save full output
+        # Run llama-cli and save full output; a cached prompt prefix skips most of the prefill
+        prefix_cache_file "$PROMPT"
+        lock_prefix_cache
+        log INFO "[CPU EXEC] Prefix cache: ${PREFIX_CACHE:-none} (cached: $PREFIX_CACHED)"
+        # Generated text is on stdout and shown as it is produced; logs and perf stats are on stderr
         TEMP_OUTPUT="/data/local/tmp/llama_output_$$.txt"
-        ./build/bin/llama-cli -m models/llama-3.2-3b-instruct-q4_k_m.gguf -p "$PROMPT" -n 1000 -no-cnv > "$TEMP_OUTPUT" 2>&1
+        ./build/bin/llama-cli -m models/llama-3.2-3b-instruct-q4_k_m.gguf -p "$PROMPT" $PROMPT_CACHE_ARGS -n 1000 \
+            -no-cnv --no-display-prompt 2>"$TEMP_OUTPUT.log" | tee "$TEMP_OUTPUT"
+        echo ""
+        touch_prefix_cache
         
-        # Extract ONLY the actual response text
-        RESULT=$(sed -n '/^generate:/,/^llama_perf_sampler/p' "$TEMP_OUTPUT" | \
-                 grep -v "^generate:" | \
-                 grep -v "^llama_perf" | \
-                 grep -v "^sampler" | \
-                 grep -v "^$" | \
-                 grep -v "^common_" | \
-                 grep -v "^load:" | \
-                 head -3 | \
-                 tail -1)
+        # The response is everything llama-cli wrote to stdout
+        RESULT=$(grep -v "^$" "$TEMP_OUTPUT" | tr '\n' ' ')
         
-        # Remove the prompt from the beginning if present
-        if echo "$RESULT" | grep -q "^$PROMPT"; then
-            RESULT=$(echo "$RESULT" | sed "s/^$PROMPT *//")
-        fi
+        # TTFT and stream speed from llama.cpp's perf lines, derived exactly like
+        # the data-collection harness so training targets mean the same thing
+        PERF=$(grep "time *=" "$TEMP_OUTPUT.log" | awk '
+            function num(re,   m) { if (match($0, re)) { m = substr($0, RSTART, RLENGTH); sub(/^[^0-9]*/, "", m); return m + 0 } return 0 }
+            /sampling time/    { sample_pt = num("[(] *[0-9.]+ ms per token") }
+            /load time/        { load = num("= *[0-9.]+ ms") }
+            /prompt eval time/ { prompt = num("= *[0-9.]+ ms"); next }
+            /eval time/        { eval_pt = num("[(] *[0-9.]+ ms per token"); runs = num("/ *[0-9]+ runs") }
+            /total time/       { total = num("= *[0-9.]+ ms"); tokens = num("/ *[0-9]+ tokens") }
+            END {
+                if (total <= 0) exit
+                if (tokens == 0) tokens = runs
+                warm = prompt + eval_pt + sample_pt
+                printf "%.3f %.3f", (0.6 * (load + warm) + 0.4 * warm) / 1000, tokens / (total / 1000)
+            }')
+        ACTUAL_TTFT=$(echo "$PERF" | awk '{print $1}')
+        ACTUAL_SPEED=$(echo "$PERF" | awk '{print $2}')
         
-        # Save full output to log for debugging
-        echo "$(date '+%Y-%m-%d %H:%M:%S') [DEBUG] Full llama output:" >> "$LOG_FILE"
-        cat "$TEMP_OUTPUT" >> "$LOG_FILE"
-        echo "" >> "$LOG_FILE"
+        # Keep the full output next to the log for debugging
+        cat "$TEMP_OUTPUT" "$TEMP_OUTPUT.log" > "$MESH_DIR/last_llama_output.txt"
+        log DEBUG "Full llama output saved to $MESH_DIR/last_llama_output.txt"
         
-        # Cleanup temp file
-        rm -f "$TEMP_OUTPUT"
+        # Cleanup temp files
+        rm -f "$TEMP_OUTPUT" "$TEMP_OUTPUT.log"
         
         # Final check and cleanup
         RESULT=$(echo "$RESULT" | sed 's/^[[:space:]]*//;s/[[:space:]]*$//')
@@ -430,14 +525,14 @@ if [ -n "$BEST_DEVICE" ]; then
             RESULT="[Could not extract response - see full output in logs]"
         fi
         
-        END_TIME=$(date +%s)
-        ACTUAL_LATENCY=$((END_TIME - START_TIME))
+        now_ms
+        ACTUAL_LATENCY=$(awk -v ms=$((NOW_MS - EXEC_START_MS)) 'BEGIN { printf "%.2f", ms / 1000 }')
+        stage "$TASK_ID" execution
         
-        echo "" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') ✓ SLM execution completed in ${ACTUAL_LATENCY}s" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') ✓ FULL Generated Response:" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S')    $RESULT" >> "$LOG_FILE"
-        echo "" >> "$LOG_FILE"
+        trace task_latency task_id "$TASK_ID" device "$BEST_DEVICE" latency "$ACTUAL_LATENCY" \
+            ttft "$ACTUAL_TTFT" speed "$ACTUAL_SPEED"
+        log INFO "✓ SLM execution completed in ${ACTUAL_LATENCY}s"
+        log INFO "✓ FULL Generated Response: $RESULT"
         echo ""
         echo "========================================="
         echo "✓ Execution completed in ${ACTUAL_LATENCY}s"
@@ -447,68 +542,74 @@ if [ -n "$BEST_DEVICE" ]; then
         echo ""
         
         # Send feedback to winner device (if not self)
-        echo "$(date '+%Y-%m-%d %H:%M:%S') ----------------------------------------" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') FEEDBACK PHASE" >> "$LOG_FILE"
-        echo "$(date '+%Y-%m-%d %H:%M:%S') ----------------------------------------" >> "$LOG_FILE"
+        log INFO "FEEDBACK PHASE"
         
         if [ "$BEST_DEVICE" != "$DEVICE_NAME" ] && [ "$BEST_BID_ID" != "self" ]; then
             # Get winner device IP from peers array
             WINNER_IP=$(grep -A2 "\"name\"[[:space:]]*:[[:space:]]*\"$BEST_DEVICE\"" "$CONFIG_FILE" | grep '"ip"' | sed 's/.*"\([^"]*\)".*/\1/')
             
             if [ -n "$WINNER_IP" ]; then
-                echo "$(date '+%Y-%m-%d %H:%M:%S') Sending feedback to $BEST_DEVICE at $WINNER_IP..." >> "$LOG_FILE"
+                log INFO "Sending feedback to $BEST_DEVICE at $WINNER_IP..."
                 echo "Sending feedback to $BEST_DEVICE..."
                 
                 FEEDBACK_PACKET="FEEDBACK|bid_id:$BEST_BID_ID|latency:$ACTUAL_LATENCY"
-                echo "$FEEDBACK_PACKET" | nc -w 2 "$WINNER_IP" 5003 >> "$LOG_FILE" 2>&1
+                if [ -n "$ACTUAL_TTFT" ] && [ -n "$ACTUAL_SPEED" ]; then
+                    FEEDBACK_PACKET="$FEEDBACK_PACKET|ttft:$ACTUAL_TTFT|speed:$ACTUAL_SPEED"
+                fi
+                echo "$FEEDBACK_PACKET" | nc -w 2 "$WINNER_IP" 5003 > /dev/null 2>&1
                 
                 if [ $? -eq 0 ]; then
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') ✓ Feedback sent successfully" >> "$LOG_FILE"
+                    log INFO "✓ Feedback sent successfully"
                     echo "✓ Feedback sent successfully"
                 else
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') ✗ Failed to send feedback" >> "$LOG_FILE"
+                    log ERROR "✗ Failed to send feedback"
                     echo "✗ Failed to send feedback"
                 fi
             else
-                echo "$(date '+%Y-%m-%d %H:%M:%S') WARNING: Could not find IP for winner $BEST_DEVICE" >> "$LOG_FILE"
+                log WARN "Could not find IP for winner $BEST_DEVICE"
                 echo "⚠ WARNING: Could not find IP for winner $BEST_DEVICE"
             fi
         else
             # Self execution - train directly
-            echo "$(date '+%Y-%m-%d %H:%M:%S') Self-execution, training own model..." >> "$LOG_FILE"
+            log INFO "Self-execution, training own model..."
             echo "Self-execution, training own model..."
             
             # Lookup features from pending bids (self bid)
             if [ "$BEST_BID_ID" = "self" ]; then
+                IFS=',' read -r PRED_TTFT PRED_SPEED PRED_LATENCY UNCERTAINTY <<EOF_PRED
+$SELF_PREDICTION
+EOF_PRED
+                BID_ID="self_$TASK_ID" BACKEND=cpu PRED_TOKENS=$SELF_PRED_TOKENS BID_SCORE=$SELF_SCORE
+                record_residual
+            fi
+            
+            if [ "$BEST_BID_ID" = "self" ] && [ -n "$ACTUAL_TTFT" ] && [ -n "$ACTUAL_SPEED" ]; then
                 # Train with current features
-                TRAIN_OUTPUT=$($MULTILIN_BIN train $CPU_NORM $RAM_NORM $PROMPT_NORM $ACTUAL_TTFT $ACTUAL_SPEED 2>&1)
+                TRAIN_OUTPUT=$($MULTILIN_BIN --backend cpu train $SELF_CPU_LOAD $SELF_RAM_LOAD $PROMPT_LENGTH $ACTUAL_TTFT $ACTUAL_SPEED 2>&1)
                 
                 if [ $? -eq 0 ]; then
-                    echo "$(date '+%Y-%m-%d %H:%M:%S') ✓ Multi-LinUCB model updated (self-training)" >> "$LOG_FILE"
-                    echo "$(date '+%Y-%m-%d %H:%M:%S')    Features: cpu=$CPU_NORM, ram=$RAM_NORM, prompt=$PROMPT_NORM" >> "$LOG_FILE"
-                    echo "$(date '+%Y-%m-%d %H:%M:%S')    Actual TTFT: ${ACTUAL_TTFT}s, Speed: ${ACTUAL_SPEED} tok/s" >> "$LOG_FILE"
+                    log INFO "✓ Multi-LinUCB model updated (self-training)"
+                    log INFO "   Features: cpu=$SELF_CPU_LOAD, ram=$SELF_RAM_LOAD, prompt=$PROMPT_LENGTH"
+                    log INFO "   Actual TTFT: ${ACTUAL_TTFT}s, Speed: ${ACTUAL_SPEED} tok/s"
                     echo "✓ Model updated with actual metrics"
                     echo "   TTFT: ${ACTUAL_TTFT}s, Speed: ${ACTUAL_SPEED} tok/s"
-                    echo "   Features: cpu=$CPU_NORM, ram=$RAM_NORM, prompt=$PROMPT_NORM"
+                    echo "   Features: cpu=$SELF_CPU_LOAD, ram=$SELF_RAM_LOAD, prompt=$PROMPT_LENGTH"
                 fi
             fi
         fi
-        echo "" >> "$LOG_FILE"
+        stage "$TASK_ID" feedback
         echo ""
     fi
 else
-    echo "$(date '+%Y-%m-%d %H:%M:%S') ✗ No suitable device found" >> "$LOG_FILE"
-    echo "" >> "$LOG_FILE"
+    log ERROR "✗ No suitable device found"
     echo ""
     echo "✗ No suitable device found"
     echo ""
 fi
 
-echo "" >> "$LOG_FILE"
-echo "========================================" >> "$LOG_FILE"
-echo "$(date '+%Y-%m-%d %H:%M:%S') ORCHESTRATION COMPLETE" >> "$LOG_FILE"
-echo "========================================" >> "$LOG_FILE"
-echo "" >> "$LOG_FILE"
+now_ms
+printf '%s,%s,%s\n' "$TASK_ID" end_to_end "$((NOW_MS - TASK_START))" >> "$STAGE_FILE"
+log INFO "ORCHESTRATION COMPLETE ($TASK_ID, $((NOW_MS - TASK_START)) ms)"
 
 # Cleanup - kill listener and temp file
 kill $LISTENER_PID 2>/dev/null || true
@@ -0,0 +1,49 @@
+# llama-cli prompt prefix cache shared by bid_listener.sh and orchestrator.sh,
+# which use the same directory on a device. Source it after log.sh:
+#     . "$MESH_DIR/prompt_cache.sh"
+
+PROMPT_CACHE_DIR="/data/local/tmp/prompt_cache"  # llama-cli KV state per prompt prefix, see prefix_cache_file
+PROMPT_CACHE_MIN_CHARS=32  # Shorter prefixes are not worth a cache file
+PROMPT_CACHE_MAX=8         # Cache files kept, least recently used go first (tens of MB each for the 3B model)
+PROMPT_CACHE_LOCK_MIN=30   # Minutes after which a cache lock counts as stale (no run takes that long)
+PREFIX_TTFT_SAVING=0.6     # Share of the predicted TTFT a cached prefix saves, taken off CPU bids
+
+# Prompt prefix reuse for llama-cli. Story prompts share everything up to their
+# last ':' or '.' (instructions, context), so that prefix names a --prompt-cache
+# file holding its KV state: a follow-up prompt with the same prefix only
+# prefills its new tail. Sets PREFIX_CACHE (empty when the prefix is too short
+# to bother), PREFIX_CACHED (true when this device already holds it) and
+# PROMPT_CACHE_ARGS for llama-cli.
+mkdir -p "$PROMPT_CACHE_DIR"
+prefix_cache_file() {
+    PREFIX="${1%[:.]*}"
+    PREFIX_CACHE=""
+    PREFIX_CACHED=false
+    PROMPT_CACHE_ARGS=""
+    [ ${#PREFIX} -ge $PROMPT_CACHE_MIN_CHARS ] || return 0
+    PREFIX_CACHE="$PROMPT_CACHE_DIR/prefix_$(printf '%s' "$PREFIX" | cksum | tr ' ' '_').bin"
+    [ -s "$PREFIX_CACHE" ] && PREFIX_CACHED=true
+    PROMPT_CACHE_ARGS="--prompt-cache $PREFIX_CACHE"
+}
+# llama-cli rewrites the cache file after its run, so only one run may use a file
+# at a time (bid_listener.sh and orchestrator.sh share the directory).
+# lock_prefix_cache takes it with an atomic mkdir before the run; when another
+# run holds it, this one goes without the cache rather than wait. A lock older
+# than $PROMPT_CACHE_LOCK_MIN minutes belongs to a run that died and is cleared.
+lock_prefix_cache() {
+    [ -n "$PREFIX_CACHE" ] || return 0
+    find "$PROMPT_CACHE_DIR" -name 'prefix_*.lock' -mmin +$PROMPT_CACHE_LOCK_MIN -exec rmdir {} + 2>/dev/null
+    mkdir "$PREFIX_CACHE.lock" 2>/dev/null && return 0
+    log INFO "Prefix cache $PREFIX_CACHE is in use by another run; running without it"
+    PREFIX_CACHE=""
+    PREFIX_CACHED=false
+    PROMPT_CACHE_ARGS=""
+}
+# After a run: release the lock, mark the prefix as recently used and keep the newest $PROMPT_CACHE_MAX files
+touch_prefix_cache() {
+    [ -n "$PREFIX_CACHE" ] && rmdir "$PREFIX_CACHE.lock" 2>/dev/null
+    [ -n "$PREFIX_CACHE" ] && [ -f "$PREFIX_CACHE" ] && touch "$PREFIX_CACHE"
+    ls -t "$PROMPT_CACHE_DIR"/prefix_*.bin 2>/dev/null | tail -n +$((PROMPT_CACHE_MAX + 1)) | while read -r old; do
+        rm -f "$old"
+    done
+}
@@ -13,6 +13,7 @@ SNPE_DIR="/data/local/tmp/snpe-bundle"
 GENIE_DIR="/data/local/tmp/genie-bundle"
 LABELS="$SNPE_DIR/imagenet_slim_labels.txt"
 POSTPROCESS_BIN="$SNPE_DIR/postprocess"   # must be compiled for aarch64 Android
+POSTPROCESS_PY="$SNPE_DIR/snpe_postprocess.py"   # networking/src/snpe_postprocess.py; all results in one pass
 OUTPUT_DIR="$SNPE_DIR/output"
 GENIE_CFG="$GENIE_DIR/genie_config.json"
 
@@ -30,11 +31,23 @@ run_inception() {
         --use_dsp )
 }
 
+# True when python3 and snpe_postprocess.py are both on the device
+have_postprocess_py() {
+    [ -f "$POSTPROCESS_PY" ] && command -v python3 >/dev/null 2>&1
+}
+
 postprocess_all() {
+    if have_postprocess_py; then
+        echo "[agent] Postprocessing $OUTPUT_DIR with $POSTPROCESS_PY" >&2
+        python3 "$POSTPROCESS_PY" "$OUTPUT_DIR" --labels "$LABELS" --format labels && return 0
+        echo "[agent] $POSTPROCESS_PY failed, falling back to $POSTPROCESS_BIN" >&2
+    fi
     idx=0
     labels=""
-    for result_dir in "$OUTPUT_DIR"/Result_*; do
-        rawfile="$result_dir/InceptionV3/Predictions/Reshape_1:0.raw"
+    # Numeric Result_N order and a missing_file entry for a Result_N without
+    # output, so both paths line up with target_raw_list.txt the same way
+    for n in $(ls -d "$OUTPUT_DIR"/Result_* 2>/dev/null | sed 's/.*Result_//' | sort -n); do
+        rawfile="$OUTPUT_DIR/Result_$n/InceptionV3/Predictions/Reshape_1:0.raw"
         echo "[agent] Postprocessing index $idx -> $rawfile" >&2
         if [ ! -f "$rawfile" ]; then
             echo "[agent] MISSING: $rawfile" >&2
@@ -119,6 +132,16 @@ preprocess_and_run() {
 
     NUM_RESULTS=$1  
 
+    # output/ was cleared above, so every result belongs to this run
+    if have_postprocess_py && \
+       pp_lines=$(python3 "$POSTPROCESS_PY" "$OUTPUT_DIR" --labels "$LABELS" --format postprocess); then
+        echo "$pp_lines" | tail -n "$NUM_RESULTS" | while read -r pp_out; do
+            echo "$pp_out"
+            echo "$pp_out" | cut -d' ' -f3- >> combined_labels.txt
+        done
+        return 0
+    fi
+
    # Find the latest Result_* directories by numeric suffix
    latest_results=$(ls -d "$OUTPUT_DIR"/Result_* 2>/dev/null | \
        sed 's/.*Result_//' | sort -n | tail -n "$NUM_RESULTS")